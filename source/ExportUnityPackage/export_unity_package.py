@@ -275,21 +275,33 @@ The json file should have the following format:
 """
 
 import collections
+import concurrent.futures
 import copy
+import errno
+import fnmatch
 import glob
 import gzip
+import hashlib
+import io
 import json
+import operator
 import os
+import pickle
 import platform
 import re
 import shutil
 import stat
+import struct
 import subprocess
 import sys
 import tarfile
 import tempfile
+import threading
+import time
 import traceback
+import tracemalloc
 import zipfile
+import zlib
 from absl import app
 from absl import flags
 from absl import logging
@@ -305,8 +317,24 @@ flags.DEFINE_string("plugins_version", None, "Version of the plugins to "
                     "package.")
 flags.DEFINE_boolean("use_tar", True, "Whether to use the tar command line "
                      "application, when available, to generate archives rather "
-                     "than Python's tarfile module.  NOTE: On macOS tar / gzip "
+                     "than Python's tarfile module.  This only applies to "
+                     "UPM tarballs and .unitypackage archives staged when "
+                     "stream_archives is False.  NOTE: On macOS tar / gzip "
                      "generate Unity compatible but non-reproducible archives.")
+flags.DEFINE_integer("compression_level", None, "gzip compression level "
+                     "(1-9) of generated archives.  If this isn't specified "
+                     "the default level of each compressor is used.")
+flags.DEFINE_integer("compression_threads", 1, "Number of threads used to "
+                     "compress each archive.  If this is greater than 1, "
+                     "blocks of each archive are compressed in parallel.  Set "
+                     "to 0 to use the number of CPUs.")
+flags.DEFINE_boolean("stream_archives", True, "Whether to write .unitypackage "
+                     "archives directly from the source asset files and "
+                     "generated metadata rather than staging a copy of each "
+                     "asset in a temporary directory to archive.  Streamed "
+                     "archives are always written using Python's tarfile "
+                     "module so use_tar is ignored for .unitypackage archives "
+                     "unless this is False.")
 flags.DEFINE_boolean(
     "enforce_semver", True, "Whether to enforce semver (major.minor.patch) for"
     "plugins_version.  This is required to build UPM package.")
@@ -347,18 +375,234 @@ flags.DEFINE_multi_string("additional_file", None,
                           "argument isn't specified, the file will be written "
                           "to the same path as the specified input_filename "
                           "under the output_dir.")
+flags.DEFINE_integer("jobs", 1, "Number of packages to export concurrently. "
+                     "When this is greater than 1 each package of each build "
+                     "configuration is exported by a pool of worker "
+                     "processes.  Set to 0 to use the number of CPUs.")
+flags.DEFINE_string("cache_dir", None, "Directory used to cache exported "
+                    "packages.  When this is set, a package whose inputs "
+                    "(assets, metadata, configuration, GUIDs, timestamp and "
+                    "version of this tool) have not changed since it was last "
+                    "exported is copied from the cache rather than rebuilt.")
+flags.DEFINE_string("export_plan_file", None, "File used to store the export "
+                    "plan compiled from config_file, enabled_sections and "
+                    "plugins_version.  When this file was compiled from the "
+                    "same inputs the resolved project configuration is loaded "
+                    "from it, otherwise the plan is compiled and written to "
+                    "this file.")
+flags.DEFINE_enum(
+    "copy_strategy", "auto",
+    ["auto", "reflink", "copy_file_range", "sendfile", "copy", "hardlink"],
+    "How files are copied.  auto selects the fastest strategy supported by "
+    "the OS and filesystem from reflink (copy on write clone), "
+    "copy_file_range and sendfile (copies performed by the kernel) and copy "
+    "(Python copy).  hardlink links staged assets rather than copying them "
+    "and applies their permissions when they're archived, other files are "
+    "copied using the auto strategy.")
+flags.DEFINE_string("trace_file", None, "Chrome trace JSON file to write the "
+                    "time spent in each phase of the export to.  The file "
+                    "can be viewed with chrome://tracing or "
+                    "https://ui.perfetto.dev.")
+flags.DEFINE_boolean("trace_summary", False, "Whether to log the total time, "
+                     "number of calls and bytes processed by each phase of "
+                     "the export.")
+flags.DEFINE_boolean("trace_memory", False, "Whether to record the peak "
+                     "memory allocated by each phase of the export using "
+                     "tracemalloc.  This slows down the export.")
+flags.DEFINE_boolean("bounded_memory", False, "Whether to limit the memory "
+                     "used to export packages.  Assets are found for each "
+                     "package as it's exported and their metadata is "
+                     "generated as they're archived rather than held for all "
+                     "packages.  This increases the export time of projects "
+                     "where packages include other packages.")
+flags.DEFINE_boolean("plan", False, "Whether to only resolve the contents of "
+                     "each package.  Builds, sections, assets, GUIDs and "
+                     "manifests are resolved and the assets of each output "
+                     "file are written as JSON to plan_output without "
+                     "staging or archiving any files.")
+flags.DEFINE_string("plan_output", None, "File to write the JSON generated "
+                    "by the plan flag to.  If this isn't specified the JSON "
+                    "is written to stdout.")
+flags.DEFINE_boolean("watch", False, "Whether to export packages then "
+                     "watch the assets directories and export packages that "
+                     "reference files that have changed until interrupted.  "
+                     "Packages are exported serially, ignoring the jobs flag, "
+                     "so that cached metadata is reused between exports.")
+flags.DEFINE_float("watch_interval", 1.0, "Interval in seconds between polls "
+                   "of the assets directories for changes when the watch "
+                   "flag is set.")
 flags.DEFINE_spaceseplist(
     "enabled_sections", None,
     ("List of sections to include in the set of packages. "
      "Package specifications that do not specify any sections are always "
      "included."))
 
+
+class ReadOnlyOrderedDict(collections.OrderedDict):
+  """OrderedDict that raises TypeError when it's modified.
+
+  copy.copy() and copy.deepcopy() return mutable OrderedDict instances so that
+  callers can modify copies of read-only data.
+  """
+
+  def __init__(self, items=None):
+    """Initialize the dictionary.
+
+    Args:
+      items: Dictionary or iterable of (key, value) tuples to store.
+    """
+    super(ReadOnlyOrderedDict, self).__init__()
+    for key, value in (items.items() if isinstance(items, dict)
+                       else items or []):
+      collections.OrderedDict.__setitem__(self, key, value)
+
+  def _read_only(self, *unused_args, **unused_kwargs):
+    """Raises TypeError as this dictionary can't be modified.
+
+    Raises:
+      TypeError: Always.
+    """
+    raise TypeError("%s is read-only" % self.__class__.__name__)
+
+  __setitem__ = _read_only
+  __delitem__ = _read_only
+  __ior__ = _read_only
+  clear = _read_only
+  move_to_end = _read_only
+  pop = _read_only
+  popitem = _read_only
+  setdefault = _read_only
+  update = _read_only
+
+  def __repr__(self):
+    """Returns the same representation as an equivalent OrderedDict.
+
+    merge_ordered_dicts() matches dictionaries by their string representation
+    so read-only dictionaries must match their mutable equivalents.
+    """
+    return repr(collections.OrderedDict(self))
+
+  def __reduce__(self):
+    """Pickle as a read-only dictionary."""
+    return (ReadOnlyOrderedDict, (list(self.items()),))
+
+  def __copy__(self):
+    """Returns a mutable shallow copy."""
+    return collections.OrderedDict(self)
+
+  def __deepcopy__(self, memo):
+    """Returns a mutable deep copy."""
+    return collections.OrderedDict([(copy.deepcopy(key, memo),
+                                     copy.deepcopy(value, memo))
+                                    for key, value in self.items()])
+
+
+class ReadOnlyList(list):
+  """List that raises TypeError when it's modified.
+
+  copy.copy() and copy.deepcopy() return mutable lists so that callers can
+  modify copies of read-only data.
+  """
+
+  def _read_only(self, *unused_args, **unused_kwargs):
+    """Raises TypeError as this list can't be modified.
+
+    Raises:
+      TypeError: Always.
+    """
+    raise TypeError("%s is read-only" % self.__class__.__name__)
+
+  __setitem__ = _read_only
+  __delitem__ = _read_only
+  __iadd__ = _read_only
+  __imul__ = _read_only
+  append = _read_only
+  clear = _read_only
+  extend = _read_only
+  insert = _read_only
+  pop = _read_only
+  remove = _read_only
+  reverse = _read_only
+  sort = _read_only
+
+  def __reduce__(self):
+    """Pickle as a read-only list."""
+    return (ReadOnlyList, (list(self),))
+
+  def __copy__(self):
+    """Returns a mutable shallow copy."""
+    return list(self)
+
+  def __deepcopy__(self, memo):
+    """Returns a mutable deep copy."""
+    return [copy.deepcopy(item, memo) for item in self]
+
+
+def freeze(value):
+  """Convert a tree of dictionaries and lists to read-only containers.
+
+  Args:
+    value: Value to convert.
+
+  Returns:
+    ReadOnlyOrderedDict if value is a dictionary, ReadOnlyList if value is a
+    list, value otherwise.
+  """
+  if isinstance(value, (ReadOnlyOrderedDict, ReadOnlyList)):
+    return value
+  if isinstance(value, dict):
+    return ReadOnlyOrderedDict([(key, freeze(item))
+                                for key, item in value.items()])
+  if isinstance(value, list):
+    return ReadOnlyList([freeze(item) for item in value])
+  return value
+
+
+def thaw(value):
+  """Get a mutable shallow copy of a read-only container.
+
+  Args:
+    value: Value to convert.
+
+  Returns:
+    OrderedDict if value is a ReadOnlyOrderedDict, list if value is a
+    ReadOnlyList, value otherwise.
+  """
+  if isinstance(value, (ReadOnlyOrderedDict, ReadOnlyList)):
+    return copy.copy(value)
+  return value
+
+
+def thaw_node(tree_node, key):
+  """Replace a read-only node in a tree with a mutable copy.
+
+  This is used to modify trees that share read-only nodes (copy-on-write), each
+  node on the path to a modified node is thawed so that the shared node is
+  never modified.
+
+  Args:
+    tree_node: Mutable dictionary or list that contains the node.
+    key: Key or index of the node in tree_node.
+
+  Returns:
+    Mutable node stored in tree_node.
+  """
+  value = tree_node[key]
+  mutable_value = thaw(value)
+  if mutable_value is not value:
+    tree_node[key] = mutable_value
+  return mutable_value
+
+
+# Metadata templates are read-only so that they can be shared by the metadata
+# of each asset, see thaw_node().
+#
 # Default metadata for all Unity 5.3+ assets.
-DEFAULT_METADATA_TEMPLATE = collections.OrderedDict(
+DEFAULT_METADATA_TEMPLATE = freeze(collections.OrderedDict(
     [("fileFormatVersion", 2),
      ("guid", None),  # A unique GUID *must* be specified for all assets.
      ("labels", None),  # Can optionally specific a list of asset label strings.
-     ("timeCreated", 0)])
+     ("timeCreated", 0)]))
 
 # A minimal set of Importer meta data.
 #
@@ -368,13 +612,13 @@ DEFAULT_METADATA_TEMPLATE = collections.OrderedDict(
 DEFAULT_IMPORTER_DATA = [("userData", None),
                          ("assetBundleName", None),
                          ("assetBundleVariant", None)]
-DEFAULT_IMPORTER_METADATA_TEMPLATE = collections.OrderedDict(
-    [("DefaultImporter", collections.OrderedDict(DEFAULT_IMPORTER_DATA))])
+DEFAULT_IMPORTER_METADATA_TEMPLATE = freeze(collections.OrderedDict(
+    [("DefaultImporter", collections.OrderedDict(DEFAULT_IMPORTER_DATA))]))
 
-DEFAULT_FOLDER_METADATA_TEMPLATE = collections.OrderedDict([
+DEFAULT_FOLDER_METADATA_TEMPLATE = freeze(collections.OrderedDict([
     ("folderAsset", True),
     ("DefaultImporter", collections.OrderedDict(DEFAULT_IMPORTER_DATA))
-])
+]))
 
 PLATFORM_SETTINGS_DISABLED = [("enabled", 0)]
 DEFAULT_PLATFORM_SETTINGS_EMPTY_DISABLED = collections.OrderedDict(
@@ -411,7 +655,7 @@ DEFAULT_PLATFORM_SETTINGS_DISABLED_TVOS = collections.OrderedDict(
         [("CompileFlags", None),
          ("FrameworkDependencies", None)]))])
 
-PLUGIN_IMPORTER_METADATA_TEMPLATE = collections.OrderedDict(
+PLUGIN_IMPORTER_METADATA_TEMPLATE = freeze(collections.OrderedDict(
     [("PluginImporter", collections.OrderedDict(
         [("serializedVersion", 1),
          ("iconMap", {}),
@@ -452,7 +696,7 @@ PLUGIN_IMPORTER_METADATA_TEMPLATE = collections.OrderedDict(
                   DEFAULT_PLATFORM_SETTINGS_DISABLED_TVOS)),
              ]))
         ] + DEFAULT_IMPORTER_DATA))
-    ])
+    ]))
 
 # Map of platforms to targets.
 # Unity 5.6+ metadata requires a tuple of (target, name) for each platform.
@@ -521,6 +765,9 @@ DESKTOP_PLATFORMS_BY_CPU = {
 # controlling platform settings.  This constant matches the keys in entries of
 # the PluginImporter.platformData list.
 UNITY_5_6_PLATFORM_DATA_KEYS = ["first", "second"]
+# Set of UNITY_5_6_PLATFORM_DATA_KEYS used to check the keys of entries.
+UNITY_5_6_PLATFORM_DATA_KEY_SET = frozenset(
+    UNITY_5_6_PLATFORM_DATA_KEYS)
 
 # Prefix for labels that are applied to files managed by the VersionHandler
 # module.
@@ -566,6 +813,21 @@ ASSET_METADATA_FILE_EXTENSION = ".meta"
 # Valid version for asset package in form of major.minor.patch(-preview)
 VALID_VERSION_RE = re.compile(r"^[0-9]+\.[0-9]+\.[0-9]+(-preview)?$")
 
+# Permissions of directories, asset files and generated files written to
+# archives by PackageConfiguration.write_archive().
+ARCHIVE_DIRECTORY_MODE = 0o755
+ARCHIVE_ASSET_FILE_MODE = (stat.S_IRWXU | stat.S_IRWXG | stat.S_IROTH |
+                           stat.S_IXOTH)
+ARCHIVE_GENERATED_FILE_MODE = 0o644
+
+# Size of each block of uncompressed data compressed by a ParallelGzipWriter.
+PARALLEL_GZIP_BLOCK_SIZE = 128 * 1024
+# Size of the deflate window, the amount of data from the previous block used
+# to prime the compressor of each block.
+DEFLATE_WINDOW_SIZE = 32 * 1024
+# Default compression level of archives compressed by Python.
+DEFAULT_COMPRESSION_LEVEL = 9
+
 # Documentation folder and filename for UPM package.
 UPM_DOCUMENTATION_DIRECTORY = "Documentation~"
 UPM_DOCUMENTATION_FILENAME = "index.md"
@@ -590,6 +852,390 @@ def posix_path(path):
   return path.replace('\\', '/')
 
 
+def get_peak_rss():
+  """Get the peak resident set size of this process.
+
+  Returns:
+    Peak resident set size in bytes or None if it's not available.
+  """
+  try:
+    with open("/proc/self/status", "rt") as status:
+      for line in status:
+        if line.startswith("VmHWM:"):
+          return int(line.split()[1]) * 1024
+  except (IOError, OSError):
+    pass
+  try:
+    import resource  # pylint: disable=g-import-not-at-top
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes elsewhere.
+    return max_rss if platform.system() == "Darwin" else max_rss * 1024
+  except ImportError:
+    return None
+
+
+class TraceSpan(object):
+  """Records the duration of a phase of an export when used as a context.
+
+  Attributes:
+    _tracer: Tracer the span is recorded by.
+    _name: Name of the phase.
+    _attributes: Dictionary of attributes of the span, e.g the package being
+      exported.
+    _start_time: Time in seconds the span started, see time.perf_counter().
+    _start_memory: Memory allocated when the span started if the tracer
+      records memory.
+    _peak_memory: Peak memory allocated by spans nested in this span and
+      before the peak was last reset, if the tracer records memory and
+      tracemalloc can reset the peak.
+  """
+
+  __slots__ = ("_tracer", "_name", "_attributes", "_start_time",
+               "_start_memory", "_peak_memory")
+
+  def __init__(self, tracer, name, attributes):
+    """Initialize the span.
+
+    Args:
+      tracer: Tracer the span is recorded by.
+      name: Name of the phase.
+      attributes: Dictionary of attributes of the span.
+    """
+    self._tracer = tracer
+    self._name = name
+    self._attributes = attributes
+    self._start_time = None
+    self._start_memory = 0
+    self._peak_memory = 0
+
+  def __enter__(self):
+    """Start the span.
+
+    Returns:
+      This instance.
+    """
+    if self._tracer.trace_memory:
+      # The traced peak is reset when each span starts and ends, so fold the
+      # peak since the last reset into the enclosing span.
+      spans = self._tracer.memory_spans
+      current_memory, peak_memory = tracemalloc.get_traced_memory()
+      if spans:
+        spans[-1]._peak_memory = max(spans[-1]._peak_memory, peak_memory)
+      if Tracer.PEAK_MEMORY_SUPPORTED:
+        tracemalloc.reset_peak()
+      self._start_memory = current_memory
+      self._peak_memory = current_memory
+      spans.append(self)
+    self._start_time = time.perf_counter()
+    return self
+
+  def __exit__(self, unused_type, unused_value, unused_traceback):
+    """Record the span with the tracer."""
+    end_time = time.perf_counter()
+    if self._tracer.trace_memory:
+      spans = self._tracer.memory_spans
+      if spans and spans[-1] is self:
+        spans.pop()
+      current_memory, peak_memory = tracemalloc.get_traced_memory()
+      peak_memory = max(self._peak_memory, peak_memory)
+      if spans:
+        spans[-1]._peak_memory = max(spans[-1]._peak_memory, peak_memory)
+      if Tracer.PEAK_MEMORY_SUPPORTED:
+        tracemalloc.reset_peak()
+        # Without resetting the peak it's the peak of the process since
+        # tracing started rather than the peak of the span, so omit it.
+        self._attributes["memory_peak"] = peak_memory
+      self._attributes["memory_delta"] = current_memory - self._start_memory
+      self._attributes["memory_current"] = current_memory
+    self._tracer.add_event(self._name, self._start_time, end_time,
+                           self._attributes)
+
+  def set_attribute(self, name, value):
+    """Set an attribute of the span.
+
+    Args:
+      name: Name of the attribute.
+      value: Value of the attribute.
+    """
+    self._attributes[name] = value
+
+  def add_bytes(self, size):
+    """Add to the number of bytes processed by the span.
+
+    Args:
+      size: Number of bytes to add.
+    """
+    self._attributes["bytes"] = self._attributes.get("bytes", 0) + size
+
+
+class NullTraceSpan(object):
+  """Span returned by a disabled Tracer which records nothing."""
+
+  __slots__ = ()
+
+  def __enter__(self):
+    """Returns this instance."""
+    return self
+
+  def __exit__(self, unused_type, unused_value, unused_traceback):
+    """Does nothing."""
+    pass
+
+  def set_attribute(self, unused_name, unused_value):
+    """Does nothing."""
+    pass
+
+  def add_bytes(self, unused_size):
+    """Does nothing."""
+    pass
+
+
+class Tracer(object):
+  """Records the time spent in each phase of an export.
+
+  Spans are only recorded when the tracer is enabled, a disabled tracer
+  returns the same NullTraceSpan from each span() call so that instrumented
+  code is not slowed down.  Recorded spans can be written to a Chrome trace
+  file, which can be viewed with chrome://tracing or https://ui.perfetto.dev,
+  and summarized per phase.
+
+  When memory is traced each span records the peak and change in memory
+  allocated by Python (see tracemalloc) while the span was active.  The
+  tracemalloc peak is shared by all threads so the peak of spans that run
+  concurrently include allocations of other threads.  Peaks are only recorded
+  if tracemalloc can reset the peak (Python 3.9 or later).
+
+  Attributes:
+    _enabled: Whether spans are recorded.
+    _trace_memory: Whether the memory allocated by spans is recorded.
+    _started_tracemalloc: Whether tracemalloc was started by this tracer.
+    _memory_spans: Thread local storage of the stack of active spans that
+      record memory.
+    _events: List of (name, start_time, end_time, pid, tid, attributes)
+      tuples for each recorded span.
+    _lock: Lock that guards _events.
+    _start_time: Time in seconds the tracer was enabled, see
+      time.perf_counter().
+  """
+
+  # Span returned when the tracer is disabled.
+  NULL_SPAN = NullTraceSpan()
+  # Whether the peak memory of each span can be recorded, which requires
+  # tracemalloc.reset_peak().
+  PEAK_MEMORY_SUPPORTED = hasattr(tracemalloc, "reset_peak")
+
+  def __init__(self):
+    """Initialize the tracer."""
+    self._enabled = False
+    self._trace_memory = False
+    self._started_tracemalloc = False
+    self._memory_spans = threading.local()
+    self._events = []
+    self._lock = threading.Lock()
+    self._start_time = time.perf_counter()
+
+  @property
+  def enabled(self):
+    """Get whether spans are recorded.
+
+    Returns:
+      True if spans are recorded, False otherwise.
+    """
+    return self._enabled
+
+  @property
+  def trace_memory(self):
+    """Get whether the memory allocated by spans is recorded.
+
+    Returns:
+      True if memory is recorded, False otherwise.
+    """
+    return self._trace_memory
+
+  @property
+  def memory_spans(self):
+    """Get the stack of active spans that record memory in this thread.
+
+    Returns:
+      List of TraceSpan instances.
+    """
+    spans = getattr(self._memory_spans, "spans", None)
+    if spans is None:
+      spans = []
+      self._memory_spans.spans = spans
+    return spans
+
+  def enable(self, trace_memory=False):
+    """Discard recorded spans and start recording spans.
+
+    Args:
+      trace_memory: Whether to record the memory allocated by each span.
+        tracemalloc is started if it isn't already tracing.
+    """
+    with self._lock:
+      self._events = []
+      self._start_time = time.perf_counter()
+      self._enabled = True
+    if trace_memory and not tracemalloc.is_tracing():
+      tracemalloc.start()
+      self._started_tracemalloc = True
+    self._trace_memory = trace_memory
+
+  def disable(self):
+    """Stop recording spans."""
+    self._enabled = False
+    self._trace_memory = False
+    if self._started_tracemalloc:
+      tracemalloc.stop()
+      self._started_tracemalloc = False
+
+  def span(self, name, **attributes):
+    """Create a span to record the duration of a phase.
+
+    For example:
+      with TRACER.span("create_archive", package="foo") as span:
+        ...
+        span.add_bytes(archive_size)
+
+    Args:
+      name: Name of the phase.
+      **attributes: Attributes of the span, e.g the package being exported.
+        The "bytes" attribute is the number of bytes processed by the span.
+
+    Returns:
+      TraceSpan context manager if the tracer is enabled, NullTraceSpan
+      otherwise.
+    """
+    if not self._enabled:
+      return Tracer.NULL_SPAN
+    return TraceSpan(self, name, attributes)
+
+  def add_event(self, name, start_time, end_time, attributes, pid=None,
+                tid=None):
+    """Record a span.
+
+    Args:
+      name: Name of the phase.
+      start_time: Time in seconds the span started, see time.perf_counter().
+      end_time: Time in seconds the span ended.
+      attributes: Dictionary of attributes of the span.
+      pid: ID of the process that recorded the span, defaults to this process.
+      tid: ID of the thread that recorded the span, defaults to this thread.
+    """
+    event = (name, start_time, end_time,
+             os.getpid() if pid is None else pid,
+             threading.get_ident() if tid is None else tid, attributes)
+    with self._lock:
+      self._events.append(event)
+
+  def take_events(self):
+    """Get and discard the recorded spans.
+
+    This is used to transfer spans recorded by a worker process to the parent
+    process.  time.perf_counter() uses a system-wide clock so the times of
+    spans recorded by different processes are comparable.
+
+    Returns:
+      List of (name, start_time, end_time, pid, tid, attributes) tuples.
+    """
+    with self._lock:
+      events = self._events
+      self._events = []
+    return events
+
+  def add_events(self, events):
+    """Record spans returned by take_events().
+
+    Args:
+      events: List of (name, start_time, end_time, pid, tid, attributes)
+        tuples.
+    """
+    with self._lock:
+      self._events.extend(events)
+
+  def summary(self):
+    """Summarize the recorded spans by phase.
+
+    Returns:
+      OrderedDict of (total_seconds, calls, bytes, peak_memory) tuples indexed
+      by phase name in the order each phase was first recorded.  peak_memory
+      is the largest amount of memory allocated during a call of the phase or
+      0 if memory wasn't recorded or peaks aren't supported, see
+      PEAK_MEMORY_SUPPORTED.
+    """
+    summary = collections.OrderedDict()
+    with self._lock:
+      events = sorted(self._events, key=operator.itemgetter(1))
+    for name, start_time, end_time, _, _, attributes in events:
+      total_seconds, calls, total_bytes, peak_memory = summary.get(
+          name, (0.0, 0, 0, 0))
+      summary[name] = (total_seconds + end_time - start_time, calls + 1,
+                       total_bytes + attributes.get("bytes", 0),
+                       max(peak_memory, attributes.get("memory_peak", 0)))
+    return summary
+
+  def format_summary(self):
+    """Format the summary of recorded spans as a table.
+
+    The total time and peak memory of a phase includes phases nested within
+    it.
+
+    Returns:
+      String with a line for each phase followed by the peak resident set
+      size of this process.
+    """
+    lines = ["%-24s %10s %8s %14s %10s" % ("phase", "seconds", "calls",
+                                           "bytes", "peak_mb")]
+    for name, (total_seconds, calls, total_bytes, peak_memory) in (
+        self.summary().items()):
+      lines.append("%-24s %10.3f %8d %14d %10s" % (
+          name, total_seconds, calls, total_bytes,
+          "%.1f" % (peak_memory / (1024.0 * 1024.0)) if peak_memory else "-"))
+    peak_rss = get_peak_rss()
+    if peak_rss is not None:
+      lines.append("peak RSS %.1f MB" % (peak_rss / (1024.0 * 1024.0)))
+    return "\n".join(lines)
+
+  def write_chrome_trace(self, filename):
+    """Write the recorded spans to a Chrome trace file.
+
+    Each span is written as a complete ("X") event in the Trace Event Format
+    with the span's attributes as the event's arguments.
+
+    Args:
+      filename: JSON file to write.
+    """
+    with self._lock:
+      events = sorted(self._events, key=operator.itemgetter(1))
+    trace_events = []
+    for name, start_time, end_time, pid, tid, attributes in events:
+      trace_events.append(collections.OrderedDict([
+          ("name", name),
+          ("cat", "export"),
+          ("ph", "X"),
+          ("ts", round((start_time - self._start_time) * 1000000, 3)),
+          ("dur", round((end_time - start_time) * 1000000, 3)),
+          ("pid", pid),
+          ("tid", tid),
+          ("args", attributes)]))
+      # Plot the memory allocated by each process as a counter.
+      if "memory_current" in attributes:
+        trace_events.append(collections.OrderedDict([
+            ("name", "memory"),
+            ("ph", "C"),
+            ("ts", round((end_time - self._start_time) * 1000000, 3)),
+            ("pid", pid),
+            ("args", {"allocated": attributes["memory_current"]})]))
+    with open(filename, "wt", encoding="utf-8") as trace_file:
+      json.dump(collections.OrderedDict([("traceEvents", trace_events),
+                                         ("displayTimeUnit", "ms")]),
+                trace_file, indent=1, default=str)
+
+
+# Records the time spent in each phase of an export when tracing is enabled.
+TRACER = Tracer()
+
+
 class MissingGuidsError(Exception):
   """Raised when GUIDs are missing for input files in export_package().
 
@@ -606,6 +1252,10 @@ class MissingGuidsError(Exception):
     self.missing_guid_paths = sorted(list(set(missing_guid_paths)))
     super(MissingGuidsError, self).__init__(self.__str__())
 
+  def __reduce__(self):
+    """Pickle the missing paths so this can be raised from a worker process."""
+    return (MissingGuidsError, (self.missing_guid_paths,))
+
   def __str__(self):
     """Retrieves a description of this error."""
     guids_file = FLAGS.guids_file if FLAGS.guids_file else ""
@@ -632,6 +1282,10 @@ class DuplicateGuidsError(Exception):
     self.paths_by_guid = paths_by_guid
     super(DuplicateGuidsError, self).__init__(self.__str__())
 
+  def __reduce__(self):
+    """Pickle the GUID map so this can be raised from a worker process."""
+    return (DuplicateGuidsError, (self.paths_by_guid,))
+
   def __str__(self):
     """Retrieves a description of this error."""
     return ("Found duplicate GUIDs that map to multiple paths.\n%s" %
@@ -672,11 +1326,51 @@ class DuplicateGuidsChecker(object):
       raise DuplicateGuidsError(conflicting_paths_by_guid)
 
 
+def tree_fingerprint(value):
+  """Calculate a stable hash of a tree of dictionaries, lists and scalars.
+
+  The order of dictionary items and the type of each scalar are part of the
+  hash, so trees with the same fingerprint compare equal.  Trees that compare
+  equal can have different fingerprints (e.g 1 == True) so differing
+  fingerprints should be confirmed by comparing the trees.
+
+  Args:
+    value: Tree to hash.
+
+  Returns:
+    Hex digest string.
+  """
+
+  def normalize(node):
+    """Convert a tree to a JSON serializable structure tagged with types.
+
+    Args:
+      node: Node of the tree to convert.
+
+    Returns:
+      List that describes the node.
+    """
+    if isinstance(node, dict):
+      return ["d", [[normalize(key), normalize(item)]
+                    for key, item in node.items()]]
+    if isinstance(node, (list, tuple)):
+      return ["l", [normalize(item) for item in node]]
+    return [node.__class__.__name__, repr(node)]
+
+  return hashlib.sha256(json.dumps(
+      normalize(value), separators=(",", ":")).encode("utf8")).hexdigest()
+
+
 class YamlSerializer(object):
-  """Loads and saves YAML files preserving the order of elements."""
+  """Loads and saves YAML files preserving the order of elements.
+
+  Attributes:
+    _loader: Loader class used to parse YAML.
+    _dumper: Dumper class used to generate YAML.
+  """
 
-  class OrderedLoader(yaml.Loader):
-    """Overrides the default YAML loader to construct nodes as OrderedDict."""
+  class OrderedLoaderMixin(object):
+    """Constructs mapping nodes as OrderedDict when mixed into a Loader."""
     _initialized = False
 
     @classmethod
@@ -701,8 +1395,8 @@ class YamlSerializer(object):
       loader.flatten_mapping(node)
       return collections.OrderedDict(loader.construct_pairs(node))
 
-  class OrderedDumper(yaml.Dumper):
-    """Overrides the default YAML serializer.
+  class OrderedDumperMixin(object):
+    """Overrides the default YAML serializer when mixed into a Dumper.
 
     By default maps items to the OrderedDict structure, None to an empty
     strings and disables aliases.
@@ -715,6 +1409,8 @@ class YamlSerializer(object):
       if not cls._initialized:
         # By default map data structures to OrderedDict.
         cls.add_representer(collections.OrderedDict, cls._represent_map)
+        cls.add_representer(ReadOnlyOrderedDict, cls._represent_map)
+        cls.add_representer(ReadOnlyList, cls._represent_list)
         # By default map None to empty strings.
         cls.add_representer(type(None), cls._represent_none)
         # By default map unicode to strings.
@@ -748,6 +1444,19 @@ class YamlSerializer(object):
       return dumper.represent_mapping(
           yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG, data.items())
 
+    @staticmethod
+    def _represent_list(dumper, data):
+      """Return a default representer for a list.
+
+      Args:
+         dumper: Generates the sequence.
+         data: Data to generate a representor for.
+
+      Returns:
+         The default sequence for a list.
+      """
+      return dumper.represent_list(data)
+
     @staticmethod
     def _represent_none(dumper, unused_data):
       """Return a representer for None that emits an empty string.
@@ -769,11 +1478,79 @@ class YamlSerializer(object):
       """
       return True
 
-  def __init__(self, *unused_argv):
-    """Create the serializer."""
-    YamlSerializer.OrderedLoader.initialize()
+  class OrderedLoader(OrderedLoaderMixin, yaml.Loader):
+    """Pure Python loader that constructs nodes as OrderedDict."""
+    pass
+
+  class OrderedDumper(OrderedDumperMixin, yaml.Dumper):
+    """Pure Python dumper for OrderedDict, see OrderedDumperMixin."""
+    pass
+
+  # libyaml backed loader and dumper, if the yaml module was built with it.
+  if getattr(yaml, "__with_libyaml__", False):
+
+    class OrderedCLoader(OrderedLoaderMixin, yaml.CLoader):
+      """libyaml loader that constructs nodes as OrderedDict."""
+      pass
+
+    class OrderedCDumper(OrderedDumperMixin, yaml.CDumper):
+      """libyaml dumper for OrderedDict, see OrderedDumperMixin."""
+      pass
+
+  else:
+    OrderedCLoader = None
+    OrderedCDumper = None
+
+  def __init__(self, use_libyaml=True):
+    """Create the serializer.
+
+    Args:
+      use_libyaml: Whether to use libyaml to load and dump YAML.  If libyaml
+        isn't available the pure Python implementation is used.
+    """
+    if use_libyaml and YamlSerializer.OrderedCLoader:
+      self._loader = YamlSerializer.OrderedCLoader
+      self._dumper = YamlSerializer.OrderedCDumper
+    else:
+      self._loader = YamlSerializer.OrderedLoader
+      self._dumper = YamlSerializer.OrderedDumper
+    self._loader.initialize()
+    self._dumper.initialize()
+    # dump() uses the pure Python dumper for strings that aren't printable
+    # ASCII even when libyaml is selected, so it's always initialized.
     YamlSerializer.OrderedDumper.initialize()
 
+  @staticmethod
+  def _contains_only_printable_ascii(data):
+    """Determine whether all strings in a tree are printable ASCII.
+
+    Args:
+      data: Tree of dictionaries, lists and scalars to search.
+
+    Returns:
+      True if all strings in the tree only contain printable ASCII characters,
+      False otherwise.
+    """
+    if isinstance(data, str):
+      return data.isascii() and data.isprintable()
+    if isinstance(data, dict):
+      return all(YamlSerializer._contains_only_printable_ascii(key) and
+                 YamlSerializer._contains_only_printable_ascii(value)
+                 for key, value in data.items())
+    if isinstance(data, list):
+      return all(YamlSerializer._contains_only_printable_ascii(item)
+                 for item in data)
+    return True
+
+  @property
+  def uses_libyaml(self):
+    """Get whether this serializer uses libyaml.
+
+    Returns:
+      True if libyaml is used, False otherwise.
+    """
+    return self._loader is YamlSerializer.OrderedCLoader
+
   def load(self, yaml_string):
     """Load yaml from a string into this class.
 
@@ -783,7 +1560,7 @@ class YamlSerializer(object):
     Returns:
       OrderedDict loaded from YAML.
     """
-    return yaml.load(yaml_string, Loader=YamlSerializer.OrderedLoader)
+    return yaml.load(yaml_string, Loader=self._loader)
 
   def dump(self, data):
     """Generate a YAML string from the data in this class.
@@ -794,8 +1571,151 @@ class YamlSerializer(object):
     Returns:
       YAML string representation of this class.
     """
-    return yaml.dump(data, Dumper=YamlSerializer.OrderedDumper,
-                     default_flow_style=False)
+    dumper = self._dumper
+    # libyaml folds long double quoted strings differently to the pure Python
+    # emitter, so use the pure Python emitter for strings that require double
+    # quotes (i.e contain control or non-ASCII characters) to generate
+    # identical output.
+    if (dumper is not YamlSerializer.OrderedDumper and
+        not YamlSerializer._contains_only_printable_ascii(data)):
+      dumper = YamlSerializer.OrderedDumper
+    return yaml.dump(data, Dumper=dumper, default_flow_style=False)
+
+
+# Serializer used to read and write asset metadata.
+YAML_SERIALIZER = YamlSerializer()
+
+# Strings that can be emitted as plain YAML scalars by dump_simple_yaml() if
+# they aren't resolved as another type (e.g "yes" is a boolean).  Strings
+# that start with a document marker ("---" or "...") are quoted.
+SIMPLE_YAML_STRING_RE = re.compile(
+    r"^(?!---|\.\.\.)[A-Za-z0-9_./][A-Za-z0-9_./\- ]*$")
+# Column at which YamlSerializer folds plain scalars containing spaces.
+YAML_LINE_WIDTH = 80
+
+
+def dump_simple_yaml(data):
+  """Generate YAML for a tree of common Unity metadata nodes.
+
+  Generates the same output as YamlSerializer.dump() without the overhead of a
+  YAML representer, serializer and emitter for trees that only contain
+  dictionaries, lists of dictionaries or scalars, integers, booleans, None and
+  strings that are emitted as single line plain scalars, which covers
+  metadata generated from the metadata templates.
+
+  Args:
+    data: Dictionary to serialize.
+
+  Returns:
+    YAML string or None if the tree contains nodes that must be serialized
+    with YamlSerializer.
+  """
+
+  class UnsupportedNodeError(Exception):
+    """Raised when a node can't be emitted."""
+    pass
+
+  resolver = yaml.resolver.Resolver()
+
+  def format_scalar(value, column, is_key=False):
+    """Format a scalar value.
+
+    Args:
+      value: Value to format.
+      column: Column the value is written at.
+      is_key: Whether the value is a mapping key.
+
+    Returns:
+      Formatted value.
+
+    Raises:
+      UnsupportedNodeError: If the value can't be emitted.
+    """
+    if isinstance(value, bool):
+      return "true" if value else "false"
+    if isinstance(value, int):
+      return str(value)
+    if isinstance(value, str):
+      if (SIMPLE_YAML_STRING_RE.match(value) and not value.endswith(" ") and
+          "  " not in value and
+          resolver.resolve(yaml.ScalarNode, value, (True, False)) ==
+          resolver.DEFAULT_SCALAR_TAG):
+        # Long plain scalars are folded at spaces and long keys are emitted as
+        # complex keys.
+        if is_key and len(value) < 128:
+          return value
+        if not is_key and (" " not in value or
+                           column + len(value) <= YAML_LINE_WIDTH):
+          return value
+    raise UnsupportedNodeError()
+
+  def emit_mapping(mapping, indent, lines, first_line_prefix=None):
+    """Emit a block mapping.
+
+    Args:
+      mapping: Dictionary to emit.
+      indent: Indentation of the mapping's keys.
+      lines: List of lines to add to.
+      first_line_prefix: Prefix of the line containing the first key.  If this
+        is None the first key is indented like the other keys.
+
+    Raises:
+      UnsupportedNodeError: If the mapping contains nodes that can't be
+        emitted.
+    """
+    for key, value in mapping.items():
+      prefix = (first_line_prefix if first_line_prefix is not None
+                else " " * indent)
+      first_line_prefix = None
+      line = prefix + format_scalar(key, len(prefix), is_key=True) + ":"
+      if isinstance(value, dict):
+        if value:
+          lines.append(line)
+          emit_mapping(value, indent + 2, lines)
+        else:
+          lines.append(line + " {}")
+      elif isinstance(value, list):
+        if value:
+          lines.append(line)
+          # Sequences in mappings are not indented.
+          emit_sequence(value, indent, lines)
+        else:
+          lines.append(line + " []")
+      elif value is None:
+        lines.append(line)
+      else:
+        lines.append(line + " " + format_scalar(value, len(line) + 1))
+
+  def emit_sequence(sequence, indent, lines):
+    """Emit a block sequence.
+
+    Args:
+      sequence: List to emit.
+      indent: Indentation of the sequence's items.
+      lines: List of lines to add to.
+
+    Raises:
+      UnsupportedNodeError: If the sequence contains nodes that can't be
+        emitted.
+    """
+    prefix = " " * indent + "- "
+    for item in sequence:
+      if isinstance(item, dict) and item:
+        emit_mapping(item, indent + 2, lines, first_line_prefix=prefix)
+      elif isinstance(item, (dict, list)) or item is None:
+        raise UnsupportedNodeError()
+      else:
+        lines.append(prefix + format_scalar(item, len(prefix)))
+
+  if not isinstance(data, dict) or not data:
+    return None
+  lines = []
+  try:
+    emit_mapping(data, 0, lines)
+  except UnsupportedNodeError:
+    return None
+  lines.append("")
+  return "\n".join(lines)
 
 
 def merge_ordered_dicts(merge_into, merge_from):
@@ -814,6 +1734,9 @@ def merge_ordered_dicts(merge_into, merge_from):
   In all other cases, replace the node in merge_info with the value from
   merge_from.
 
+  Read-only nodes of merge_into are replaced with mutable copies before they're
+  modified, so read-only data referenced by merge_into is never changed.
+
   Args:
     merge_into: OrderedDict instance to merge values into.
     merge_from: OrderedDict instance to merge values from.
@@ -827,7 +1750,7 @@ def merge_ordered_dicts(merge_into, merge_from):
 
     Args:
       list_to_query: List to query.
-      expected_keys: Keys to search for in each dictionary in the list.
+      expected_keys: Set of keys to search for in each dictionary in the list.
 
     Returns:
       True if the list contains dictionaries with exactly the specified
@@ -838,11 +1761,37 @@ def merge_ordered_dicts(merge_into, merge_from):
       list_matches = list_to_query and True
       for item in list_to_query:
         if not (issubclass(item.__class__, dict) and
-                sorted(item.keys()) == expected_keys):
+                item.keys() == expected_keys):
           list_matches = False
           break
     return list_matches
 
+  def merge_platform_data_lists(merge_into_list, merge_from_list):
+    """Merge lists of platform dictionaries using the "first" item as the key.
+
+    Each dictionary in merge_from_list is merged into the first dictionary in
+    merge_into_list with the same "first" value, or appended to
+    merge_into_list if no dictionary matches.
+
+    Args:
+      merge_into_list: Mutable list to merge dictionaries into.
+      merge_from_list: List of dictionaries to merge.
+    """
+    # Index dictionaries by the string representation of the "first" item.
+    index_by_key = {}
+    for index, merge_into_list_item in enumerate(merge_into_list):
+      index_by_key.setdefault(str(merge_into_list_item["first"]), index)
+    for merge_from_list_item in merge_from_list:
+      key = str(merge_from_list_item["first"])
+      index = index_by_key.get(key)
+      if index is None:
+        # If the dictionary wasn't merged, add it to the list.
+        index_by_key[key] = len(merge_into_list)
+        merge_into_list.append(merge_from_list_item)
+      else:
+        merge_ordered_dicts(thaw_node(merge_into_list, index),
+                            merge_from_list_item)
+
   if (issubclass(merge_from.__class__, dict) and
       issubclass(merge_into.__class__, dict)):
     for merge_from_key, merge_from_value in merge_from.items():
@@ -850,25 +1799,17 @@ def merge_ordered_dicts(merge_into, merge_from):
       if merge_into_value is not None:
         if (issubclass(merge_into_value.__class__, dict) and
             issubclass(merge_from_value.__class__, dict)):
+          merge_into_value = thaw(merge_into_value)
+          merge_into[merge_from_key] = merge_into_value
           merge_ordered_dicts(merge_into_value, merge_from_value)
           continue
         if (list_contains_dictionaries_with_keys(
-            merge_into_value, UNITY_5_6_PLATFORM_DATA_KEYS) and
+            merge_into_value, UNITY_5_6_PLATFORM_DATA_KEY_SET) and
             list_contains_dictionaries_with_keys(
-                merge_from_value, UNITY_5_6_PLATFORM_DATA_KEYS)):
-          for merge_from_list_item in merge_from_value:
-            # Try finding the dictionary to merge based upon the hash of the
-            # "first" item value.
-            merged = None
-            key = str(merge_from_list_item["first"])
-            for merge_into_list_item in merge_into_value:
-              if str(merge_into_list_item["first"]) == key:
-                merge_ordered_dicts(merge_into_list_item, merge_from_list_item)
-                merged = merge_into_list_item
-                break
-            # If the dictionary wasn't merged, add it to the list.
-            if not merged:
-              merge_into_value.append(merge_from_list_item)
+                merge_from_value, UNITY_5_6_PLATFORM_DATA_KEY_SET)):
+          merge_into_value = thaw(merge_into_value)
+          merge_into[merge_from_key] = merge_into_value
+          merge_platform_data_lists(merge_into_value, merge_from_value)
           continue
       merge_into[merge_from_key] = merge_from_value
   return merge_into
@@ -995,6 +1936,15 @@ class GuidDatabase(object):
             if filename not in guid_map:
               self.add_guid(filename, guids_by_filename[filename])
 
+  @property
+  def guids_by_path(self):
+    """Get the GUIDs in the database.
+
+    Returns:
+      Dictionary of GUID strings indexed by asset path.
+    """
+    return dict(self._guids_by_path)
+
   def add_guid(self, path, guid):
     """Add a GUID for the specified path to the guid_map and GUID checker.
 
@@ -1019,8 +1969,10 @@ class GuidDatabase(object):
     missing_guid_paths = []
     for asset in assets:
       existing_guid = None
-      metadata_guid = safe_dict_get_value(asset.importer_metadata, "guid",
-                                          value_classes=STR_OR_UNICODE)
+      # The GUID isn't modified when metadata is generated for the asset so
+      # read it from the original metadata to avoid generating metadata.
+      metadata_guid = safe_dict_get_value(asset.importer_metadata_original,
+                                          "guid", value_classes=STR_OR_UNICODE)
       try:
         existing_guid = self.get_guid(asset.filename_guid_lookup)
       except MissingGuidsError:
@@ -1032,6 +1984,14 @@ class GuidDatabase(object):
         missing_guid_paths.append(asset.filename_guid_lookup)
     if missing_guid_paths:
       raise MissingGuidsError(missing_guid_paths)
+    self.check_for_duplicates()
+
+  def check_for_duplicates(self):
+    """Check the database for GUIDs that map to multiple paths.
+
+    Raises:
+      DuplicateGuidsError: If any GUIDs in the database are duplicates.
+    """
     self._duplicate_guids_checker.check_for_duplicates()
 
   def get_guid(self, path):
@@ -1053,30 +2013,305 @@ class GuidDatabase(object):
     return guid
 
 
-def copy_and_set_rwx(source_path, target_path):
-  """Copy a file/folder and set the target to readable / writeable & executable.
+class FileCopier(object):
+  """Copies files using the fastest strategy supported by the platform.
+
+  Strategies are tried in order of preference.  If a strategy fails the file
+  is copied with the next strategy.  A strategy that isn't supported by the
+  platform or filesystem is not tried again, while other failures (e.g
+  copying between filesystems) only fall back for the file being copied.
+
+  Attributes:
+    _failed_strategies: Set of strategies that aren't supported.
+    _copies_by_strategy: Dictionary of the number of files copied indexed by
+      strategy.
+  """
+
+  # Strategies that copy the content of files in order of preference.
+  COPY_STRATEGIES = ("reflink", "copy_file_range", "sendfile", "copy")
+  # ioctl that clones a file on Linux, see ioctl_ficlone(2).
+  FICLONE = 0x40049409
+  # Number of bytes copied by each kernel copy call.
+  KERNEL_COPY_BLOCK_SIZE = 64 * 1024 * 1024
+  # Errors that indicate a strategy isn't supported.
+  UNSUPPORTED_ERRNOS = frozenset([errno.EOPNOTSUPP, errno.ENOTSUP,
+                                  errno.ENOTTY, errno.EINVAL, errno.ENOSYS])
+
+  def __init__(self):
+    """Initialize the copier."""
+    self._failed_strategies = set()
+    self._copies_by_strategy = collections.Counter()
+
+  @property
+  def copies_by_strategy(self):
+    """Get the number of files copied by each strategy.
+
+    Returns:
+      Dictionary of the number of files copied indexed by strategy.
+    """
+    return dict(self._copies_by_strategy)
+
+  def get_strategies(self, strategy):
+    """Get the strategies to try to copy a file.
+
+    Args:
+      strategy: Value of the copy_strategy flag.
+
+    Returns:
+      List of copy strategies in the order they should be tried.
+    """
+    strategies = list(FileCopier.COPY_STRATEGIES)
+    if strategy in strategies:
+      strategies = [strategy] + [s for s in strategies if s != strategy]
+    return [s for s in strategies
+            if s == "copy" or s not in self._failed_strategies]
+
+  def copy_file(self, source_path, target_path, strategy=None):
+    """Copy the contents of a file.
+
+    Args:
+      source_path: File to copy.
+      target_path: File to write.
+      strategy: Copy strategy to use, if this is None the copy_strategy flag
+        is used.  If this is "hardlink" the target is linked to the source
+        falling back to a copy.
+
+    Returns:
+      Strategy used to copy the file.
+    """
+    strategy = strategy or FLAGS.copy_strategy
+    if strategy == "hardlink":
+      try:
+        os.link(source_path, target_path)
+        self._copies_by_strategy["hardlink"] += 1
+        return "hardlink"
+      except OSError:
+        strategy = "auto"
+    for copy_strategy in self.get_strategies(strategy):
+      if copy_strategy == "copy":
+        shutil.copyfile(source_path, target_path)
+      else:
+        try:
+          with open(source_path, "rb") as source_file:
+            with open(target_path, "wb") as target_file:
+              if copy_strategy == "reflink":
+                FileCopier._reflink(source_file, target_file)
+              else:
+                FileCopier._kernel_copy(
+                    source_file, target_file,
+                    os.fstat(source_file.fileno()).st_size,
+                    (os.copy_file_range if copy_strategy == "copy_file_range"
+                     else FileCopier._sendfile))
+        except (OSError, AttributeError, ImportError) as error:
+          logging.debug("Unable to copy %s to %s using %s (%s)", source_path,
+                        target_path, copy_strategy, str(error))
+          if (not isinstance(error, OSError) or
+              error.errno in FileCopier.UNSUPPORTED_ERRNOS):
+            self._failed_strategies.add(copy_strategy)
+          continue
+      self._copies_by_strategy[copy_strategy] += 1
+      return copy_strategy
+    return None
+
+  @staticmethod
+  def _reflink(source_file, target_file):
+    """Clone a file so that it shares the source file's storage.
+
+    Args:
+      source_file: File object to clone.
+      target_file: File object to write.
+
+    Raises:
+      OSError: If the filesystem doesn't support cloning files.
+      ImportError: If the platform doesn't support ioctl().
+    """
+    import fcntl  # pylint: disable=g-import-not-at-top
+    fcntl.ioctl(target_file.fileno(), FileCopier.FICLONE, source_file.fileno())
+
+  @staticmethod
+  def _sendfile(source_fd, target_fd, count):
+    """Copy data between files using os.sendfile().
+
+    Args:
+      source_fd: File descriptor to read from.
+      target_fd: File descriptor to write to.
+      count: Maximum number of bytes to copy.
+
+    Returns:
+      Number of bytes copied.
+    """
+    return os.sendfile(target_fd, source_fd, None, count)
+
+  @staticmethod
+  def _kernel_copy(source_file, target_file, size, copy_function):
+    """Copy data between files without reading it into this process.
+
+    Args:
+      source_file: File object to read from.
+      target_file: File object to write.
+      size: Number of bytes to copy.
+      copy_function: os.copy_file_range() or a function with the same
+        arguments that returns the number of bytes copied.
+
+    Raises:
+      OSError: If the copy fails.
+    """
+    copied = 0
+    while copied < size:
+      count = copy_function(source_file.fileno(), target_file.fileno(),
+                            min(size - copied,
+                                FileCopier.KERNEL_COPY_BLOCK_SIZE))
+      if not count:
+        break
+      copied += count
+    if copied != size:
+      raise OSError("Copied %d of %d bytes" % (copied, size))
+
+
+# Copies files using the strategy selected by the copy_strategy flag.
+FILE_COPIER = FileCopier()
+
+
+def copy_and_set_rwx(source_path, target_path, for_archive=False):
+  """Copy a file/folder and set the target to readable / writeable & executable.
 
   Args:
     source_path: File to copy from.
     target_path: Path to copy to.
+    for_archive: Whether the target is staged for
+      PackageConfiguration.create_archive().  When the copy_strategy flag is
+      "hardlink" staged files are linked to the source and their permissions
+      are applied when they're archived rather than on disk.
   """
   logging.debug("Copying %s --> %s", source_path, target_path)
-  file_mode = stat.S_IRWXU | stat.S_IRWXG | stat.S_IROTH | stat.S_IXOTH
+  file_mode = ARCHIVE_ASSET_FILE_MODE
+  strategy = None
+  if FLAGS.copy_strategy == "hardlink":
+    strategy = "hardlink" if for_archive else "auto"
+
+  def copy_file(source_filename, target_filename):
+    """Copy a file and set its permissions unless it's linked.
+
+    Args:
+      source_filename: File to copy from.
+      target_filename: File to copy to.
+
+    Returns:
+      target_filename.
+    """
+    if FILE_COPIER.copy_file(source_filename, target_filename,
+                             strategy=strategy) != "hardlink":
+      os.chmod(target_filename, file_mode)
+    return target_filename
 
   if os.path.isfile(source_path):
     target_dir = os.path.dirname(target_path)
     if not os.path.exists(target_dir):
       os.makedirs(target_dir)
-    shutil.copy(source_path, target_path)
-    os.chmod(target_path, file_mode)
+    if os.path.isdir(target_path):
+      target_path = os.path.join(target_path, os.path.basename(source_path))
+    copy_file(source_path, target_path)
   elif os.path.isdir(source_path):
-    shutil.copytree(source_path, target_path)
+    shutil.copytree(source_path, target_path, copy_function=copy_file)
     os.chmod(target_path, file_mode)
-    for current_dir, directories, filenames in os.walk(target_path):
+    for current_dir, directories, _ in os.walk(target_path):
       for directory in [os.path.join(current_dir, d) for d in directories]:
         os.chmod(directory, file_mode)
-      for filename in [os.path.join(current_dir, f) for f in filenames]:
-        os.chmod(filename, file_mode)
+
+
+def link_or_copy_file(source_path, target_path):
+  """Hard link a file to the target path falling back to a copy.
+
+  Args:
+    source_path: File to link to.
+    target_path: Path of the link or copy, replaced if it exists.
+  """
+  logging.debug("Linking %s --> %s", source_path, target_path)
+  target_dir = os.path.dirname(os.path.abspath(target_path))
+  if not os.path.exists(target_dir):
+    os.makedirs(target_dir)
+  if os.path.lexists(target_path):
+    os.unlink(target_path)
+  try:
+    os.link(source_path, target_path)
+  except OSError:
+    shutil.copyfile(source_path, target_path)
+
+
+def archive_header_filename(archive_filename):
+  """Get the filename stored in the gzip header of a package archive.
+
+  Args:
+    archive_filename: Path of the .unitypackage or .tgz file.
+
+  Returns:
+    Filename to pass to open_gzip_stream().  This must end with .tar or .tar.gz
+    for Unity to open the archive on Windows.
+  """
+  return os.path.splitext(archive_filename)[0] + ".tar.gz"
+
+
+def link_or_copy_archive(source_path, target_path):
+  """Link or copy a package archive, renaming it in its gzip header.
+
+  gzip compressed archives store their filename in the gzip header, so an
+  archive is only hard linked to the target if it doesn't store a filename.
+  Otherwise the archive is copied and the filename in the header is replaced
+  with the target's filename, which generates the same file as exporting the
+  package to the target path.
+
+  Args:
+    source_path: Archive to link to or copy.
+    target_path: Path of the link or copy, replaced if it exists.
+  """
+  with open(source_path, "rb") as source_file:
+    header = source_file.read(10)
+    flags_field = header[3] if len(header) == 10 else 0
+    if header[:2] != b"\x1f\x8b" or not flags_field & 0x08:  # FNAME
+      header = None
+  if header is None:
+    link_or_copy_file(source_path, target_path)
+    return
+
+  with open(source_path, "rb") as source_file:
+    source_file.seek(len(header))
+    if flags_field & 0x04:  # FEXTRA
+      extra_length = source_file.read(2)
+      header += extra_length + source_file.read(
+          struct.unpack("<H", extra_length)[0])
+    fname = b""
+    for character in iter(lambda: source_file.read(1), b""):
+      if character == b"\x00":
+        break
+      fname += character
+    comment = b""
+    if flags_field & 0x10:  # FCOMMENT
+      for character in iter(lambda: source_file.read(1), b""):
+        comment += character
+        if character == b"\x00":
+          break
+    if flags_field & 0x02:  # FHCRC
+      source_file.read(2)
+
+    target_fname = os.path.basename(
+        archive_header_filename(target_path)).encode("latin-1")
+    if target_fname.endswith(b".gz"):
+      target_fname = target_fname[:-3]
+    header += target_fname + b"\x00" + comment
+    if flags_field & 0x02:  # FHCRC
+      header += struct.pack("<H", zlib.crc32(header) & 0xffff)
+
+    logging.debug("Copying %s --> %s renaming %s to %s in the gzip header",
+                  source_path, target_path, fname, target_fname)
+    target_dir = os.path.dirname(os.path.abspath(target_path))
+    if not os.path.exists(target_dir):
+      os.makedirs(target_dir)
+    if os.path.lexists(target_path):
+      os.unlink(target_path)
+    with open(target_path, "wb") as target_file:
+      target_file.write(header)
+      shutil.copyfileobj(source_file, target_file)
+
 
 def version_handler_tag(islabel=True, field=None, value=None):
   """Generate a VersionHandler filename or label.
@@ -1132,24 +2367,376 @@ def version_handler_filename(filename, field_value_list):
   return posix_path("".join(components))
 
 
+class FileIndex(object):
+  """In-memory index of directory listings and file status.
+
+  Each directory is listed once using os.scandir() when it's first queried.
+  The os.DirEntry instances from the listing cache whether each entry is a
+  directory and its stat result, so repeated queries for the same paths do
+  not touch the filesystem.  The index is not updated when the filesystem
+  changes, call clear() to discard stale data.
+
+  Attributes:
+    _entries_by_directory: Dictionary of dictionaries of os.DirEntry
+      instances indexed by filename, indexed by absolute directory path.
+      None is stored for paths that are not directories.
+    _stat_by_root: Dictionary of stat results, or None for missing paths,
+      indexed by absolute path for paths that have no parent directory.
+  """
+
+  def __init__(self):
+    """Initialize an empty index."""
+    self._entries_by_directory = {}
+    self._stat_by_root = {}
+
+  def clear(self):
+    """Discard all cached directory listings and file status."""
+    self._entries_by_directory = {}
+    self._stat_by_root = {}
+
+  def _list_directory(self, path):
+    """Get the entries in a directory.
+
+    Args:
+      path: Absolute path of the directory to list.
+
+    Returns:
+      Dictionary of os.DirEntry instances indexed by filename or None if the
+      path is not a directory.
+    """
+    entries = self._entries_by_directory.get(path, False)
+    if entries is False:
+      try:
+        with os.scandir(path) as directory_entries:
+          entries = dict([(entry.name, entry) for entry in directory_entries])
+      except OSError:
+        entries = None
+      self._entries_by_directory[path] = entries
+    return entries
+
+  def listdir(self, path):
+    """Get the names of the entries in a directory.
+
+    Args:
+      path: Directory to list.
+
+    Returns:
+      List of filenames in the directory or an empty list if the path is not
+      a directory.
+    """
+    return list(self._list_directory(os.path.abspath(path)) or [])
+
+  def _get_entry(self, path):
+    """Get the cached os.DirEntry for a path.
+
+    Args:
+      path: Absolute path to query.
+
+    Returns:
+      os.DirEntry instance, None if the path doesn't exist or False if the
+      path has no parent directory.
+    """
+    parent, name = os.path.split(path)
+    if not name or parent == path:
+      return False
+    return (self._list_directory(parent) or {}).get(name)
+
+  def stat(self, path):
+    """Get the status of a path following symbolic links.
+
+    Args:
+      path: Path to query.
+
+    Returns:
+      os.stat_result or None if the path doesn't exist.
+    """
+    path = os.path.abspath(path)
+    entry = self._get_entry(path)
+    try:
+      if entry is False:
+        if path not in self._stat_by_root:
+          self._stat_by_root[path] = os.stat(path)
+        return self._stat_by_root[path]
+      return entry.stat() if entry else None
+    except OSError:
+      if entry is False:
+        self._stat_by_root[path] = None
+      return None
+
+  def isdir(self, path):
+    """Determine whether a path is a directory.
+
+    Args:
+      path: Path to query.
+
+    Returns:
+      True if the path is a directory, False otherwise.
+    """
+    path = os.path.abspath(path)
+    entry = self._get_entry(path)
+    if entry is False:
+      return self._list_directory(path) is not None
+    try:
+      return bool(entry) and entry.is_dir()
+    except OSError:
+      return False
+
+  def exists(self, path):
+    """Determine whether a path exists.
+
+    Args:
+      path: Path to query.
+
+    Returns:
+      True if the path exists, False otherwise.
+    """
+    return self.stat(path) is not None
+
+  def getctime(self, path):
+    """Get the metadata change time of a path.
+
+    Args:
+      path: Path to query.
+
+    Returns:
+      Change time in seconds since the epoch.
+
+    Raises:
+      OSError: If the path does not exist.
+    """
+    path_stat = self.stat(path)
+    if path_stat is None:
+      raise OSError("%s does not exist" % path)
+    return path_stat.st_ctime
+
+  def glob(self, pattern):
+    """Find paths matching a pattern using the same rules as glob.glob().
+
+    Args:
+      pattern: Pattern to match.  Like glob.glob() "*" does not match
+        filenames that start with "." unless the pattern does.
+
+    Returns:
+      List of matching paths.
+    """
+    dirname, basename = os.path.split(pattern)
+    if not glob.has_magic(pattern):
+      if basename:
+        return [pattern] if self.exists(pattern) else []
+      return [pattern] if self.isdir(dirname) else []
+    if not dirname:
+      parent_dirs = [""]
+    elif dirname != pattern and glob.has_magic(dirname):
+      parent_dirs = [path for path in self.glob(dirname) if self.isdir(path)]
+    else:
+      parent_dirs = [dirname]
+    matches = []
+    for parent_dir in parent_dirs:
+      if glob.has_magic(basename):
+        names = self.listdir(parent_dir or os.curdir)
+        if not basename.startswith("."):
+          names = [name for name in names if not name.startswith(".")]
+        matches.extend([os.path.join(parent_dir, name)
+                        for name in fnmatch.filter(names, basename)])
+      else:
+        path = os.path.join(parent_dir, basename)
+        if (self.exists(path) if basename else self.isdir(parent_dir)):
+          matches.append(path)
+    return matches
+
+  def walk_files(self, path):
+    """Find all files under a directory using the same rules as os.walk().
+
+    Args:
+      path: Directory to search.
+
+    Returns:
+      List of file paths under the directory.
+    """
+    files = []
+    directories = [path]
+    while directories:
+      directory = directories.pop()
+      for name, entry in sorted(
+          (self._list_directory(os.path.abspath(directory)) or {}).items()):
+        try:
+          is_dir = entry.is_dir()
+          descend = is_dir and not entry.is_symlink()
+        except OSError:
+          is_dir = descend = False
+        if descend:
+          directories.append(os.path.join(directory, name))
+        elif not is_dir:
+          files.append(os.path.join(directory, name))
+    return files
+
+
+class PathMatcher(object):
+  """Matches paths against a set of regular expressions.
+
+  A path matches if any of the regular expressions match the start of the
+  path, like re.match().  Expressions that only match a literal prefix
+  (e.g "Firebase/Editor/" or "Firebase/Editor/.*") are stored in sets
+  indexed by prefix length so that each is tested with a single lookup, the
+  remaining expressions without groups or inline flags are combined into a
+  single regular expression.
+
+  Attributes:
+    _prefixes_by_length: Dictionary of sets of literal prefixes indexed by
+      prefix length.
+    _regular_expressions: List of compiled regular expressions used to match
+      paths that don't match a literal prefix.
+  """
+
+  # Characters that have a special meaning in regular expressions.
+  SPECIAL_CHARACTERS = frozenset(".^$*+?{}[]|()\\")
+
+  def __init__(self, patterns):
+    """Initialize the matcher.
+
+    Args:
+      patterns: List of regular expression strings.
+
+    Raises:
+      re.error: If a pattern is an invalid regular expression.
+    """
+    self._prefixes_by_length = collections.defaultdict(set)
+    expressions = []
+    for pattern in patterns:
+      re.compile(pattern)
+      prefix = PathMatcher.literal_prefix(pattern)
+      if prefix is None:
+        expressions.append(pattern)
+      else:
+        self._prefixes_by_length[len(prefix)].add(prefix)
+    self._regular_expressions = []
+    combinable = [expression for expression in expressions
+                  if PathMatcher.is_combinable(expression)]
+    if combinable:
+      self._regular_expressions.append(re.compile(
+          "|".join(["(?:%s)" % expression for expression in combinable])))
+    self._regular_expressions.extend(
+        [re.compile(expression) for expression in expressions
+         if not PathMatcher.is_combinable(expression)])
+
+  @staticmethod
+  def is_combinable(pattern):
+    """Determine whether a regular expression can be combined with others.
+
+    Expressions are combined into a single alternation which changes the
+    numbering of groups and applies inline flags to all expressions, so only
+    expressions without capturing groups, conditionals or inline flags can be
+    combined.
+
+    Args:
+      pattern: Regular expression string.
+
+    Returns:
+      True if the expression doesn't contain groups other than
+      non-capturing groups and lookarounds, False otherwise.
+    """
+    index = 0
+    while index < len(pattern):
+      character = pattern[index]
+      if character == "\\":
+        index += 2
+        continue
+      if character == "(" and not pattern.startswith(
+          ("(?:", "(?=", "(?!", "(?<=", "(?<!"), index):
+        return False
+      index += 1
+    return True
+
+  @staticmethod
+  def literal_prefix(pattern):
+    """Get the prefix matched by a regular expression that matches a literal.
+
+    Args:
+      pattern: Regular expression string.
+
+    Returns:
+      Prefix string if the expression matches paths that start with the
+      returned string, None if the expression matches other paths.
+    """
+    prefix = []
+    index = 0
+    while index < len(pattern):
+      character = pattern[index]
+      if character == "\\":
+        escaped = pattern[index + 1:index + 2]
+        if not escaped or escaped.isalnum():
+          return None
+        prefix.append(escaped)
+        index += 2
+        continue
+      if character in PathMatcher.SPECIAL_CHARACTERS:
+        # A trailing ".*" matches the remainder of a path.
+        if pattern[index:] != ".*":
+          return None
+        break
+      prefix.append(character)
+      index += 1
+    return "".join(prefix)
+
+  def __bool__(self):
+    """Whether this matcher has any patterns.
+
+    Returns:
+      True if this matcher has patterns, False otherwise.
+    """
+    return bool(self._prefixes_by_length or self._regular_expressions)
+
+  def match(self, path):
+    """Determine whether a path matches any of the patterns.
+
+    Args:
+      path: Path to match.
+
+    Returns:
+      True if the path matches, False otherwise.
+    """
+    for length, prefixes in self._prefixes_by_length.items():
+      if path[:length] in prefixes:
+        return True
+    for regular_expression in self._regular_expressions:
+      if regular_expression.match(path):
+        return True
+    return False
+
+
 class Asset(object):
   """Asset to export.
 
+  Assets are compact records, paths are converted to POSIX style when an asset
+  is constructed and instances can be hashed and sorted by filename.
+
   Attributes:
-    _filename: Relative path of the file referenced by this asset.
-    _filename_guid_lookup: Filename to reference GUID.
-    _filename_absolute: Absolute path of the file referenced by this asset.
-    _importer_metadata: OrderedDict of Unity asset metadata used to construct
-      this class.
+    _filename: Relative POSIX path of the file referenced by this asset.
+    _filename_guid_lookup: POSIX filename to reference GUID.
+    _filename_absolute: Absolute POSIX path of the file referenced by this
+      asset.
+    _importer_metadata: ReadOnlyOrderedDict of Unity asset metadata used to
+      construct this class.
     _is_folder: Whether this asser is for a folder.
+    _file_index: FileIndex used to query the status of the file referenced by
+      this asset or None to query the filesystem.
+    _effective_importer_metadata: Read-only metadata returned by
+      importer_metadata or None if it hasn't been generated yet.
+    _metadata_fingerprint: Fingerprint of importer_metadata or None if it
+      hasn't been calculated yet.
   """
 
+  __slots__ = ("_filename", "_filename_guid_lookup", "_filename_absolute",
+               "_importer_metadata", "_is_folder", "_file_index",
+               "_effective_importer_metadata", "_metadata_fingerprint")
+
   def __init__(self,
                filename,
                filename_absolute,
                importer_metadata,
                filename_guid_lookup=None,
-               is_folder=False):
+               is_folder=False,
+               file_index=None):
     """Initialize an asset.
 
     Args:
@@ -1160,27 +2747,50 @@ class Asset(object):
       filename_guid_lookup: Filename to reference GUID. If this is None, the
         filename argument is used instead.
       is_folder: Whether this asser is for a folder.
+      file_index: FileIndex used to query the status of the file referenced by
+        this asset.  If this is None, the filesystem is queried.
     """
-    self._filename = filename
-    self._filename_guid_lookup = filename_guid_lookup or filename
-    self._filename_absolute = filename_absolute or filename
-    self._importer_metadata = importer_metadata
+    self._filename = posix_path(filename)
+    self._filename_guid_lookup = (posix_path(filename_guid_lookup)
+                                  if filename_guid_lookup else self._filename)
+    self._filename_absolute = (posix_path(filename_absolute)
+                               if filename_absolute else self._filename)
+    self._importer_metadata = freeze(importer_metadata)
     self._is_folder = is_folder
+    self._file_index = file_index
+    self._effective_importer_metadata = None
+    self._metadata_fingerprint = None
 
   def __eq__(self, other):
     """Overrides == operator."""
+    if self is other:
+      return True
     if isinstance(other, Asset):
-      return (self.filename == other.filename and
-              self.filename_guid_lookup == other.filename_guid_lookup and
-              self.filename_absolute == other.filename_absolute and
-              self.importer_metadata == other.importer_metadata and
-              self.is_folder == other.is_folder)
+      return (self._filename == other._filename and
+              self._filename_guid_lookup == other._filename_guid_lookup and
+              self._filename_absolute == other._filename_absolute and
+              self._is_folder == other._is_folder and
+              self.importer_metadata == other.importer_metadata)
     return False
 
   def __ne__(self, other):
     """Overrides != operator (Required in Python2)."""
     return not self.__eq__(other)
 
+  def __hash__(self):
+    """Hash the paths of this asset.
+
+    Returns:
+      Hash of the paths referenced by this asset.  Importer metadata is not
+      hashed so that hashing is cheap.
+    """
+    return hash((self._filename, self._filename_guid_lookup,
+                 self._filename_absolute))
+
+  def __lt__(self, other):
+    """Overrides < operator to sort assets by filename."""
+    return self._filename < other._filename
+
   @property
   def filename(self):
     """Get the name of the file referenced by this asset.
@@ -1188,7 +2798,7 @@ class Asset(object):
     Returns:
       Filename string.
     """
-    return posix_path(self._filename)
+    return self._filename
 
   @property
   def filename_absolute(self):
@@ -1197,7 +2807,7 @@ class Asset(object):
     Returns:
       Filename string.
     """
-    return posix_path(self._filename_absolute)
+    return self._filename_absolute
 
   @property
   def filename_guid_lookup(self):
@@ -1206,7 +2816,7 @@ class Asset(object):
     Returns:
       Filename string.
     """
-    return posix_path(self._filename_guid_lookup)
+    return self._filename_guid_lookup
 
   @property
   def is_folder(self):
@@ -1231,7 +2841,8 @@ class Asset(object):
     """Add to the labels field of Unity asset metadata OrderedDict.
 
     Args:
-      importer_metadata: OrderedDict to modify.
+      importer_metadata: OrderedDict to modify.  If this is read-only it's
+        copied rather than modified.
       labels: Set of labels to add to asset_metadata.
 
     Returns:
@@ -1241,8 +2852,10 @@ class Asset(object):
                                           value_classes=[list])
     new_labels = set(existing_labels or []).union(labels)
     if new_labels:
+      importer_metadata = thaw(importer_metadata)
       importer_metadata["labels"] = sorted(new_labels)
     elif existing_labels is not None:
+      importer_metadata = thaw(importer_metadata)
       del importer_metadata["labels"]
     return importer_metadata
 
@@ -1254,7 +2867,8 @@ class Asset(object):
     not supported by the asset based upon the asset's filename extension.
 
     Args:
-      importer_metadata: Metadata to modify. This is modified in-place.
+      importer_metadata: Metadata to modify. Mutable nodes are modified
+        in-place, read-only nodes are copied.
       filename: Name of the asset file.
 
     Returns:
@@ -1286,14 +2900,15 @@ class Asset(object):
         set(supported_platforms)))
     # Disable the Any platform if any platforms are disabled.
     if disable_platforms:
-      any_config = platform_data.get("Any", collections.OrderedDict())
+      importer_metadata, platform_data = Asset._thaw_platform_data(
+          importer_metadata)
+      any_config = thaw(platform_data.get("Any", collections.OrderedDict()))
       any_config["enabled"] = 0
       platform_data["Any"] = any_config
     # Disable all platforms in the set.
     for current_platform in disable_platforms:
-      platform_data[current_platform] = copy.deepcopy(
-          PLUGIN_IMPORTER_METADATA_TEMPLATE[
-              "PluginImporter"]["platformData"][current_platform])
+      platform_data[current_platform] = PLUGIN_IMPORTER_METADATA_TEMPLATE[
+          "PluginImporter"]["platformData"][current_platform]
     logging.debug("Disabled platforms %s for %s", disable_platforms, filename)
     return importer_metadata
 
@@ -1322,12 +2937,49 @@ class Asset(object):
             safe_dict_get_value(entry, "second",
                                 default_value=collections.OrderedDict()))
 
+  @staticmethod
+  def _thaw_platform_data(importer_metadata):
+    """Get mutable copies of metadata nodes on the path to platformData.
+
+    Args:
+      importer_metadata: Metadata that contains PluginImporter.platformData.
+
+    Returns:
+      (importer_metadata, platform_data) tuple where importer_metadata is the
+      mutable root of the metadata and platform_data is the mutable
+      PluginImporter.platformData node.
+    """
+    importer_metadata = thaw(importer_metadata)
+    plugin_importer = thaw_node(importer_metadata, "PluginImporter")
+    return (importer_metadata, thaw_node(plugin_importer, "platformData"))
+
+  @staticmethod
+  def _thaw_platform_data_entry(platform_data_item):
+    """Get mutable copies of the nodes of an item in the platformData list.
+
+    Args:
+      platform_data_item: Entry in the platformData list.
+
+    Returns:
+      (platform_data_item, second) tuple where platform_data_item is a mutable
+      entry and second is the mutable "second" dictionary of the entry, see
+      platform_data_get_entry().
+    """
+    platform_data_item = thaw(platform_data_item)
+    entry = platform_data_item
+    if "data" in entry:
+      entry = thaw_node(entry, "data")
+    if "second" not in entry:
+      return (platform_data_item, collections.OrderedDict())
+    return (platform_data_item, thaw_node(entry, "second"))
+
   @staticmethod
   def set_cpu_for_desktop_platforms(importer_metadata):
     """Enable CPU(s) for each enabled desktop platform in the metadata.
 
     Args:
-      importer_metadata: Metadata to modify.
+      importer_metadata: Metadata to modify. Mutable nodes are modified
+        in-place, read-only nodes are copied.
 
     Returns:
       Modified importer_metadata.
@@ -1340,7 +2992,7 @@ class Asset(object):
     if serialized_version == 1:
       platform_data = safe_dict_get_value(plugin_importer, "platformData",
                                           default_value={})
-      for platform_name, options in platform_data.items():
+      for platform_name, options in list(platform_data.items()):
         if not safe_dict_get_value(options, "enabled", default_value=0):
           continue
         # Override the CPU of the appropriate platforms.
@@ -1349,12 +3001,16 @@ class Asset(object):
           continue
         settings = options.get("settings", collections.OrderedDict())
         if settings.get("CPU", "None") == "None":
+          importer_metadata, platform_data = Asset._thaw_platform_data(
+              importer_metadata)
+          options = thaw_node(platform_data, platform_name)
+          settings = thaw(settings)
           settings["CPU"] = cpu
           options["settings"] = settings
     else:
       platform_data = safe_dict_get_value(plugin_importer, "platformData",
                                           default_value=[])
-      for entry in platform_data:
+      for index, entry in enumerate(list(platform_data)):
         # Parse the platform name tuple from the "first" dictionary.
         first, second = Asset.platform_data_get_entry(entry)
         platform_tuple = list(first.items())[0]
@@ -1370,6 +3026,11 @@ class Asset(object):
         settings = safe_dict_get_value(second, "settings",
                                        default_value=collections.OrderedDict())
         if settings.get("CPU", "None") == "None":
+          importer_metadata, platform_data = Asset._thaw_platform_data(
+              importer_metadata)
+          platform_data[index], second = Asset._thaw_platform_data_entry(
+              entry)
+          settings = thaw(settings)
           settings["CPU"] = cpu
           second["settings"] = settings
     return importer_metadata
@@ -1379,7 +3040,8 @@ class Asset(object):
     """Sets the CPU for Android in the metadata if enabled.
 
     Args:
-      importer_metadata: Metadata to modify.
+      importer_metadata: Metadata to modify. Mutable nodes are modified
+        in-place, read-only nodes are copied.
       cpu_string: The desired CPU string value.
 
     Returns:
@@ -1393,19 +3055,22 @@ class Asset(object):
     if serialized_version == 1:
       platform_data = safe_dict_get_value(plugin_importer, "platformData",
                                           default_value={})
-      for platform_name, options in platform_data.items():
+      for platform_name, options in list(platform_data.items()):
         if not safe_dict_get_value(options, "enabled", default_value=0):
           continue
         if not cpu_string:
           continue
         if platform_name == "Android":
-          settings = options.get("settings", collections.OrderedDict())
+          importer_metadata, platform_data = Asset._thaw_platform_data(
+              importer_metadata)
+          options = thaw_node(platform_data, platform_name)
+          settings = thaw(options.get("settings", collections.OrderedDict()))
           settings["CPU"] = cpu_string
           options["settings"] = settings
     else:
       platform_data = safe_dict_get_value(plugin_importer, "platformData",
                                           default_value=[])
-      for entry in platform_data:
+      for index, entry in enumerate(list(platform_data)):
         # Parse the platform name tuple from the "first" dictionary.
         first, second = Asset.platform_data_get_entry(entry)
         platform_tuple = list(first.items())[0]
@@ -1419,6 +3084,11 @@ class Asset(object):
         settings = safe_dict_get_value(second, "settings",
                                        default_value=collections.OrderedDict())
         if platform_name == "Android":
+          importer_metadata, platform_data = Asset._thaw_platform_data(
+              importer_metadata)
+          platform_data[index], second = Asset._thaw_platform_data_entry(
+              entry)
+          settings = thaw(settings)
           settings["CPU"] = cpu_string
           second["settings"] = settings
     return importer_metadata
@@ -1428,7 +3098,8 @@ class Asset(object):
     """Enable / disable all platforms if the "Any" platform is enabled.
 
     Args:
-      importer_metadata: Metadata to modify. This is modified in-place.
+      importer_metadata: Metadata to modify. Mutable nodes are modified
+        in-place, read-only nodes are copied.
 
     Returns:
       Modified importer_metadata.
@@ -1446,13 +3117,16 @@ class Asset(object):
       any_enabled = platform_data.get("Any", {}).get("enabled", 0)
       if not any_enabled:
         return importer_metadata
+      importer_metadata, platform_data = Asset._thaw_platform_data(
+          importer_metadata)
       # If the Any platform is present and either enabled or disabled, enable
       # for disable all platforms.
       for platform_name, default_config in PLUGIN_IMPORTER_METADATA_TEMPLATE[
           "PluginImporter"]["platformData"].items():
         config = platform_data.get(platform_name)
         if config is None:
-          config = copy.deepcopy(default_config)
+          config = default_config
+        config = thaw(config)
         config["enabled"] = any_enabled
         platform_data[platform_name] = config
     else:
@@ -1483,8 +3157,7 @@ class Asset(object):
           unused_platform_target, platform_name = platform_tuple
           if platform_name in remaining_platforms:
             remaining_platforms.remove(platform_name)
-          entry = copy.deepcopy(entry)
-          _, second = Asset.platform_data_get_entry(entry)
+          entry, second = Asset._thaw_platform_data_entry(entry)
           second["enabled"] = any_enabled
         new_platform_data.append(entry)
 
@@ -1499,6 +3172,8 @@ class Asset(object):
         if unity_5_6_format:
           entry = collections.OrderedDict([("data", entry)])
         new_platform_data.append(entry)
+      importer_metadata = thaw(importer_metadata)
+      plugin_importer = thaw_node(importer_metadata, "PluginImporter")
       plugin_importer["platformData"] = new_platform_data
     return importer_metadata
 
@@ -1507,7 +3182,7 @@ class Asset(object):
     """Get the original metadata section used to import this asset.
 
     Returns:
-      Importer section of Unity asset metadata as an OrderedDict.
+      Importer section of Unity asset metadata as a ReadOnlyOrderedDict.
     """
     return self._importer_metadata
 
@@ -1515,6 +3190,40 @@ class Asset(object):
   def importer_metadata(self):
     """Get the Unity metadata section used to import this asset.
 
+    The metadata is generated from importer_metadata_original the first time
+    it's accessed.
+
+    Returns:
+      Importer section of Unity asset metadata as a ReadOnlyOrderedDict.
+    """
+    if self._effective_importer_metadata is None:
+      with TRACER.span("transform_metadata", filename=self._filename):
+        self._effective_importer_metadata = freeze(
+            self._generate_importer_metadata())
+    return self._effective_importer_metadata
+
+  @property
+  def metadata_fingerprint(self):
+    """Get a stable hash of the metadata section used to import this asset.
+
+    Returns:
+      Hex digest string of importer_metadata, see tree_fingerprint().
+    """
+    if self._metadata_fingerprint is None:
+      self._metadata_fingerprint = tree_fingerprint(self.importer_metadata)
+    return self._metadata_fingerprint
+
+  def release_metadata(self):
+    """Release the metadata generated for this asset.
+
+    The metadata is generated again the next time importer_metadata is
+    accessed.
+    """
+    self._effective_importer_metadata = None
+
+  def _generate_importer_metadata(self):
+    """Generate the Unity metadata section used to import this asset.
+
     Returns:
       Importer section of Unity asset metadata as an OrderedDict.
     """
@@ -1543,22 +3252,24 @@ class Asset(object):
                VERSION_HANDLER_PRESERVE_EXPORT_PATH_FIELD_PREFIX +
                self.filename)
 
-    metadata = copy.deepcopy(self._importer_metadata)
-    metadata = Asset.add_labels_to_metadata(metadata, labels)
+    # Each step copies the nodes it modifies so nodes that are not modified
+    # are shared with the original metadata.
+    metadata = Asset.add_labels_to_metadata(self._importer_metadata, labels)
     metadata = Asset.disable_unsupported_platforms(metadata, self._filename)
     metadata = Asset.apply_any_platform_selection(metadata)
     metadata = Asset.set_cpu_for_desktop_platforms(metadata)
     return metadata
 
   @staticmethod
-  def write_metadata(filename, metadata_list):
-    """Write asset metadata to a file.
+  def serialize_metadata(metadata_list):
+    """Serialize asset metadata to a string.
 
     Args:
-      filename: Name of the file to write.
       metadata_list: List of OrderedDict instances to combine, in the
-        specified order, to generate the data structure to serialize in YAML to
-        the metadata file.
+        specified order, to generate the data structure to serialize in YAML.
+
+    Returns:
+      YAML string.
     """
     output_metadata = collections.OrderedDict()
     for metadata in metadata_list:
@@ -1567,14 +3278,32 @@ class Asset(object):
     # so filter them from the metadata.
     if not output_metadata.get("labels") and "labels" in output_metadata:
       del output_metadata["labels"]
-    with open(filename, "wt", encoding='utf-8') as metadata_file:
-      metadata_file.write(YamlSerializer().dump(output_metadata))
+    # Most metadata is generated from templates that can be emitted directly.
+    with TRACER.span("serialize_metadata") as span:
+      metadata_yaml = dump_simple_yaml(output_metadata)
+      if metadata_yaml is None:
+        metadata_yaml = YAML_SERIALIZER.dump(output_metadata)
+      span.add_bytes(len(metadata_yaml))
+    return metadata_yaml
 
-  def write(self, output_dir, guid, timestamp=-1):
-    """Write a asset and it's metadata to output_dir.
+  @staticmethod
+  def write_metadata(filename, metadata_list):
+    """Write asset metadata to a file.
 
-    Given an asset file, path and metadata, this method creates a Unity plugin
-    directory structure that facilitates the creation of a .unitypackage
+    Args:
+      filename: Name of the file to write.
+      metadata_list: List of OrderedDict instances to combine, in the
+        specified order, to generate the data structure to serialize in YAML to
+        the metadata file.
+    """
+    with open(filename, "wt", encoding='utf-8') as metadata_file:
+      metadata_file.write(Asset.serialize_metadata(metadata_list))
+
+  def write(self, output_dir, guid, timestamp=-1):
+    """Write a asset and it's metadata to output_dir.
+
+    Given an asset file, path and metadata, this method creates a Unity plugin
+    directory structure that facilitates the creation of a .unitypackage
     archive.
 
     This method generates:
@@ -1614,7 +3343,8 @@ class Asset(object):
 
     # Copy the asset to the output folder.
     output_asset_filename = os.path.join(output_asset_dir, "asset")
-    copy_and_set_rwx(self.filename_absolute, output_asset_filename)
+    copy_and_set_rwx(self.filename_absolute, output_asset_filename,
+                     for_archive=True)
 
     # Create the "asset.meta" file.
     output_asset_metadata_filename = (output_asset_filename +
@@ -1627,10 +3357,56 @@ class Asset(object):
     # project.
     with open(os.path.join(output_asset_dir, "pathname"), "wt",
         encoding='utf-8') as (pathname_file):
-      pathname_file.write(posix_path(os.path.join(ASSETS_DIRECTORY,
-                                                  self.filename)))
+      pathname_file.write(self.export_pathname)
     return output_asset_dir
 
+  @property
+  def export_pathname(self):
+    """Get the path of the asset when it's imported into a Unity project.
+
+    Returns:
+      Path of the asset relative to the root of the Unity project.
+    """
+    return posix_path(os.path.join(ASSETS_DIRECTORY, self.filename))
+
+  def archive_entries(self, guid, timestamp=-1):
+    """Get the archive entries for the asset and it's metadata.
+
+    This generates the same structure as write() without staging any files:
+    * <guid>
+      Directory containing the asset.
+    * <guid>/asset
+      Read from the file referenced by this asset when archived.
+    * <guid>/asset.meta
+      Metadata for this asset including `importer_metadata`.
+    * <guid>/pathname
+      Path of the asset in the Unity project.
+
+    Args:
+      guid: The guid to use to pack the asset. This will override the GUID in
+        any existing metadata.
+      timestamp: Timestamp to write into the metadata file if a timestamp
+        does not already exist in importer_metadata.  If this argument < 0 the
+        timestamp is set to the creation time of the source file.
+
+    Returns:
+      List of ArchiveEntry instances, this is empty if the asset is for a
+      folder.
+    """
+    # Ignore folder asset when writing to unitypackage
+    if self.is_folder:
+      return []
+    return [
+        ArchiveEntry(guid, is_directory=True),
+        ArchiveEntry(posix_path(os.path.join(guid, "asset")),
+                     source_filename=self.filename_absolute,
+                     mode=ARCHIVE_ASSET_FILE_MODE),
+        ArchiveEntry(posix_path(os.path.join(
+            guid, "asset" + ASSET_METADATA_FILE_EXTENSION)),
+                     data=self.generate_metadata(guid, timestamp)),
+        ArchiveEntry(posix_path(os.path.join(guid, "pathname")),
+                     data=self.export_pathname)]
+
   def write_upm(self, output_dir, guid, timestamp=-1):
     """Write a asset and it's metadata to output_dir for UPM package.
 
@@ -1669,7 +3445,7 @@ class Asset(object):
       os.makedirs(output_asset)
     else:
       # Copy the asset to the output folder.
-      copy_and_set_rwx(self.filename_absolute, output_asset)
+      copy_and_set_rwx(self.filename_absolute, output_asset, for_archive=True)
 
     # Create the "path/to/asset/asset_filename.meta" file.
     output_asset_metadata_filename = (
@@ -1695,8 +3471,25 @@ class Asset(object):
       RuntimeError: If the asset is exported again with a different path or
         asset contents.
     """
+    with open(filename, "wt", encoding='utf-8') as metadata_file:
+      metadata_file.write(self.generate_metadata(guid, timestamp))
+
+  def generate_metadata(self, guid, timestamp=-1):
+    """Generate the contents of the metadata file for the asset.
+
+    Args:
+      guid: The guid to use to pack the asset. This will override the GUID in
+        any existing metadata.
+      timestamp: Timestamp to write into the metadata if a timestamp does
+        not already exist in importer_metadata.  If this argument < 0 the
+        timestamp is set to the creation time of the source file, or 0 if this
+        asset is a folder.
+
+    Returns:
+      YAML metadata string.
+    """
     if self.is_folder:
-      importer_metadata = copy.deepcopy(DEFAULT_FOLDER_METADATA_TEMPLATE)
+      importer_metadata = DEFAULT_FOLDER_METADATA_TEMPLATE
     else:
       importer_metadata = self.importer_metadata
 
@@ -1706,11 +3499,13 @@ class Asset(object):
       if self.is_folder:
         timestamp = 0
       else:
-        timestamp = int(os.path.getctime(self.filename_absolute))
+        timestamp = int(
+            self._file_index.getctime(self.filename_absolute)
+            if self._file_index else os.path.getctime(self.filename_absolute))
     timestamp = safe_dict_get_value(
         importer_metadata, "timeCreated", default_value=timestamp)
 
-    Asset.write_metadata(filename, [
+    return Asset.serialize_metadata([
         DEFAULT_METADATA_TEMPLATE, importer_metadata,
         collections.OrderedDict([("guid", guid), ("timeCreated", timestamp)])
     ])
@@ -1725,8 +3520,601 @@ class Asset(object):
     Returns:
       List of Asset instances sorted by filename.
     """
-    return sorted([asset for asset in assets],
-                  key=lambda asset: asset.filename)
+    return sorted(assets, key=operator.attrgetter("_filename"))
+
+
+class ArchiveEntry(object):
+  """File or directory to store in an archive.
+
+  Attributes:
+    _arcname: Path of the entry in the archive.
+    _source_filename: File to read the contents of the entry from or None.
+    _data: Contents of the entry as bytes or None.
+    _mode: Permissions of the entry.
+    _is_directory: Whether this entry is a directory.
+  """
+
+  def __init__(self, arcname, source_filename=None, data=None, mode=None,
+               is_directory=False):
+    """Initialize the entry.
+
+    Args:
+      arcname: Path of the entry in the archive.
+      source_filename: File to read the contents of the entry from when it's
+        archived.
+      data: Contents of the entry as a string or bytes.  Strings are encoded
+        as UTF-8.  This is ignored if source_filename is specified.
+      mode: Permissions of the entry.  If this is None the permissions are
+        derived from the type of the entry.
+      is_directory: Whether this entry is a directory.
+    """
+    self._arcname = posix_path(arcname)
+    self._source_filename = source_filename
+    if data is not None and not isinstance(data, bytes):
+      data = data.encode("utf-8")
+    self._data = data
+    self._is_directory = is_directory
+    if mode is None:
+      mode = (ARCHIVE_DIRECTORY_MODE if is_directory else
+              ARCHIVE_GENERATED_FILE_MODE)
+    self._mode = mode
+
+  @property
+  def arcname(self):
+    """Get the path of this entry in the archive.
+
+    Returns:
+      Path string.
+    """
+    return self._arcname
+
+  @property
+  def source_filename(self):
+    """Get the file the contents of this entry are read from.
+
+    Returns:
+      Filename string or None if the contents are held in memory.
+    """
+    return self._source_filename
+
+  @property
+  def data(self):
+    """Get the contents of this entry held in memory.
+
+    Returns:
+      Bytes or None if the contents are read from source_filename.
+    """
+    return self._data
+
+  @property
+  def mode(self):
+    """Get the permissions of this entry.
+
+    Returns:
+      Permission bits.
+    """
+    return self._mode
+
+  @property
+  def is_directory(self):
+    """Get whether this entry is a directory.
+
+    Returns:
+      True if this is a directory, False otherwise.
+    """
+    return self._is_directory
+
+  def __repr__(self):
+    """Returns a human readable string.
+
+    Returns:
+      A human readable representation of this object.
+    """
+    return "<ArchiveEntry arcname=%s source=%s>" % (self._arcname,
+                                                   self._source_filename)
+
+
+class ParallelGzipWriter(object):
+  """Writes a gzip stream compressing blocks of data in parallel.
+
+  Similar to pigz, the uncompressed data is split into fixed size blocks that
+  are compressed by a pool of threads (zlib releases the GIL while
+  compressing).  Each block's compressor is primed with the last 32KB of the
+  previous block and all but the last block are terminated with a sync flush,
+  so the concatenated blocks form a single deflate stream in a single gzip
+  member.  The output only depends upon the data, compression level, block
+  size, filename and mtime, it does not depend upon thread scheduling.
+
+  Attributes:
+    _fileobj: File object the compressed stream is written to.
+    _compression_level: zlib compression level.
+    _block_size: Size of each uncompressed block.
+    _executor: ThreadPoolExecutor used to compress blocks.
+    _max_pending_blocks: Maximum number of blocks waiting to be written.
+    _pending_blocks: Deque of futures that return compressed blocks in the
+      order they're written to the stream.
+    _buffer: Uncompressed data that has not been submitted for compression.
+    _previous_block: Last block submitted for compression.
+    _crc: CRC32 of the uncompressed data.
+    _size: Size of the uncompressed data.
+    _closed: Whether the stream has been closed.
+  """
+
+  def __init__(self, fileobj, filename=None, mtime=None,
+               compression_level=DEFAULT_COMPRESSION_LEVEL, threads=0,
+               block_size=PARALLEL_GZIP_BLOCK_SIZE):
+    """Initialize the writer and write the gzip header.
+
+    Args:
+      fileobj: File object to write the compressed stream to.
+      filename: Filename to store in the gzip header.  Like the gzip module
+        the basename is stored with any ".gz" extension removed.
+      mtime: Modification time to store in the gzip header.  If this is None
+        the current time is used.
+      compression_level: zlib compression level.
+      threads: Number of compression threads.  If this is less than 1 the
+        number of CPUs is used.
+      block_size: Size of each block of uncompressed data.
+    """
+    self._fileobj = fileobj
+    self._compression_level = compression_level
+    self._block_size = max(block_size, DEFLATE_WINDOW_SIZE)
+    if threads < 1:
+      threads = os.cpu_count() or 1
+    self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+    self._max_pending_blocks = threads * 2
+    self._pending_blocks = collections.deque()
+    self._buffer = bytearray()
+    self._previous_block = b""
+    self._crc = 0
+    self._size = 0
+    self._closed = False
+    self._write_header(filename, mtime)
+
+  def _write_header(self, filename, mtime):
+    """Write the gzip header.
+
+    Args:
+      filename: Filename to store in the header or None.
+      mtime: Modification time to store in the header or None.
+    """
+    flags_field = 0
+    fname = b""
+    if filename:
+      fname = os.path.basename(filename).encode("latin-1")
+      if fname.endswith(b".gz"):
+        fname = fname[:-3]
+      if fname:
+        flags_field |= 0x08  # FNAME
+    if mtime is None:
+      mtime = time.time()
+    if self._compression_level == 9:
+      extra_flags = 2
+    elif self._compression_level == 1:
+      extra_flags = 4
+    else:
+      extra_flags = 0
+    self._fileobj.write(b"\x1f\x8b\x08" + struct.pack(
+        "<BIBB", flags_field, int(mtime) & 0xffffffff, extra_flags, 255))
+    if fname:
+      self._fileobj.write(fname + b"\x00")
+
+  @staticmethod
+  def _compress_block(block, dictionary, compression_level, last):
+    """Compress a block of data.
+
+    Args:
+      block: Data to compress.
+      dictionary: Data preceding the block in the stream used to prime the
+        compressor.
+      compression_level: zlib compression level.
+      last: Whether this is the last block of the stream.
+
+    Returns:
+      Raw deflate data for the block.
+    """
+    compressor_args = [compression_level, zlib.DEFLATED, -zlib.MAX_WBITS,
+                       zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY]
+    compressor = (zlib.compressobj(*compressor_args, zdict=dictionary)
+                  if dictionary else zlib.compressobj(*compressor_args))
+    return compressor.compress(block) + compressor.flush(
+        zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+  def _submit_block(self, block, last=False):
+    """Submit a block for compression and write completed blocks.
+
+    Args:
+      block: Block of data to compress.
+      last: Whether this is the last block of the stream.
+    """
+    self._pending_blocks.append(self._executor.submit(
+        ParallelGzipWriter._compress_block, block,
+        self._previous_block[-DEFLATE_WINDOW_SIZE:], self._compression_level,
+        last))
+    self._previous_block = block
+    while len(self._pending_blocks) > self._max_pending_blocks:
+      self._fileobj.write(self._pending_blocks.popleft().result())
+
+  def write(self, data):
+    """Compress data into the stream.
+
+    Args:
+      data: Bytes-like object to write.
+
+    Returns:
+      Number of bytes written.
+
+    Raises:
+      ValueError: If the stream is closed.
+    """
+    if self._closed:
+      raise ValueError("write() on closed ParallelGzipWriter")
+    data = memoryview(data)
+    length = data.nbytes
+    self._crc = zlib.crc32(data, self._crc)
+    self._size += length
+    self._buffer += data
+    while len(self._buffer) >= self._block_size:
+      block = bytes(self._buffer[:self._block_size])
+      del self._buffer[:self._block_size]
+      self._submit_block(block)
+    return length
+
+  def flush(self):
+    """Does nothing, data is written as blocks are compressed."""
+    pass
+
+  def close(self):
+    """Compress any remaining data and write the gzip trailer."""
+    if self._closed:
+      return
+    self._closed = True
+    try:
+      self._submit_block(bytes(self._buffer), last=True)
+      self._buffer = bytearray()
+      while self._pending_blocks:
+        self._fileobj.write(self._pending_blocks.popleft().result())
+      self._fileobj.write(struct.pack("<II", self._crc,
+                                      self._size & 0xffffffff))
+    finally:
+      self._executor.shutdown()
+
+  def __enter__(self):
+    """Returns this instance."""
+    return self
+
+  def __exit__(self, unused_type, unused_value, unused_traceback):
+    """Closes the stream."""
+    self.close()
+
+
+def open_gzip_stream(fileobj, filename, timestamp):
+  """Open a gzip stream configured by the compression flags.
+
+  Args:
+    fileobj: File object to write compressed data to.
+    filename: Filename to store in the gzip header.
+    timestamp: Timestamp to store in the gzip header or -1 to use the current
+      time.
+
+  Returns:
+    A gzip.GzipFile, or a ParallelGzipWriter if compression_threads is not 1.
+  """
+  compression_level = (DEFAULT_COMPRESSION_LEVEL
+                       if FLAGS.compression_level is None
+                       else FLAGS.compression_level)
+  mtime = timestamp if timestamp >= 0 else None
+  if FLAGS.compression_threads != 1:
+    return ParallelGzipWriter(fileobj, filename=filename, mtime=mtime,
+                              compression_level=compression_level,
+                              threads=FLAGS.compression_threads)
+  return gzip.GzipFile(filename, fileobj=fileobj, mode="wb",
+                       compresslevel=compression_level, mtime=mtime)
+
+
+def reproducible_tarinfo(tarinfo, timestamp):
+  """Patch TarInfo so that it generates a reproducible archive.
+
+  Args:
+    tarinfo: TarInfo to modify.
+    timestamp: Timestamp to apply to the entry or -1 to keep the existing
+      modification time.
+
+  Returns:
+    Modified tarinfo.
+  """
+  tarinfo.mtime = timestamp if timestamp >= 0 else tarinfo.mtime
+  tarinfo.uid = 0
+  tarinfo.gid = 0
+  tarinfo.uname = FLAGS.owner
+  tarinfo.gname = FLAGS.group
+  return tarinfo
+
+
+class BuildCache(object):
+  """Cache of exported packages indexed by a fingerprint of their inputs.
+
+  Packages are stored in packages/<fingerprint>/<filename> under the cache
+  directory.  Content hashes of source files are stored in file_hashes.json
+  indexed by absolute path along with the size, modification time and inode
+  of each file so that unchanged files are not read again.
+
+  Attributes:
+    _cache_dir: Directory containing the cache.
+    _file_hashes: Dictionary of [size, mtime_ns, inode, sha256] lists
+      indexed by the absolute path of each file.
+    _file_hashes_modified: Whether _file_hashes has been modified since it
+      was loaded.
+  """
+
+  # Changing this invalidates all cached packages.
+  FINGERPRINT_VERSION = 1
+  FILE_HASHES_FILENAME = "file_hashes.json"
+  PACKAGES_DIRECTORY = "packages"
+  # Files modified within this number of seconds of being hashed are not
+  # stored in file_hashes.json as they could be modified again without
+  # changing the size or modification time.
+  RECENTLY_MODIFIED_SECONDS = 2
+  # Flags that change the content of exported packages.
+  FINGERPRINT_FLAGS = ("owner", "group", "use_tar", "stream_archives",
+                       "compression_level", "compression_threads")
+
+  _tool_hash = None
+
+  def __init__(self, cache_dir):
+    """Initialize the cache.
+
+    Args:
+      cache_dir: Directory containing the cache.  This is created when
+        the cache is first written.
+    """
+    self._cache_dir = os.path.realpath(cache_dir)
+    self._file_hashes = self._read_file_hashes()
+    self._file_hashes_modified = False
+
+  @property
+  def cache_dir(self):
+    """Get the directory containing the cache.
+
+    Returns:
+      Path to the cache directory.
+    """
+    return self._cache_dir
+
+  def _read_file_hashes(self):
+    """Read file hashes stored in the cache directory.
+
+    Returns:
+      Dictionary of file hashes or an empty dictionary if the file doesn't
+      exist or is corrupt.
+    """
+    try:
+      with open(os.path.join(self._cache_dir, BuildCache.FILE_HASHES_FILENAME),
+                "rt", encoding="utf8") as file_hashes_file:
+        file_hashes = json.load(file_hashes_file)
+      if isinstance(file_hashes, dict):
+        return file_hashes
+    except (IOError, OSError, ValueError):
+      pass
+    return {}
+
+  def save(self):
+    """Store file hashes in the cache directory.
+
+    Hashes written by other processes since the cache was loaded are
+    preserved.
+    """
+    if not self._file_hashes_modified:
+      return
+    file_hashes = self._read_file_hashes()
+    file_hashes.update(self._file_hashes)
+    temporary_filename = None
+    try:
+      os.makedirs(self._cache_dir, exist_ok=True)
+      file_descriptor, temporary_filename = tempfile.mkstemp(
+          dir=self._cache_dir, prefix=BuildCache.FILE_HASHES_FILENAME)
+      with os.fdopen(file_descriptor, "wt", encoding="utf8") as output_file:
+        json.dump(file_hashes, output_file, sort_keys=True)
+      os.replace(temporary_filename,
+                 os.path.join(self._cache_dir, BuildCache.FILE_HASHES_FILENAME))
+    except (IOError, OSError) as error:
+      logging.warning("Failed to write file hashes to %s (%s)",
+                      self._cache_dir, str(error))
+      if temporary_filename and os.path.exists(temporary_filename):
+        os.unlink(temporary_filename)
+    self._file_hashes = file_hashes
+    self._file_hashes_modified = False
+
+  @staticmethod
+  def _hash_file_contents(path):
+    """Calculate the SHA256 of a file's contents.
+
+    Args:
+      path: File to read.
+
+    Returns:
+      Hex digest string.
+    """
+    hasher = hashlib.sha256()
+    with open(path, "rb") as input_file:
+      for block in iter(lambda: input_file.read(1024 * 1024), b""):
+        hasher.update(block)
+    return hasher.hexdigest()
+
+  def hash_file(self, path, memoize=True):
+    """Get the SHA256 of a file's contents.
+
+    Args:
+      path: File to hash.
+      memoize: Whether to store the hash in file_hashes.json.
+
+    Returns:
+      Hex digest string.
+    """
+    path = os.path.abspath(path)
+    file_stat = os.stat(path)
+    file_state = [file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino]
+    file_hash = self._file_hashes.get(path)
+    if file_hash and file_hash[:3] == file_state:
+      return file_hash[3]
+    digest = BuildCache._hash_file_contents(path)
+    if (memoize and time.time() - file_stat.st_mtime >
+        BuildCache.RECENTLY_MODIFIED_SECONDS):
+      self._file_hashes[path] = file_state + [digest]
+      self._file_hashes_modified = True
+    return digest
+
+  def hash_path(self, path, memoize=True):
+    """Get a list of hashes of a file or all files in a directory.
+
+    Args:
+      path: File or directory to hash.
+      memoize: Whether to store hashes in file_hashes.json.
+
+    Returns:
+      List of (relative_path, sha256) tuples sorted by path.
+    """
+    if not os.path.isdir(path):
+      return [(os.path.basename(path), self.hash_file(path, memoize=memoize))]
+    hashes = []
+    for current_dir, directories, filenames in os.walk(path):
+      directories.sort()
+      for filename in sorted(filenames):
+        file_path = os.path.join(current_dir, filename)
+        hashes.append((posix_path(os.path.relpath(file_path, path)),
+                       self.hash_file(file_path, memoize=memoize)))
+    return hashes
+
+  @staticmethod
+  def tool_hash():
+    """Get the hash of the source of this tool.
+
+    Returns:
+      Hex digest string.
+    """
+    if BuildCache._tool_hash is None:
+      BuildCache._tool_hash = BuildCache._hash_file_contents(
+          os.path.abspath(__file__))
+    return BuildCache._tool_hash
+
+  def fingerprint(self, configuration, assets, guid_database, timestamp,
+                  additional_paths=None, uncached_dir=None):
+    """Calculate the fingerprint of the inputs of a package.
+
+    Args:
+      configuration: JSON serializable object with the effective configuration
+        of the package.
+      assets: List of Asset instances exported by the package.
+      guid_database: GuidDatabase instance which contains GUIDs for each
+        asset.
+      timestamp: Timestamp applied to packaged assets.
+      additional_paths: Files or directories, other than assets, copied into
+        the package.
+      uncached_dir: Directory containing generated files whose hashes should
+        not be stored in file_hashes.json.
+
+    Returns:
+      Hex digest string.
+    """
+    uncached_prefix = (os.path.join(os.path.abspath(uncached_dir), "")
+                       if uncached_dir else None)
+
+    def memoize(path):
+      """Determine whether the hash of a file should be stored.
+
+      Args:
+        path: Path of the file to hash.
+
+      Returns:
+        True if the hash should be stored, False otherwise.
+      """
+      return not (uncached_prefix and
+                  os.path.abspath(path).startswith(uncached_prefix))
+
+    hasher = hashlib.sha256()
+
+    def add(value):
+      """Add a JSON serializable value to the fingerprint.
+
+      Args:
+        value: Value to add.
+      """
+      hasher.update(json.dumps(value, separators=(",", ":"),
+                               default=str).encode("utf8"))
+      hasher.update(b"\n")
+
+    add([BuildCache.FINGERPRINT_VERSION, BuildCache.tool_hash(), timestamp,
+         [(name, FLAGS[name].value)
+          for name in BuildCache.FINGERPRINT_FLAGS],
+         configuration])
+    for asset in Asset.sorted_by_filename(assets):
+      add([asset.filename, asset.filename_guid_lookup,
+           guid_database.get_guid(asset.filename_guid_lookup),
+           asset.is_folder,
+           (None if asset.is_folder else
+            self.hash_file(asset.filename_absolute,
+                           memoize=memoize(asset.filename_absolute))),
+           asset.metadata_fingerprint])
+    for path in additional_paths or []:
+      add(self.hash_path(path, memoize=memoize(path)))
+    return hasher.hexdigest()
+
+  def _package_path(self, fingerprint, filename):
+    """Get the path of a cached package.
+
+    Args:
+      fingerprint: Fingerprint of the package's inputs.
+      filename: Output filename of the package.
+
+    Returns:
+      Path of the package in the cache.
+    """
+    return os.path.join(self._cache_dir, BuildCache.PACKAGES_DIRECTORY,
+                        fingerprint, os.path.basename(filename))
+
+  def restore(self, fingerprint, filename):
+    """Copy a cached package to the output filename if it exists.
+
+    Args:
+      fingerprint: Fingerprint of the package's inputs.
+      filename: Path to copy the package to.
+
+    Returns:
+      True if the package was restored from the cache, False otherwise.
+    """
+    cached_filename = self._package_path(fingerprint, filename)
+    if not os.path.exists(cached_filename):
+      return False
+    output_dir = os.path.dirname(os.path.abspath(filename))
+    if not os.path.exists(output_dir):
+      os.makedirs(output_dir)
+    shutil.copyfile(cached_filename, filename)
+    return True
+
+  def store(self, fingerprint, filename):
+    """Store a package in the cache.
+
+    Args:
+      fingerprint: Fingerprint of the package's inputs.
+      filename: Package to store.
+    """
+    cached_filename = self._package_path(fingerprint, filename)
+    cached_dir = os.path.dirname(cached_filename)
+    temporary_filename = None
+    try:
+      # Packages may be stored concurrently by multiple processes.
+      os.makedirs(cached_dir, exist_ok=True)
+      # Copy then rename so that concurrent exports never observe a partially
+      # written package.
+      file_descriptor, temporary_filename = tempfile.mkstemp(dir=cached_dir)
+      os.close(file_descriptor)
+      shutil.copyfile(filename, temporary_filename)
+      os.replace(temporary_filename, cached_filename)
+    except (IOError, OSError) as error:
+      logging.warning("Failed to cache %s in %s (%s)", filename,
+                      self._cache_dir, str(error))
+      if temporary_filename and os.path.exists(temporary_filename):
+        os.unlink(temporary_filename)
 
 
 class ProjectConfigurationError(Exception):
@@ -1779,6 +4167,10 @@ class AssetConfiguration(ConfigurationBlock):
   Attributes:
     _package: PackageConfiguration instance this asset group was parsed from.
     _json: Dictionary containing the raw asset group configuration.
+    _importer_metadata_template: Read-only importer metadata shared by assets
+      in this group or None if it hasn't been generated yet.
+    _assets_by_format: Dictionary of lists of Asset instances found by
+      find_assets() indexed by (assets_dirs, for_upm) tuples.
   """
 
   def __init__(self, package, asset_json):
@@ -1794,13 +4186,33 @@ class AssetConfiguration(ConfigurationBlock):
     super(AssetConfiguration, self).__init__(asset_json)
     self._package = package
     self._asset_json = asset_json
+    self._importer_metadata_template = None
+    self._assets_by_format = {}
+
+  def __getstate__(self):
+    """Get the state of this asset group without assets found on the filesystem.
+
+    Returns:
+      Dictionary of attributes to pickle.
+    """
+    state = dict(self.__dict__)
+    state["_assets_by_format"] = {}
+    return state
+
+  def release_assets(self):
+    """Release the assets found by find_assets().
+
+    Assets are searched for again the next time find_assets() is called.
+    """
+    self._assets_by_format = {}
 
   @property
   def importer_metadata(self):
     """Get the Unity metadata section used to import this asset.
 
     Returns:
-      Importer section of Unity asset metadata as an OrderedDict.
+      Importer section of Unity asset metadata as an OrderedDict which may
+      reference read-only nodes of metadata templates.
 
     Raises:
       ProjectConfigurationError: If the importer type or the cpu string for a
@@ -1810,7 +4222,7 @@ class AssetConfiguration(ConfigurationBlock):
                                         default_value="DefaultImporter")
     importer_metadata = None
     if importer_type == "DefaultImporter":
-      importer_metadata = copy.deepcopy(DEFAULT_IMPORTER_METADATA_TEMPLATE)
+      importer_metadata = thaw(DEFAULT_IMPORTER_METADATA_TEMPLATE)
     elif importer_type == "PluginImporter":
       platforms = set(safe_dict_get_value(
           self._json, "platforms", default_value=["Editor", "Android", "iOS",
@@ -1839,11 +4251,11 @@ class AssetConfiguration(ConfigurationBlock):
             universal_platforms)
 
       # Enable selected platforms.
-      importer_metadata = copy.deepcopy(PLUGIN_IMPORTER_METADATA_TEMPLATE)
-      platform_data = importer_metadata["PluginImporter"]["platformData"]
+      importer_metadata, platform_data = Asset._thaw_platform_data(
+          PLUGIN_IMPORTER_METADATA_TEMPLATE)
       for target_platform in platforms:
-        platform_data_options = platform_data.get(target_platform,
-                                                  collections.OrderedDict())
+        platform_data_options = thaw(platform_data.get(
+            target_platform, collections.OrderedDict()))
         platform_data[target_platform] = platform_data_options
         platform_data_options["enabled"] = 1
       importer_metadata = Asset.set_cpu_for_desktop_platforms(
@@ -1859,8 +4271,22 @@ class AssetConfiguration(ConfigurationBlock):
       raise ProjectConfigurationError(
           "Unknown importer type %s for package %s, paths %s" % (
               importer_type, self._package.name, str(self.paths)))
-    Asset.add_labels_to_metadata(importer_metadata, self.labels)
-    return importer_metadata
+    return Asset.add_labels_to_metadata(importer_metadata, self.labels)
+
+  @property
+  def importer_metadata_template(self):
+    """Get the read-only importer metadata shared by assets in this group.
+
+    Returns:
+      Read-only copy of importer_metadata that is generated once.
+
+    Raises:
+      ProjectConfigurationError: If the importer type or the cpu string for a
+        PluginImporter is invalid.
+    """
+    if self._importer_metadata_template is None:
+      self._importer_metadata_template = freeze(self.importer_metadata)
+    return self._importer_metadata_template
 
   @property
   def labels(self):
@@ -1910,6 +4336,11 @@ class AssetConfiguration(ConfigurationBlock):
   def find_assets(self, assets_dirs, for_upm=False):
     """Find the assets referenced by the `paths` attribute.
 
+    Assets are searched for and their metadata is read once for both
+    .unitypackage and Unity Package Manager packages.  Assets for Unity
+    Package Manager packages are derived from the .unitypackage assets by
+    merging override_metadata_upm.
+
     Args:
       assets_dirs: List of root directories to search for paths referenced by
         this asset group.
@@ -1920,6 +4351,42 @@ class AssetConfiguration(ConfigurationBlock):
       matching the patterns in the `paths` attribute. All returned paths are
       relative to the specified assets_dir.
     """
+    assets_dirs = tuple(assets_dirs)
+    assets = self._assets_by_format.get((assets_dirs, for_upm))
+    if assets is None:
+      with TRACER.span("find_assets", package=self._package.name,
+                       for_upm=for_upm) as span:
+        if not for_upm:
+          assets = self._discover_assets(assets_dirs)
+        else:
+          assets = self.find_assets(assets_dirs)
+          override_metadata_upm = freeze(self.override_metadata_upm)
+          if override_metadata_upm:
+            file_index = self._package.project.file_index
+            upm_assets = []
+            for asset in assets:
+              asset_metadata = thaw(asset.importer_metadata_original)
+              merge_ordered_dicts(asset_metadata, override_metadata_upm)
+              upm_assets.append(Asset(asset.filename, asset.filename_absolute,
+                                      asset_metadata, file_index=file_index))
+            assets = upm_assets
+        span.set_attribute("assets", len(assets))
+      self._assets_by_format[(assets_dirs, for_upm)] = assets
+    return list(assets)
+
+  def _discover_assets(self, assets_dirs):
+    """Search for the assets referenced by the `paths` attribute.
+
+    Args:
+      assets_dirs: List of root directories to search for paths referenced by
+        this asset group.
+
+    Returns:
+      List of Asset instances sorted by filename with metadata read from each
+      asset's .meta file, or generated by this group, merged with
+      override_metadata.
+    """
+    file_index = self._package.project.file_index
     matching_files = set()
     assets_dir_by_matching_file = {}
     paths_matching_no_files = []
@@ -1927,16 +4394,14 @@ class AssetConfiguration(ConfigurationBlock):
       found_assets = []
       for assets_dir in assets_dirs:
         assets_dir = os.path.normpath(assets_dir)
-        for path in glob.glob(os.path.join(assets_dir, wildcard_path)):
-          if os.path.isdir(path):
-            for current_root, _, files in os.walk(path):
-              for filename in files:
-                if not AssetConfiguration._is_metadata_file(filename):
-                  relative_path = os.path.relpath(os.path.join(
-                      current_root, filename), assets_dir)
-                  found_assets.append(relative_path)
-                  matching_files.add(relative_path)
-                  assets_dir_by_matching_file[relative_path] = assets_dir
+        for path in file_index.glob(os.path.join(assets_dir, wildcard_path)):
+          if file_index.isdir(path):
+            for filename in file_index.walk_files(path):
+              if not AssetConfiguration._is_metadata_file(filename):
+                relative_path = os.path.relpath(filename, assets_dir)
+                found_assets.append(relative_path)
+                matching_files.add(relative_path)
+                assets_dir_by_matching_file[relative_path] = assets_dir
           elif not AssetConfiguration._is_metadata_file(path):
             relative_path = os.path.relpath(path, assets_dir)
             found_assets.append(relative_path)
@@ -1948,7 +4413,10 @@ class AssetConfiguration(ConfigurationBlock):
       logging.warning(
           "Package %s references paths that match no files %s",
           self._package.name, str(paths_matching_no_files))
-    importer_metadata = self.importer_metadata
+    # Metadata shared by all assets in this group is read-only so that each
+    # asset only copies the nodes it modifies.
+    importer_metadata = self.importer_metadata_template
+    override_metadata = freeze(self.override_metadata)
 
     assets = []
     # If metadata exists, read it for each file in this group creating a list
@@ -1957,26 +4425,25 @@ class AssetConfiguration(ConfigurationBlock):
       assets_dir = assets_dir_by_matching_file[filename]
       asset_metadata_filename = os.path.join(
           assets_dir, filename + ASSET_METADATA_FILE_EXTENSION)
-      asset_metadata = copy.deepcopy(importer_metadata)
-      if os.path.exists(asset_metadata_filename):
+      asset_metadata = thaw(importer_metadata)
+      if file_index.exists(asset_metadata_filename):
         existing_asset_metadata = collections.OrderedDict()
-        with open(asset_metadata_filename, "rt", encoding='utf-8') as (
-            asset_metadata_file):
-          existing_asset_metadata = YamlSerializer().load(
-              asset_metadata_file.read())
+        with TRACER.span("parse_metadata", filename=filename) as span:
+          with open(asset_metadata_filename, "rt", encoding='utf-8') as (
+              asset_metadata_file):
+            asset_metadata_yaml = asset_metadata_file.read()
+          span.add_bytes(len(asset_metadata_yaml))
+          existing_asset_metadata = YAML_SERIALIZER.load(asset_metadata_yaml)
         if existing_asset_metadata:
           # If the file already has metadata use it, preserving the labels from
           # this instance.
-          Asset.add_labels_to_metadata(existing_asset_metadata, self.labels)
-          asset_metadata = existing_asset_metadata
+          asset_metadata = Asset.add_labels_to_metadata(
+              existing_asset_metadata, self.labels)
 
-      merge_ordered_dicts(asset_metadata, self.override_metadata)
-      # Override metadata again using "override_metadata_upm"
-      if for_upm:
-        merge_ordered_dicts(asset_metadata, self.override_metadata_upm)
+      merge_ordered_dicts(asset_metadata, override_metadata)
 
       assets.append(Asset(filename, os.path.join(assets_dir, filename),
-                          asset_metadata))
+                          asset_metadata, file_index=file_index))
 
     return Asset.sorted_by_filename(assets)
 
@@ -1999,6 +4466,16 @@ class PackageConfiguration(ConfigurationBlock):
   Attributes:
     _project: ProjectConfiguration instance this package was parsed from.
     _json: Dictionary containing the raw package configuration.
+    _includes_by_sections: Dictionary of lists of transitively included
+      PackageConfiguration instances indexed by frozensets of selected
+      sections.
+    _resolved_assets: Dictionary of (assets, duplicate_assets_errors) tuples
+      found by find_assets() indexed by (sections, for_upm, assets_dirs)
+      tuples.
+    _exclude_path_matcher: PathMatcher for exclude_paths or None if it hasn't
+      been created yet.
+    _imports: List of AssetConfiguration instances parsed from the package
+      or None if they haven't been parsed yet.
   """
 
   def __init__(self, project, package_json):
@@ -2014,21 +4491,53 @@ class PackageConfiguration(ConfigurationBlock):
     super(PackageConfiguration, self).__init__(package_json)
     self._project = project
     self._json = package_json
+    self._includes_by_sections = {}
+    self._resolved_assets = {}
+    self._exclude_path_matcher = None
+    self._imports = None
     if not safe_dict_get_value(self._json, "name",
                                value_classes=STR_OR_UNICODE):
       raise ProjectConfigurationError("Package found with no name")
 
-  @property
-  def name(self):
-    """Get the name of the exported package.
+  def __getstate__(self):
+    """Get the state of this package without assets found on the filesystem.
 
     Returns:
-      Name of package as string.
+      Dictionary of attributes to pickle.
     """
-    return self._json["name"]
+    state = dict(self.__dict__)
+    state["_resolved_assets"] = {}
+    return state
 
-  @property
-  def version(self):
+  def release_assets(self):
+    """Release the assets found for this package and its asset groups.
+
+    Assets are searched for again the next time find_assets() is called.
+    """
+    self._resolved_assets = {}
+    for asset_config in self._imports or []:
+      asset_config.release_assets()
+
+  @property
+  def project(self):
+    """Get the project this package was parsed from.
+
+    Returns:
+      ProjectConfiguration instance.
+    """
+    return self._project
+
+  @property
+  def name(self):
+    """Get the name of the exported package.
+
+    Returns:
+      Name of package as string.
+    """
+    return self._json["name"]
+
+  @property
+  def version(self):
     """Get the version of this project.
 
     Returns:
@@ -2149,12 +4658,14 @@ class PackageConfiguration(ConfigurationBlock):
       ProjectConfigurationError: If any referenced packages are not present
         in the project.
     """
-    packages_by_name = self._project.packages_by_name
+    sections = frozenset(self._project.selected_sections)
+    if recursive and sections in self._includes_by_sections:
+      return list(self._includes_by_sections[sections])
     included_packages_by_name = {}
     missing_package_names = []
     for include_package_name in safe_dict_get_value(self._json, "includes",
                                                     default_value=[]):
-      package = packages_by_name.get(include_package_name)
+      package = self._project.get_package(include_package_name)
       if package:
         included_packages_by_name[package.name] = package
         if recursive:
@@ -2166,7 +4677,10 @@ class PackageConfiguration(ConfigurationBlock):
       raise ProjectConfigurationError(
           "%s includes missing packages %s" % (
               self.name, missing_package_names))
-    return list(included_packages_by_name.values())
+    included_packages = list(included_packages_by_name.values())
+    if recursive:
+      self._includes_by_sections[sections] = included_packages
+    return list(included_packages)
 
   @property
   def includes(self):
@@ -2181,15 +4695,22 @@ class PackageConfiguration(ConfigurationBlock):
     """
     return self._get_includes()
 
-  def check_circular_references_in_includes(self, parents):
+  def check_circular_references_in_includes(self, parents,
+                                            checked_package_names=None):
     """Searches for circular references in includes.
 
     Args:
       parents: List of parents packages including this package.
+      checked_package_names: Set of names of packages whose includes have
+        already been checked, which is updated with the names of the packages
+        checked by this method.  If this is None all includes are checked.
 
     Raises:
       ProjectConfigurationError: If a circular reference is detected.
     """
+    if (checked_package_names is not None and
+        self.name in checked_package_names):
+      return
     parent_names = [parent.name for parent in parents]
     if self.name in parent_names:
       raise ProjectConfigurationError(
@@ -2197,8 +4718,11 @@ class PackageConfiguration(ConfigurationBlock):
            "included by [%s]") % (self.name, " --> ".join(parent_names)))
     for include in self._get_includes(recursive=False):
       parents.append(self)
-      include.check_circular_references_in_includes(parents)
+      include.check_circular_references_in_includes(parents,
+                                                    checked_package_names)
       del parents[-1]
+    if checked_package_names is not None:
+      checked_package_names.add(self.name)
 
   @property
   def export(self):
@@ -2221,6 +4745,19 @@ class PackageConfiguration(ConfigurationBlock):
             for path in safe_dict_get_value(self._json, "exclude_paths",
                                             default_value=[])]
 
+  @property
+  def exclude_path_matcher(self):
+    """Get a matcher for the paths that should be excluded from this package.
+
+    Returns:
+      PathMatcher that matches paths which should be excluded from this
+      package.
+    """
+    if self._exclude_path_matcher is None:
+      self._exclude_path_matcher = PathMatcher(
+          safe_dict_get_value(self._json, "exclude_paths", default_value=[]))
+    return self._exclude_path_matcher
+
   def find_assets(self, assets_dirs, check_for_duplicates=True, for_upm=False):
     """Find all assets referenced by this package.
 
@@ -2238,6 +4775,54 @@ class PackageConfiguration(ConfigurationBlock):
       ProjectConfigurationError: If more than one file has been included with
         different import settings.
     """
+    return list(self._find_shared_assets(assets_dirs, check_for_duplicates,
+                                         for_upm))
+
+  def _find_shared_assets(self, assets_dirs, check_for_duplicates, for_upm):
+    """Find all assets referenced by this package without copying the list.
+
+    Args:
+      assets_dirs: List of paths to directories to search for files referenced
+        by this package.
+      check_for_duplicates: Whether to raise an exception when duplicate assets
+        are found with different import settings.
+      for_upm: Whether this is for packaging for UPM package.
+
+    Returns:
+      List of Asset instances sorted by filename that is shared with
+      subsequent calls so must not be modified.
+
+    Raises:
+      ProjectConfigurationError: If more than one file has been included with
+        different import settings.
+    """
+    # Assets are resolved once for each set of sections so that packages
+    # included by multiple packages are only searched once.
+    key = (frozenset(self._project.selected_sections), for_upm,
+           tuple(assets_dirs))
+    resolved_assets = self._resolved_assets.get(key)
+    if resolved_assets is None:
+      resolved_assets = self._resolve_assets(assets_dirs, for_upm)
+      self._resolved_assets[key] = resolved_assets
+    found_assets, duplicate_assets_errors = resolved_assets
+    if check_for_duplicates and duplicate_assets_errors:
+      raise ProjectConfigurationError("\n".join(duplicate_assets_errors))
+    return found_assets
+
+  def _resolve_assets(self, assets_dirs, for_upm):
+    """Search for all assets referenced by this package.
+
+    Args:
+      assets_dirs: List of paths to directories to search for files referenced
+        by this package.
+      for_upm: Whether this is for packaging for UPM package.
+
+    Returns:
+      (assets, duplicate_assets_errors) tuple where assets is a list of Asset
+      instances for all files imported by this package and
+      duplicate_assets_errors is a list of error messages for files included
+      more than once with different import settings.
+    """
     # Dictionary of asset lists indexed by package name.
     assets_by_package_name = collections.defaultdict(list)
     for asset_config in self.imports:
@@ -2250,7 +4835,7 @@ class PackageConfiguration(ConfigurationBlock):
       for package in self.includes:
         logging.debug("%s including assets from %s", self.name, package.name)
         assets_by_package_name[package.name].extend(
-            package.find_assets(assets_dirs, check_for_duplicates=False))
+            package._find_shared_assets(assets_dirs, False, False))
 
     package_and_assets_by_filename = collections.defaultdict(list)
     for package_name, assets in assets_by_package_name.items():
@@ -2267,10 +4852,16 @@ class PackageConfiguration(ConfigurationBlock):
       differing_metadata_packages = set()
       previous_package_name = None
       previous_asset = None
+      # If all assets have the same metadata fingerprint they're identical.
+      if len(set([asset.metadata_fingerprint
+                  for _, asset in package_and_assets])) == 1:
+        continue
       for package_and_asset in package_and_assets:
         package_name, asset = package_and_asset
-        if previous_package_name and (previous_asset.importer_metadata !=
-                                      asset.importer_metadata):
+        if previous_package_name and (
+            previous_asset.metadata_fingerprint !=
+            asset.metadata_fingerprint and
+            previous_asset.importer_metadata != asset.importer_metadata):
           differing_metadata_packages.add(previous_package_name)
           differing_metadata_packages.add(package_name)
         previous_package_name = package_name
@@ -2280,31 +4871,21 @@ class PackageConfiguration(ConfigurationBlock):
         duplicate_assets_errors.append(
             ("File %s imported with different import settings in "
              "packages %s") % (filename, sorted(differing_metadata_packages)))
-    if check_for_duplicates and duplicate_assets_errors:
-      raise ProjectConfigurationError("\n".join(duplicate_assets_errors))
 
     # Deduplicate the list of assets that were found.
     found_assets = Asset.sorted_by_filename(
-        [package_and_assets[0][1] for package_and_assets in (
-            package_and_assets_by_filename.values())])
+        package_and_assets[0][1] for package_and_assets in (
+            package_and_assets_by_filename.values()))
 
     # Filter out excluded assets.
-    exclude_paths = self.exclude_paths
-    if exclude_paths:
-      assets_with_exclusions_removed = []
-      for asset in found_assets:
-        include = True
-        for exclude_path in exclude_paths:
-          if exclude_path.match(asset.filename):
-            include = False
-            break
-        if include:
-          assets_with_exclusions_removed.append(asset)
-      found_assets = assets_with_exclusions_removed
+    exclude_path_matcher = self.exclude_path_matcher
+    if exclude_path_matcher:
+      found_assets = [asset for asset in found_assets
+                      if not exclude_path_matcher.match(asset.filename)]
 
     logging.debug("Found assets for package %s: %s", self.name,
                   [asset.filename for asset in found_assets])
-    return found_assets
+    return (found_assets, duplicate_assets_errors)
 
   @property
   def manifest_path(self):
@@ -2363,7 +4944,6 @@ class PackageConfiguration(ConfigurationBlock):
     if (manifest_type == VERSION_HANDLER_MANIFEST_TYPE_LEGACY and
         not self.manifest_filename):
       return None
-    metadata = copy.deepcopy(DEFAULT_METADATA_TEMPLATE)
     labels = self.labels
     if manifest_type == VERSION_HANDLER_MANIFEST_TYPE_LEGACY:
       labels.add(
@@ -2387,17 +4967,17 @@ class PackageConfiguration(ConfigurationBlock):
       # gupmr_manifest
       labels.add(UPM_RESOLVER_LABEL_PREFIX + UPM_RESOLVER_FIELD_SEPARATOR +
                  UPM_RESOLVER_MANIFEST_FIELD_PREFIX)
-    Asset.add_labels_to_metadata(metadata, labels)
+    return Asset.add_labels_to_metadata(DEFAULT_METADATA_TEMPLATE, labels)
 
-    return metadata
-
-  def write_manifest(self, output_dir, assets):
+  def write_manifest(self, output_dir, assets, write_file=True):
     """Write the manifest for this package to the specified directory.
 
     Args:
       output_dir: Directory to write the manifest into.
       assets: Assets to write to the manifest, typically returned by
         find_assets().
+      write_file: Whether to write the manifest file.  If this is False only
+        the asset that references the manifest is created.
 
     Returns:
       Asset instance that references the generated manifest.
@@ -2406,14 +4986,16 @@ class PackageConfiguration(ConfigurationBlock):
     if not manifest_filename:
       return None
     manifest_absolute_path = os.path.join(output_dir, manifest_filename)
-    manifest_directory = os.path.dirname(manifest_absolute_path)
-    if not os.path.exists(manifest_directory):
-      os.makedirs(manifest_directory)
-    with open(manifest_absolute_path, "wt", encoding='utf-8') as manifest_file:
-      manifest_file.write(
-          "%s\n" % "\n".join([posix_path(os.path.join(ASSETS_DIRECTORY,
-                                                      asset.filename))
-                              for asset in Asset.sorted_by_filename(assets)]))
+    if write_file:
+      manifest_directory = os.path.dirname(manifest_absolute_path)
+      if not os.path.exists(manifest_directory):
+        os.makedirs(manifest_directory)
+      with open(manifest_absolute_path, "wt", encoding='utf-8') as (
+          manifest_file):
+        manifest_file.write(
+            "%s\n" % "\n".join([posix_path(os.path.join(ASSETS_DIRECTORY,
+                                                        asset.filename))
+                                for asset in Asset.sorted_by_filename(assets)]))
     # Retrieve a template manifest asset if it exists.
     manifest_asset = [asset for asset in assets
                       if asset.filename == manifest_filename]
@@ -2421,11 +5003,14 @@ class PackageConfiguration(ConfigurationBlock):
       Asset(manifest_filename, manifest_absolute_path,
             self.get_manifest_metadata(VERSION_HANDLER_MANIFEST_TYPE_LEGACY)))
 
-  def write_upm_manifest(self, output_dir):
+  def write_upm_manifest(self, output_dir, write_file=True):
     """Write UPM manifest for this package to the specified directory.
 
     Args:
       output_dir: Directory to write the manifest into.
+      write_file: Whether to write the manifest file.  If this is False the
+        manifest is only validated and the asset that references the manifest
+        is created.
 
     Returns:
       Asset instance that references the generated manifest.
@@ -2437,9 +5022,6 @@ class PackageConfiguration(ConfigurationBlock):
 
     manifest_filename = "package.json"
     manifest_absolute_path = os.path.join(output_dir, manifest_filename)
-    manifest_directory = os.path.dirname(manifest_absolute_path)
-    if not os.path.exists(manifest_directory):
-      os.makedirs(manifest_directory)
 
     # Compose package.json
     package_manifest = {}
@@ -2503,8 +5085,13 @@ class PackageConfiguration(ConfigurationBlock):
            "\n%s") % (self.name, "\n".join(missing_deps)))
     package_manifest["dependencies"] = dependencies
 
-    with open(manifest_absolute_path, "wt", encoding='utf-8') as manifest_file:
-      json.dump(package_manifest, manifest_file, indent=2)
+    if write_file:
+      manifest_directory = os.path.dirname(manifest_absolute_path)
+      if not os.path.exists(manifest_directory):
+        os.makedirs(manifest_directory)
+      with open(manifest_absolute_path, "wt", encoding='utf-8') as (
+          manifest_file):
+        json.dump(package_manifest, manifest_file, indent=2)
 
     return Asset(
         manifest_filename,
@@ -2520,9 +5107,11 @@ class PackageConfiguration(ConfigurationBlock):
     Returns:
       List of AssetConfiguration instances.
     """
-    return [AssetConfiguration(self, import_json)
-            for import_json in safe_dict_get_value(self._json, "imports",
-                                                   default_value=[])]
+    if self._imports is None:
+      self._imports = [AssetConfiguration(self, import_json)
+                       for import_json in safe_dict_get_value(
+                           self._json, "imports", default_value=[])]
+    return list(self._imports)
 
   @property
   def labels(self):
@@ -2551,99 +5140,462 @@ class PackageConfiguration(ConfigurationBlock):
         or -1 to use the current time.
     """
     archive_filename = os.path.realpath(archive_filename)
-    cwd = os.getcwd()
-    try:
-      os.chdir(input_directory)
-      # Create a deterministically ordered set of filesystem entries.
-      input_filenames = []
-      for current_dir, directories, filenames in os.walk(os.path.curdir):
-        for directory in directories:
-          input_filenames.append(os.path.join(current_dir, directory))
-        for filename in filenames:
-          input_filenames.append(os.path.join(current_dir, filename))
-      input_filenames = sorted(
-          [os.path.normpath(filename) for filename in input_filenames])
-
-      archive_dir = os.path.dirname(archive_filename)
-      if not os.path.exists(archive_dir):
-        os.makedirs(archive_dir)
-
-      # Create a tar.gz archive.
-      tar_available = (platform.system() == "Linux" or
-                       platform.system() == "Darwin")
-      gnu_tar_available = platform.system() == "Linux"
-      # Whether a reproducible tar.gz is required.
-      if tar_available and FLAGS.use_tar:
-        # tarfile is 10x slower than the tar command so use the command line
-        # tool where it's available and can generate a reproducible archive.
-        list_filename = os.path.join(tempfile.mkdtemp(), "input_files.txt")
-        try:
-          # Create a list of input files to workaround command line length
-          # limits.
-          with open(list_filename, "wt", encoding='utf-8') as list_file:
-            list_file.write("%s\n" % "\n".join(input_filenames))
-
-          tar_args = ["tar"]
+    input_directory = os.path.realpath(input_directory)
+    # Create a deterministically ordered set of filesystem entries relative to
+    # the input directory.  All paths are explicit rather than relative to the
+    # current directory so that archives can be created concurrently.
+    input_filenames = []
+    for current_dir, directories, filenames in os.walk(input_directory):
+      relative_dir = os.path.relpath(current_dir, input_directory)
+      for filename in directories + filenames:
+        input_filenames.append(
+            os.path.normpath(os.path.join(relative_dir, filename)))
+    input_filenames = sorted(input_filenames)
+
+    archive_dir = os.path.dirname(archive_filename)
+    if not os.path.exists(archive_dir):
+      os.makedirs(archive_dir, exist_ok=True)
+
+    # Create a tar.gz archive.
+    tar_available = (platform.system() == "Linux" or
+                     platform.system() == "Darwin")
+    gnu_tar_available = platform.system() == "Linux"
+    # Whether a reproducible tar.gz is required.  Files staged using the
+    # hardlink copy strategy are archived with tarfile so that permissions
+    # of the linked files can be set in the archive.
+    if (tar_available and FLAGS.use_tar and
+        FLAGS.copy_strategy != "hardlink"):
+      # tarfile is 10x slower than the tar command so use the command line
+      # tool where it's available and can generate a reproducible archive.
+      list_filename = os.path.join(tempfile.mkdtemp(), "input_files.txt")
+      try:
+        # Create a list of input files to workaround command line length
+        # limits.
+        with open(list_filename, "wt", encoding='utf-8') as list_file:
+          list_file.write("%s\n" % "\n".join(input_filenames))
+
+        # Compress the archive with ParallelGzipWriter when multiple
+        # compression threads are requested, otherwise use tar / gzip.
+        compress_with_tar = FLAGS.compression_threads == 1
+        tar_args = ["tar"]
+        if compress_with_tar:
           tar_args.extend(["-c", "-z", "-f", archive_filename])
-          if gnu_tar_available:
-            if FLAGS.timestamp:
-              tar_args.append("--mtime=@%d" % FLAGS.timestamp)
-            # Hard code the user and group of files in the tar file so that
-            # the process is reproducible.
-            tar_args.extend(["--owner=%s" % FLAGS.owner,
-                             "--group=%s" % FLAGS.group])
-            tar_args.append("--no-recursion")
-          else: # Assume BSD tar.
-            # Set the modification time of each file since BSD tar doesn't have
-            # an option to override this.
-            if FLAGS.timestamp:
-              for filename in input_filenames:
-                os.utime(filename, (FLAGS.timestamp, FLAGS.timestamp))
-            # Don't recurse directories.
-            tar_args.append("-n")
-            # Avoid creating mac metadata files with name started with "."
-            if platform.system() == "Darwin":
-              tar_args.append("--no-mac-metadata")
-          tar_args.extend(["-T", list_filename])
-          # Disable timestamp in the gzip header.
-          tar_env = os.environ.copy()
-          tar_env["GZIP"] = "-n"
+        else:
+          tar_args.extend(["-c", "-f", "-"])
+        if gnu_tar_available:
+          if FLAGS.timestamp:
+            tar_args.append("--mtime=@%d" % FLAGS.timestamp)
+          # Hard code the user and group of files in the tar file so that
+          # the process is reproducible.
+          tar_args.extend(["--owner=%s" % FLAGS.owner,
+                           "--group=%s" % FLAGS.group])
+          tar_args.append("--no-recursion")
+        else: # Assume BSD tar.
+          # Set the modification time of each file since BSD tar doesn't have
+          # an option to override this.
+          if FLAGS.timestamp:
+            for filename in input_filenames:
+              os.utime(os.path.join(input_directory, filename),
+                       (FLAGS.timestamp, FLAGS.timestamp))
+          # Don't recurse directories.
+          tar_args.append("-n")
+          # Avoid creating mac metadata files with name started with "."
+          if platform.system() == "Darwin":
+            tar_args.append("--no-mac-metadata")
+        tar_args.extend(["-C", input_directory, "-T", list_filename])
+        # Disable timestamp in the gzip header.
+        tar_env = os.environ.copy()
+        tar_env["GZIP"] = "-n"
+        if FLAGS.compression_level is not None:
+          tar_env["GZIP"] += " -%d" % FLAGS.compression_level
+        if compress_with_tar:
           subprocess.check_call(tar_args, cwd=input_directory, env=tar_env)
-        finally:
-          shutil.rmtree(os.path.dirname(list_filename))
+        else:
+          with open(archive_filename, "wb") as gzipped_tar_file:
+            # Like gzip -n, don't store the filename or timestamp.
+            with ParallelGzipWriter(
+                gzipped_tar_file, mtime=0,
+                compression_level=(
+                    DEFAULT_COMPRESSION_LEVEL
+                    if FLAGS.compression_level is None
+                    else FLAGS.compression_level),
+                threads=FLAGS.compression_threads) as gzip_file:
+              tar_process = subprocess.Popen(tar_args, cwd=input_directory,
+                                             stdout=subprocess.PIPE)
+              copied = False
+              try:
+                shutil.copyfileobj(tar_process.stdout, gzip_file,
+                                   PARALLEL_GZIP_BLOCK_SIZE)
+                copied = True
+              finally:
+                tar_process.stdout.close()
+                # Don't leave tar running, or a zombie, if the copy failed.
+                if not copied:
+                  tar_process.kill()
+                  tar_process.wait()
+              if tar_process.wait():
+                raise subprocess.CalledProcessError(tar_process.returncode,
+                                                    tar_args)
+      finally:
+        shutil.rmtree(os.path.dirname(list_filename))
+    else:
+      def staged_tarinfo(tarinfo):
+        """Apply the permissions of assets staged using hard links.
+
+        Args:
+          tarinfo: TarInfo to modify.
+
+        Returns:
+          Modified tarinfo.
+        """
+        if (FLAGS.copy_strategy == "hardlink" and tarinfo.isfile() and
+            os.stat(os.path.join(input_directory,
+                                 tarinfo.name)).st_nlink > 1):
+          tarinfo.mode = ARCHIVE_ASSET_FILE_MODE
+        return tarinfo
+
+      with open(archive_filename, "wb") as gzipped_tar_file:
+        with open_gzip_stream(
+            gzipped_tar_file,
+            archive_header_filename(archive_filename),
+            timestamp) as gzip_file:
+          with tarfile.open(mode="w|", fileobj=gzip_file,
+                            format=tarfile.USTAR_FORMAT, dereference=True,
+                            errorlevel=2) as tar_file:
+            for filename in input_filenames:
+              tar_file.add(
+                  os.path.join(input_directory, filename), arcname=filename,
+                  recursive=False,
+                  filter=lambda tarinfo: reproducible_tarinfo(
+                      staged_tarinfo(tarinfo), timestamp))
+              if FLAGS.bounded_memory:
+                del tar_file.members[:]
+
+  @staticmethod
+  def create_archives(archives, timestamp, threads=0):
+    """Create .unitypackage archives from directories concurrently.
+
+    Args:
+      archives: List of (archive_filename, input_directory) tuples that
+        describe each archive to create.  See create_archive().
+      timestamp: Timestamp to apply to the archives and all files in the
+        archives or -1 to use the current time.
+      threads: Number of archives to create at the same time.  If this is less
+        than 1 the number of CPUs is used.
+
+    Returns:
+      List of archive filenames in the same order as `archives`.
+
+    Raises:
+      ValueError: If the same archive filename is specified more than once.
+    """
+    archive_filenames = [os.path.realpath(archive_filename)
+                         for archive_filename, _ in archives]
+    if len(set(archive_filenames)) != len(archive_filenames):
+      raise ValueError("Archives %s are created more than once" % sorted(set(
+          [filename for filename in archive_filenames
+           if archive_filenames.count(filename) > 1])))
+    if threads < 1:
+      threads = os.cpu_count() or 1
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as (
+        executor):
+      futures = [executor.submit(PackageConfiguration.create_archive,
+                                 archive_filename, input_directory, timestamp)
+                 for archive_filename, input_directory in archives]
+      # Raise the exception of the first archive that failed.
+      for future in futures:
+        future.result()
+    return [archive_filename for archive_filename, _ in archives]
+
+  @staticmethod
+  def write_archive(archive_filename, entries, timestamp, sort_entries=True):
+    """Create a .unitypackage archive from a set of archive entries.
+
+    Unlike create_archive() the archived files do not need to be staged in a
+    directory.  The contents of each entry are streamed from the entry's source
+    file, or from memory for generated files, into the compressed archive.
+
+    Args:
+      archive_filename: Name of the archive file to create.
+      entries: ArchiveEntry instances to store in the archive.
+      timestamp: Timestamp to apply to the archive and all files in the archive
+        or -1 to use the modification time of each source file.
+      sort_entries: Whether to sort entries by archive name.  If this is False
+        entries must be generated in order of archive name, this allows
+        entries to be generated as they're archived.
+    """
+    archive_filename = os.path.realpath(archive_filename)
+    archive_dir = os.path.dirname(archive_filename)
+    if not os.path.exists(archive_dir):
+      os.makedirs(archive_dir)
+    current_time = int(time.time())
+
+    with open(archive_filename, "wb") as gzipped_tar_file:
+      with open_gzip_stream(
+          gzipped_tar_file,
+          archive_header_filename(archive_filename),
+          timestamp) as gzip_file:
+        with tarfile.open(mode="w|", fileobj=gzip_file,
+                          format=tarfile.USTAR_FORMAT,
+                          errorlevel=2) as tar_file:
+          # Create a deterministically ordered set of entries.
+          if sort_entries:
+            entries = sorted(entries, key=lambda entry: entry.arcname)
+          for entry in entries:
+            tarinfo = tarfile.TarInfo(entry.arcname)
+            tarinfo.mode = entry.mode
+            tarinfo.mtime = current_time
+            if entry.is_directory:
+              tarinfo.type = tarfile.DIRTYPE
+              tar_file.addfile(reproducible_tarinfo(tarinfo, timestamp))
+            elif entry.source_filename:
+              with open(entry.source_filename, "rb") as source_file:
+                source_stat = os.fstat(source_file.fileno())
+                tarinfo.size = source_stat.st_size
+                tarinfo.mtime = int(source_stat.st_mtime)
+                tar_file.addfile(reproducible_tarinfo(tarinfo, timestamp),
+                                 source_file)
+            else:
+              data = entry.data or b""
+              tarinfo.size = len(data)
+              tar_file.addfile(reproducible_tarinfo(tarinfo, timestamp),
+                               io.BytesIO(data))
+            if FLAGS.bounded_memory:
+              # TarFile retains the header of each member which isn't required
+              # to write a stream.
+              del tar_file.members[:]
+
+  @staticmethod
+  def _generate_archive_entries(assets, guid_database, timestamp):
+    """Generate the archive entries of assets in order of archive name.
+
+    The metadata of each asset is generated as its entries are archived and
+    released once they have been archived.
+
+    Args:
+      assets: List of Asset instances to archive.
+      guid_database: GuidDatabase instance which contains GUIDs for each
+        asset.
+      timestamp: Timestamp to write into the metadata of each asset.
+
+    Yields:
+      ArchiveEntry instances sorted by archive name.
+    """
+    # The entries of each asset are stored in a directory named after the
+    # asset's GUID so ordering assets by GUID orders the entries.
+    for guid, asset in sorted(
+        [(guid_database.get_guid(asset.filename_guid_lookup), asset)
+         for asset in assets], key=operator.itemgetter(0)):
+      for entry in asset.archive_entries(guid, timestamp):
+        yield entry
+      asset.release_metadata()
+      logging.info("- Processed %s --> %s", asset.filename, guid)
+
+  def _reuse_output(self, output_fingerprint, package_file):
+    """Link a package with the same content to the output file if it exists.
+
+    Args:
+      output_fingerprint: Fingerprint of the content of the package, see
+        _output_fingerprint().
+      package_file: Path of the package file to write.
+
+    Returns:
+      True if a package with the same content was linked to package_file,
+      False otherwise.
+    """
+    identical_package_file = self._project.find_output(output_fingerprint)
+    if (not identical_package_file or
+        os.path.abspath(identical_package_file) ==
+        os.path.abspath(package_file)):
+      return False
+    link_or_copy_archive(identical_package_file, package_file)
+    logging.info("Linked %s for %s to identical package %s", package_file,
+                 self.name, identical_package_file)
+    return True
+
+  def _output_fingerprint(self, assets, guid_database, timestamp, for_upm,
+                          generated_dir, additional_paths=None):
+    """Calculate the fingerprint of the content of this package.
+
+    Unlike _fingerprint() the fingerprint doesn't depend upon the package
+    filename or configuration, so packages with the same content exported by
+    different build configurations have the same fingerprint.  Source files are
+    identified by their path, size and modification time rather than content.
+
+    Args:
+      assets: List of Asset instances exported by this package.
+      guid_database: GuidDatabase instance which contains GUIDs for each
+        asset.
+      timestamp: Timestamp applied to packaged assets.
+      for_upm: Whether the package is exported for Unity Package Manager.
+      generated_dir: Directory containing files generated for this package.
+      additional_paths: Files or directories, other than assets, copied into
+        the package.
+
+    Returns:
+      Hex digest string.
+    """
+    generated_prefix = os.path.join(os.path.abspath(generated_dir), "")
+    hasher = hashlib.sha256()
+
+    def add(value):
+      """Add a JSON serializable value to the fingerprint.
+
+      Args:
+        value: Value to add.
+      """
+      hasher.update(json.dumps(value, separators=(",", ":")).encode("utf8"))
+      hasher.update(b"\n")
+
+    def file_state(path):
+      """Get a list that identifies the content of a file.
+
+      Args:
+        path: File to query.
+
+      Returns:
+        List of the form [path, size, mtime_ns] for source files or [sha256]
+        for files generated for this package.
+      """
+      if os.path.abspath(path).startswith(generated_prefix):
+        with open(path, "rb") as generated_file:
+          return [hashlib.sha256(generated_file.read()).hexdigest()]
+      file_stat = os.stat(path)
+      return [os.path.abspath(path), file_stat.st_size, file_stat.st_mtime_ns]
+
+    add([for_upm, timestamp, self._project.version,
+         [(name, FLAGS[name].value)
+          for name in BuildCache.FINGERPRINT_FLAGS]])
+    for path in additional_paths or []:
+      if os.path.isdir(path):
+        for current_dir, _, filenames in sorted(os.walk(path)):
+          add([file_state(os.path.join(current_dir, filename))
+               for filename in sorted(filenames)])
       else:
-        with open(archive_filename, "wb") as gzipped_tar_file:
-          with gzip.GzipFile(
-              # The filename in the archive must end with .tar or .tar.gz for
-              # Unity to open it on Windows.
-              os.path.splitext(archive_filename)[0] + ".tar.gz",
-              fileobj=gzipped_tar_file, mode="wb",
-              mtime=(timestamp if timestamp >= 0 else None)) as gzip_file:
-            with tarfile.open(mode="w|", fileobj=gzip_file,
-                              format=tarfile.USTAR_FORMAT, dereference=True,
-                              errorlevel=2) as tar_file:
-              def reproducible_tarinfo(tarinfo):
-                """Patch TarInfo so that it generates a reproducible archive.
-
-                Args:
-                  tarinfo: TarInfo to modify.
-
-                Returns:
-                  Modified tarinfo.
-                """
-                tarinfo.mtime = timestamp if timestamp >= 0 else tarinfo.mtime
-                tarinfo.uid = 0
-                tarinfo.gid = 0
-                tarinfo.uname = FLAGS.owner
-                tarinfo.gname = FLAGS.group
-                return tarinfo
-
-              for filename in input_filenames:
-                tar_file.add(filename, recursive=False,
-                             filter=reproducible_tarinfo)
+        add(file_state(path))
+    for asset in Asset.sorted_by_filename(assets):
+      add([asset.filename, asset.filename_guid_lookup,
+           guid_database.get_guid(asset.filename_guid_lookup),
+           asset.is_folder, asset.metadata_fingerprint,
+           None if asset.is_folder else file_state(asset.filename_absolute)])
+      if FLAGS.bounded_memory:
+        asset.release_metadata()
+    return hasher.hexdigest()
+
+  def _fingerprint(self, assets, guid_database, timestamp, package_filename,
+                   for_upm, generated_dir, additional_paths=None):
+    """Calculate the fingerprint of the inputs of this package.
 
-    finally:
-      os.chdir(cwd)
+    Args:
+      assets: List of Asset instances exported by this package.
+      guid_database: GuidDatabase instance which contains GUIDs for each
+        asset.
+      timestamp: Timestamp applied to packaged assets.
+      package_filename: Filename the package is written to.
+      for_upm: Whether the package is exported for Unity Package Manager.
+      generated_dir: Directory containing files generated for this package.
+      additional_paths: Files or directories, other than assets, copied into
+        the package.
+
+    Returns:
+      Fingerprint string or None if the build cache is disabled or the
+      package can't be cached.
+    """
+    build_cache = self._project.build_cache
+    # Packages that use the time of each input file are not reproducible.
+    if not build_cache or timestamp < 0:
+      return None
+    return build_cache.fingerprint(
+        collections.OrderedDict([
+            ("package", self._json),
+            ("includes", [package._json for package in self.includes]),
+            ("package_filename", package_filename),
+            ("for_upm", for_upm),
+            ("version", self._project.version),
+            ("sections", sorted(self._project.selected_sections))]),
+        assets, guid_database, timestamp, additional_paths=additional_paths,
+        uncached_dir=generated_dir)
+
+  def get_exported_assets(self, assets_dirs, generated_assets_dir,
+                          for_upm=False, write_files=True):
+    """Get the assets exported by this package including generated manifests.
+
+    Args:
+      assets_dirs: List of paths to directories to search for files referenced
+        by this package.
+      generated_assets_dir: Directory to write generated manifests to.
+      for_upm: Whether to get the assets of a Unity Package Manager package.
+      write_files: Whether to write generated manifests.  If this is False,
+        manifests are validated and assets that reference them are created
+        without writing any files.
+
+    Returns:
+      List of Asset instances.
+
+    Raises:
+      ProjectConfigurationError: If files are imported multiple times with
+        different metadata or the package is misconfigured.
+    """
+    if for_upm:
+      assets = self.find_assets(assets_dirs, for_upm=True)
+
+      # Create package.json
+      manifest_asset = self.write_upm_manifest(generated_assets_dir,
+                                               write_file=write_files)
+      if manifest_asset:
+        assets.append(manifest_asset)
+
+      manifest_asset = self.write_manifest(generated_assets_dir, assets,
+                                           write_file=write_files)
+      if manifest_asset:
+        assets.append(manifest_asset)
+
+      return self._add_upm_layout_assets(assets, assets_dirs)
+
+    assets = self.find_assets(assets_dirs)
+    # If a manifest is enabled, write it into the assets directory.
+    manifest_asset = self.write_manifest(generated_assets_dir, assets,
+                                         write_file=write_files)
+    if manifest_asset:
+      assets.append(manifest_asset)
+
+    # Add manifest files for the include packages
+    for include_package in self.includes:
+      include_manifest_asset = include_package.write_manifest(
+          generated_assets_dir, include_package.find_assets(assets_dirs),
+          write_file=write_files)
+      if include_manifest_asset:
+        assets.append(include_manifest_asset)
+    return assets
+
+  def get_contents(self, guid_database, assets_dirs, for_upm=False):
+    """Resolve the contents of this package without writing it.
+
+    Args:
+      guid_database: GuidDatabase instance which contains GUIDs for each
+        exported asset.
+      assets_dirs: List of paths to directories to search for files referenced
+        by this package.
+      for_upm: Whether to resolve the contents of a Unity Package Manager
+        package.
+
+    Returns:
+      List of (filename, guid, metadata_fingerprint) tuples for each asset in
+      the package sorted by filename.
+
+    Raises:
+      MissingGuidsError: If GUIDs are missing for input files.
+      DuplicateGuidsError: If any duplicate GUIDs are present.
+      ProjectConfigurationError: If files are imported multiple times with
+        different metadata or the package is misconfigured.
+    """
+    assets = self.get_exported_assets(assets_dirs, "", for_upm=for_upm,
+                                      write_files=False)
+    guid_database.read_guids_from_assets(assets)
+    return [(asset.filename,
+             guid_database.get_guid(asset.filename_guid_lookup),
+             asset.metadata_fingerprint)
+            for asset in Asset.sorted_by_filename(assets)]
 
   def write(self, guid_database, assets_dirs, output_dir, timestamp,
             package_filename=None):
@@ -2685,39 +5637,155 @@ class PackageConfiguration(ConfigurationBlock):
 
       logging.info("Packaging %s to %s...", self.name, unity_package_file)
 
-      assets = self.find_assets(assets_dirs)
-      # If a manifest is enabled, write it into the assets directory.
-      manifest_asset = self.write_manifest(generated_assets_dir, assets)
-      if manifest_asset:
-        assets.append(manifest_asset)
-
-      # Add manifest files for the include packages
-      for include_package in self.includes:
-        include_manifest_asset = include_package.write_manifest(
-            generated_assets_dir, include_package.find_assets(assets_dirs))
-        if include_manifest_asset:
-          assets.append(include_manifest_asset)
+      assets = self.get_exported_assets(assets_dirs, generated_assets_dir)
 
       # Populate the GUID database and check for any duplicates.
       guid_database.read_guids_from_assets(assets)
 
-      # Process all assets and stage all files for packaging in the staging
-      # area.
-      for asset in Asset.sorted_by_filename(assets):
-        asset_file = asset.write(
-            staging_dir, guid_database.get_guid(asset.filename_guid_lookup),
-            timestamp)
-        logging.info("- Processed %s --> %s", asset.filename, asset_file)
-
-      # Create the .unitypackage file.
-      PackageConfiguration.create_archive(unity_package_file, staging_dir,
-                                          timestamp)
+      # Reuse a package with the same content written for another build.
+      output_fingerprint = self._output_fingerprint(
+          assets, guid_database, timestamp, False, generated_assets_dir)
+      if self._reuse_output(output_fingerprint, unity_package_file):
+        return unity_package_file
+      # The output may be hard linked to another package so replace it rather
+      # than writing to it.
+      if os.path.lexists(unity_package_file):
+        os.unlink(unity_package_file)
+
+      # Reuse the package if it was previously exported from the same inputs.
+      fingerprint = self._fingerprint(assets, guid_database, timestamp,
+                                      package_filename, False,
+                                      generated_assets_dir)
+      if fingerprint and self._project.build_cache.restore(
+          fingerprint, unity_package_file):
+        logging.info("Copied %s for %s from the cache", unity_package_file,
+                     self.name)
+        self._project.add_output(output_fingerprint, unity_package_file)
+        return unity_package_file
+
+      if FLAGS.stream_archives:
+        # Generate the archive entries for all assets and stream them into
+        # the .unitypackage file.
+        if FLAGS.bounded_memory:
+          # Generate the entries of each asset as it's archived.
+          with TRACER.span("write_archive", package=self.name,
+                           filename=unity_package_file) as span:
+            PackageConfiguration.write_archive(
+                unity_package_file,
+                PackageConfiguration._generate_archive_entries(
+                    assets, guid_database, timestamp),
+                timestamp, sort_entries=False)
+            if TRACER.enabled:
+              span.add_bytes(os.path.getsize(unity_package_file))
+        else:
+          entries = []
+          with TRACER.span("archive_entries", package=self.name,
+                           assets=len(assets)):
+            for asset in Asset.sorted_by_filename(assets):
+              guid = guid_database.get_guid(asset.filename_guid_lookup)
+              entries.extend(asset.archive_entries(guid, timestamp))
+              logging.info("- Processed %s --> %s", asset.filename, guid)
+          with TRACER.span("write_archive", package=self.name,
+                           filename=unity_package_file) as span:
+            PackageConfiguration.write_archive(unity_package_file, entries,
+                                               timestamp)
+            if TRACER.enabled:
+              span.add_bytes(os.path.getsize(unity_package_file))
+      else:
+        # Process all assets and stage all files for packaging in the staging
+        # area.
+        with TRACER.span("stage_assets", package=self.name,
+                         assets=len(assets)):
+          for asset in Asset.sorted_by_filename(assets):
+            asset_file = asset.write(
+                staging_dir, guid_database.get_guid(asset.filename_guid_lookup),
+                timestamp)
+            logging.info("- Processed %s --> %s", asset.filename, asset_file)
+            if FLAGS.bounded_memory:
+              asset.release_metadata()
+
+        # Create the .unitypackage file.
+        with TRACER.span("create_archive", package=self.name,
+                         filename=unity_package_file) as span:
+          PackageConfiguration.create_archive(unity_package_file, staging_dir,
+                                              timestamp)
+          if TRACER.enabled:
+            span.add_bytes(os.path.getsize(unity_package_file))
+      if fingerprint:
+        self._project.build_cache.store(fingerprint, unity_package_file)
+      self._project.add_output(output_fingerprint, unity_package_file)
       logging.info("Created %s for %s", unity_package_file, self.name)
     finally:
       shutil.rmtree(temporary_dir)
 
     return unity_package_file
 
+  def _add_upm_layout_assets(self, assets, assets_dirs):
+    """Add assets required by the layout of a Unity Package Manager package.
+
+    README.md, CHANGELOG.md and LICENSE.md are relocated to the root of the
+    package and an asset is added for each folder so that the package contains
+    a .meta file for every folder.
+
+    Args:
+      assets: List of Asset instances exported by the package.
+      assets_dirs: List of paths to directories to search for files referenced
+        by this package.
+
+    Returns:
+      List of Asset instances which contains `assets` and the added assets.
+
+    Raises:
+      ProjectConfigurationError: If a README, CHANGELOG or LICENSE file
+        referenced by this package isn't found.
+    """
+    assets = list(assets)
+    # Move README.md, CHANGELOG.md and LICENSE.md to root folder.
+    for config_name, to_location in (("readme", "README.md"),
+                                     ("changelog", "CHANGELOG.md"),
+                                     ("license", "LICENSE.md")):
+      from_location = safe_dict_get_value(self._json, config_name)
+      if from_location:
+        abs_from_location = find_in_dirs(from_location, assets_dirs)
+        if abs_from_location:
+          # Create default metadata
+          metadata = Asset.add_labels_to_metadata(DEFAULT_METADATA_TEMPLATE,
+                                                  self.labels)
+
+          assets.append(Asset(
+              to_location,
+              abs_from_location,
+              metadata,
+              filename_guid_lookup=os.path.join(self.common_package_name,
+                                                to_location),
+              is_folder=False))
+        else:
+          raise ProjectConfigurationError(
+              "Cannot find '%s' at '%s' for package '%s'. Perhaps it "
+              "is not included in assets_dir or assets_zip?" % (
+                  config_name, from_location, self.name))
+
+    # Add all folder assets to generate .meta
+    folders = set()
+    for asset in assets:
+      filepath = os.path.os.path.dirname(asset.filename)
+      while filepath:
+        folders.add(filepath)
+        filepath = os.path.os.path.dirname(filepath)
+
+    for folder in folders:
+      # Same folder from each package needs to have an unique GUID. Therefore,
+      # filename_guid_lookup is set to "package-name/path/to/folder"
+      assets.append(
+          Asset(
+              folder,
+              folder,
+              DEFAULT_METADATA_TEMPLATE,
+              filename_guid_lookup=os.path.join(self.common_package_name,
+                                                folder),
+              is_folder=True))
+    return assets
+
   def write_upm(self,
                 guid_database,
                 assets_dirs,
@@ -2762,73 +5830,49 @@ class PackageConfiguration(ConfigurationBlock):
 
       logging.info("Packaging %s to %s...", self.name, unity_package_file)
 
-      assets = self.find_assets(assets_dirs, for_upm=True)
-
-      # Create package.json
-      manifest_asset = self.write_upm_manifest(generated_assets_dir)
-      if manifest_asset:
-        assets.append(manifest_asset)
-
-      manifest_asset = self.write_manifest(generated_assets_dir, assets)
-      if manifest_asset:
-        assets.append(manifest_asset)
-
-      # Move README.md, CHANGELOG.md and LICENSE.md to root folder.
-      for config_name, to_location in (("readme", "README.md"),
-                                       ("changelog", "CHANGELOG.md"),
-                                       ("license", "LICENSE.md")):
-        from_location = safe_dict_get_value(self._json, config_name)
-        if from_location:
-          abs_from_location = find_in_dirs(from_location, assets_dirs)
-          if abs_from_location:
-            # Create default metadata
-            metadata = copy.deepcopy(DEFAULT_METADATA_TEMPLATE)
-            labels = self.labels
-            Asset.add_labels_to_metadata(metadata, labels)
-
-            assets.append(Asset(
-                to_location,
-                abs_from_location,
-                metadata,
-                filename_guid_lookup=os.path.join(self.common_package_name,
-                                                  to_location),
-                is_folder=False))
-          else:
-            raise ProjectConfigurationError(
-                "Cannot find '%s' at '%s' for package '%s'. Perhaps it "
-                "is not included in assets_dir or assets_zip?" % (
-                    config_name, from_location, self.name))
-
-      # Add all folder assets to generate .meta
-      folders = set()
-      for asset in assets:
-        filepath = os.path.os.path.dirname(asset.filename)
-        while filepath:
-          folders.add(filepath)
-          filepath = os.path.os.path.dirname(filepath)
-
-      for folder in folders:
-        # Same folder from each package needs to have an unique GUID. Therefore,
-        # filename_guid_lookup is set to "package-name/path/to/folder"
-        assets.append(
-            Asset(
-                folder,
-                folder,
-                DEFAULT_METADATA_TEMPLATE,
-                filename_guid_lookup=os.path.join(self.common_package_name,
-                                                  folder),
-                is_folder=True))
+      assets = self.get_exported_assets(assets_dirs, generated_assets_dir,
+                                        for_upm=True)
 
       # Populate the GUID database and check for any duplicates.
       guid_database.read_guids_from_assets(assets)
 
+      # Reuse a package with the same content written for another build.
+      source_doc = safe_dict_get_value(self._json, "documentation")
+      documentation_path = (find_in_dirs(source_doc, assets_dirs)
+                            if source_doc else None)
+      additional_paths = [documentation_path] if documentation_path else []
+      output_fingerprint = self._output_fingerprint(
+          assets, guid_database, timestamp, True, generated_assets_dir,
+          additional_paths=additional_paths)
+      if self._reuse_output(output_fingerprint, unity_package_file):
+        return unity_package_file
+      # The output may be hard linked to another package so replace it rather
+      # than writing to it.
+      if os.path.lexists(unity_package_file):
+        os.unlink(unity_package_file)
+
+      # Reuse the package if it was previously exported from the same inputs.
+      fingerprint = self._fingerprint(
+          assets, guid_database, timestamp, package_filename, True,
+          generated_assets_dir, additional_paths=additional_paths)
+      if fingerprint and self._project.build_cache.restore(
+          fingerprint, unity_package_file):
+        logging.info("Copied %s for %s from the cache", unity_package_file,
+                     self.name)
+        self._project.add_output(output_fingerprint, unity_package_file)
+        return unity_package_file
+
       # Process all assets and stage all files for packaging in the staging
       # area.
-      for asset in Asset.sorted_by_filename(assets):
-        asset_file = asset.write_upm(
-            staging_dir, guid_database.get_guid(asset.filename_guid_lookup),
-            timestamp)
-        logging.info("- Processed %s --> %s", asset.filename, asset_file)
+      with TRACER.span("stage_assets", package=self.name, for_upm=True,
+                       assets=len(assets)):
+        for asset in Asset.sorted_by_filename(assets):
+          asset_file = asset.write_upm(
+              staging_dir, guid_database.get_guid(asset.filename_guid_lookup),
+              timestamp)
+          logging.info("- Processed %s --> %s", asset.filename, asset_file)
+          if FLAGS.bounded_memory:
+            asset.release_metadata()
 
       # Copy documents to "Documentation~" folder.
       # See https://docs.unity3d.com/Manual/cus-layout.html
@@ -2845,7 +5889,7 @@ class PackageConfiguration(ConfigurationBlock):
                                     UPM_DOCUMENTATION_DIRECTORY,
                                     UPM_DOCUMENTATION_FILENAME)
           logging.info("- Copying doc file %s --> %s", source_doc, target_doc)
-          copy_and_set_rwx(source_doc, target_doc)
+          copy_and_set_rwx(source_doc, target_doc, for_archive=True)
         elif os.path.isdir(source_doc):
           target_doc_dir = os.path.join(staging_dir, "package",
                                         UPM_DOCUMENTATION_DIRECTORY)
@@ -2859,7 +5903,7 @@ class PackageConfiguration(ConfigurationBlock):
 
           logging.info("- Copying doc folder %s --> %s",
                        source_doc, target_doc_dir)
-          copy_and_set_rwx(source_doc, target_doc_dir)
+          copy_and_set_rwx(source_doc, target_doc_dir, for_archive=True)
         else:
           raise ProjectConfigurationError(
               "Cannot find documentation at '%s' for package '%s'. Perhaps the "
@@ -2867,8 +5911,15 @@ class PackageConfiguration(ConfigurationBlock):
                   from_location, self.name))
 
       # Create the .tgz file.
-      PackageConfiguration.create_archive(unity_package_file, staging_dir,
-                                          timestamp)
+      with TRACER.span("create_archive", package=self.name, for_upm=True,
+                       filename=unity_package_file) as span:
+        PackageConfiguration.create_archive(unity_package_file, staging_dir,
+                                            timestamp)
+        if TRACER.enabled:
+          span.add_bytes(os.path.getsize(unity_package_file))
+      if fingerprint:
+        self._project.build_cache.store(fingerprint, unity_package_file)
+      self._project.add_output(output_fingerprint, unity_package_file)
       logging.info("Created %s for %s", unity_package_file, self.name)
     finally:
       shutil.rmtree(temporary_dir)
@@ -3018,6 +6069,18 @@ class ProjectConfiguration(object):
       initialization.
     _all_builds: All available build configuration instances.
     _builds: Set of builds filtered by enabled export sections.
+    _build_cache: BuildCache used to reuse previously exported packages or
+      None if caching is disabled.
+    _file_index: FileIndex used to search for assets.
+    _selections_by_sections: Dictionary of (packages_by_name, builds) tuples,
+      the packages and builds enabled by a set of sections, indexed by
+      frozensets of validated sections.
+    _build_package_name_maps: Dictionary of lists of (build, build_sections,
+      package_name_map) tuples generated by get_build_package_name_maps()
+      indexed by (selected_sections, for_upm) tuples.
+    _outputs_by_fingerprint: Dictionary of package files written by this
+      project indexed by the fingerprint of their content, see
+      PackageConfiguration._output_fingerprint().
   """
 
   def __init__(self, export_configuration_dict, selected_sections, version):
@@ -3055,10 +6118,46 @@ class ProjectConfiguration(object):
                             self._json, "builds", default_value=[{}])]
     self._builds = []
     self._selected_sections = None
+    self._build_cache = BuildCache(FLAGS.cache_dir) if FLAGS.cache_dir else None
+    self._file_index = FileIndex()
+    self._selections_by_sections = {}
+    self._build_package_name_maps = {}
+    self._outputs_by_fingerprint = {}
 
     # pylint: disable=g-missing-from-attributes
     self.selected_sections = selected_sections
 
+  def __getstate__(self):
+    """Get the state of this project without caches of the filesystem.
+
+    Returns:
+      Dictionary of attributes to pickle.
+    """
+    state = dict(self.__dict__)
+    del state["_build_cache"]
+    del state["_file_index"]
+    state["_outputs_by_fingerprint"] = {}
+    return state
+
+  def __setstate__(self, state):
+    """Restore the state of this project.
+
+    Args:
+      state: Dictionary of attributes returned by __getstate__().
+    """
+    self.__dict__.update(state)
+    self._build_cache = BuildCache(FLAGS.cache_dir) if FLAGS.cache_dir else None
+    self._file_index = FileIndex()
+
+  def release_assets(self):
+    """Release the assets found for all packages in this project.
+
+    This bounds the memory used to export a project to the assets of a package
+    and the packages it includes, see the bounded_memory flag.
+    """
+    for package in self._packages:
+      package.release_assets()
+
   @property
   def packages_by_name(self):
     """Get the list of packages from the configuration indexed by name.
@@ -3068,6 +6167,62 @@ class ProjectConfiguration(object):
     """
     return collections.OrderedDict(self._packages_by_name)
 
+  def get_package(self, name):
+    """Get an enabled package by name.
+
+    Args:
+      name: Name of the package.
+
+    Returns:
+      PackageConfiguration instance or None if the package isn't enabled.
+    """
+    return self._packages_by_name.get(name)
+
+  @property
+  def build_cache(self):
+    """Get the cache of exported packages.
+
+    Returns:
+      BuildCache instance or None if caching is disabled.
+    """
+    return self._build_cache
+
+  def find_output(self, fingerprint):
+    """Find a package file previously written with the same content.
+
+    Args:
+      fingerprint: Fingerprint of the content of the package.
+
+    Returns:
+      Path of the package file or None if no package with the same content
+      exists.
+    """
+    filename = self._outputs_by_fingerprint.get(fingerprint)
+    return filename if filename and os.path.isfile(filename) else None
+
+  def add_output(self, fingerprint, filename):
+    """Record a package file written by this project.
+
+    Args:
+      fingerprint: Fingerprint of the content of the package.
+      filename: Path of the package file.
+    """
+    # Forget the previous content of the file if it's been written again.
+    for previous_fingerprint, previous_filename in list(
+        self._outputs_by_fingerprint.items()):
+      if previous_filename == filename:
+        del self._outputs_by_fingerprint[previous_fingerprint]
+    self._outputs_by_fingerprint[fingerprint] = filename
+
+  @property
+  def file_index(self):
+    """Get the index of files used to search for assets.
+
+    Returns:
+      FileIndex instance.
+    """
+    return self._file_index
+
   @property
   def packages(self):
     """Get the list of packages from the configuration.
@@ -3101,7 +6256,8 @@ class ProjectConfiguration(object):
 
     This method changes the set of selected packages returned by the
     packages and packages_by_name properties and build configurations by the
-    builds property.
+    builds property.  The packages and builds selected by each set of sections
+    are cached so selecting a set of sections again is cheap.
 
     Args:
       sections: Set of enabled export section strings. This is used to
@@ -3115,6 +6271,12 @@ class ProjectConfiguration(object):
     if sections == self._selected_sections:
       return
 
+    selection = self._selections_by_sections.get(frozenset(sections))
+    if selection:
+      self._selected_sections = sections
+      self._packages_by_name, self._builds = selection
+      return
+
     # Filter by enabled packages and bucket by name.
     package_list_by_name = collections.OrderedDict()
     for package in self._packages:
@@ -3143,8 +6305,10 @@ class ProjectConfiguration(object):
           (name, pkgs[0]) for name, pkgs in package_list_by_name.items()])
 
       # Check for circular references in includes.
+      checked_package_names = set()
       for package in self.packages:
-        package.check_circular_references_in_includes([])
+        package.check_circular_references_in_includes([],
+                                                      checked_package_names)
     except ProjectConfigurationError as error:
       self._selected_sections = previous_selected_sections
       self._packages_by_name = previous_packages_by_name
@@ -3158,6 +6322,8 @@ class ProjectConfiguration(object):
       else:
         logging.debug("Build %s not enabled for sections %s (supports %s)",
                       build.name, sections, build.sections)
+    self._selections_by_sections[frozenset(sections)] = (
+        self._packages_by_name, self._builds)
 
   @property
   def builds(self):
@@ -3168,38 +6334,34 @@ class ProjectConfiguration(object):
     """
     return list(self._builds)
 
-  def write(self,
-            guid_database,
-            assets_dirs,
-            output_dir,
-            timestamp,
-            for_upm=False):
-    """Export all enabled packages using the project build configs.
+  def get_build_package_name_maps(self, for_upm=False):
+    """Get the packages exported by each selected build configuration.
+
+    The result is cached for the selected sections so that it can be
+    precompiled into an ExportPlan.
 
     Args:
-      guid_database: GuidDatabase instance which contains GUIDs for each
-        exported asset.
-      assets_dirs: List of paths to directories containing assets to import.
-        This is combined with the path of each asset referenced by the project.
-      output_dir: Directory where to write the exported .unitypackage.
-      timestamp: Timestamp to apply to all packaged assets in each archive. If
-        this value is less than 0, the creation time of each input file is used
-        instead.
-      for_upm: Whether write for Unity Package Manager package.
+      for_upm: Whether to map packages to Unity Package Manager tarballs.
 
     Returns:
-      Dictionary of BuildConfiguration instances indexed by the exported
-      package filename generated by the build config.
+      List of (build, build_sections, package_name_map) tuples where
+      build is a BuildConfiguration instance, build_sections is the set of
+      sections selected when exporting the build and package_name_map is a
+      dictionary of output filenames indexed by package name.
 
     Raises:
-      ProjectConfigurationError: If an error occurs while exporting the project.
-      MissingGuidsError: If any asset GUIDs are missing.
+      ProjectConfigurationError: If multiple builds export packages to the
+        same file or any project data contains errors.
     """
     selected_sections = self.selected_sections
-    build_by_package_filename = {}
+    key = (frozenset(selected_sections), for_upm)
+    build_sections_and_package_name_maps = self._build_package_name_maps.get(
+        key)
+    if build_sections_and_package_name_maps is not None:
+      return list(build_sections_and_package_name_maps)
 
+    build_sections_and_package_name_maps = []
     try:
-      build_sections_and_package_name_maps = []
       build_indices_by_package_filename = collections.defaultdict(list)
       # Generate package name maps for each build configuration.
       builds = self.builds
@@ -3234,20 +6396,81 @@ class ProjectConfiguration(object):
         # check for duplicates later.
         for filename in package_name_map.values():
           build_indices_by_package_filename[filename].append(build_index)
+    finally:
+      self.selected_sections = selected_sections
 
-      # Check for multiple build configurations exporting to the same filenames.
-      duplicate_filename_errors = []
-      for filename, build_indices in build_indices_by_package_filename.items():
-        if len(build_indices) > 1:
-          duplicate_filename_errors.append(
-              "%s exported by multiple builds %s" % (
-                  filename,
-                  str([builds[index].name for index in build_indices])))
-      if duplicate_filename_errors:
-        raise ProjectConfigurationError(
-            ("Detected multiple builds exporting packages to the same "
-             "file(s).\n"
-             "%s") % "\n".join(duplicate_filename_errors))
+    # Check for multiple build configurations exporting to the same filenames.
+    duplicate_filename_errors = []
+    for filename, build_indices in build_indices_by_package_filename.items():
+      if len(build_indices) > 1:
+        duplicate_filename_errors.append(
+            "%s exported by multiple builds %s" % (
+                filename,
+                str([builds[index].name for index in build_indices])))
+    if duplicate_filename_errors:
+      raise ProjectConfigurationError(
+          ("Detected multiple builds exporting packages to the same "
+           "file(s).\n"
+           "%s") % "\n".join(duplicate_filename_errors))
+
+    self._build_package_name_maps[key] = build_sections_and_package_name_maps
+    return list(build_sections_and_package_name_maps)
+
+  def write(self,
+            guid_database,
+            assets_dirs,
+            output_dir,
+            timestamp,
+            for_upm=False,
+            jobs=1,
+            package_filenames=None):
+    """Export all enabled packages using the project build configs.
+
+    Args:
+      guid_database: GuidDatabase instance which contains GUIDs for each
+        exported asset.
+      assets_dirs: List of paths to directories containing assets to import.
+        This is combined with the path of each asset referenced by the project.
+      output_dir: Directory where to write the exported .unitypackage.
+      timestamp: Timestamp to apply to all packaged assets in each archive. If
+        this value is less than 0, the creation time of each input file is used
+        instead.
+      for_upm: Whether write for Unity Package Manager package.
+      jobs: Number of worker processes used to export packages.  If this is
+        1 packages are exported serially in this process, if this is less
+        than 1 the number of CPUs is used.
+      package_filenames: Set of package filenames to export or None to export
+        all packages.
+
+    Returns:
+      Dictionary of BuildConfiguration instances indexed by the exported
+      package filename generated by the build config.
+
+    Raises:
+      ProjectConfigurationError: If an error occurs while exporting the project.
+      MissingGuidsError: If any asset GUIDs are missing.
+    """
+    selected_sections = self.selected_sections
+    build_by_package_filename = {}
+
+    try:
+      build_sections_and_package_name_maps = self.get_build_package_name_maps(
+          for_upm)
+      if package_filenames is not None:
+        build_sections_and_package_name_maps = [
+            (build, build_sections, collections.OrderedDict([
+                (package_name, package_filename)
+                for package_name, package_filename in package_name_map.items()
+                if package_filename in package_filenames]))
+            for build, build_sections, package_name_map in (
+                build_sections_and_package_name_maps)]
+
+      if jobs < 1:
+        jobs = os.cpu_count() or 1
+      if jobs > 1:
+        return self._write_packages_in_parallel(
+            build_sections_and_package_name_maps, selected_sections,
+            guid_database, assets_dirs, output_dir, timestamp, for_upm, jobs)
 
       missing_guid_paths = []
       for build, build_sections, package_name_map in (
@@ -3262,20 +6485,23 @@ class ProjectConfiguration(object):
         for package_name, package_filename in package_name_map.items():
           package = packages_by_name[package_name]
           try:
-            if for_upm:
-              filename = package.write_upm(
-                  guid_database,
-                  assets_dirs,
-                  output_dir,
-                  timestamp,
-                  package_filename=package_filename)
-            else:
-              filename = package.write(
-                  guid_database,
-                  assets_dirs,
-                  output_dir,
-                  timestamp,
-                  package_filename=package_filename)
+            with TRACER.span("write_package", build=build.name,
+                             package=package_name, filename=package_filename,
+                             for_upm=for_upm):
+              if for_upm:
+                filename = package.write_upm(
+                    guid_database,
+                    assets_dirs,
+                    output_dir,
+                    timestamp,
+                    package_filename=package_filename)
+              else:
+                filename = package.write(
+                    guid_database,
+                    assets_dirs,
+                    output_dir,
+                    timestamp,
+                    package_filename=package_filename)
             build_by_package_filename[filename] = build
           except MissingGuidsError as missing_guids_error:
             logging.error("Missing GUIDs while writing %s (%s)",
@@ -3285,13 +6511,724 @@ class ProjectConfiguration(object):
             raise ProjectConfigurationError(
                 "Duplicate GUIDs detecting while writing package %s to %s "
                 "(%s)" % (package.name, package_filename, str(error)))
+          finally:
+            if FLAGS.bounded_memory:
+              self.release_assets()
 
       if missing_guid_paths:
         raise MissingGuidsError(missing_guid_paths)
     finally:
       self.selected_sections = selected_sections
+      if self._build_cache:
+        self._build_cache.save()
     return build_by_package_filename
 
+  def get_contents(self, guid_database, assets_dirs, for_upm=False):
+    """Resolve the contents of the packages of each build config.
+
+    Builds, sections, assets, GUIDs and manifests are resolved as they are by
+    write() without writing any files.
+
+    Args:
+      guid_database: GuidDatabase instance which contains GUIDs for each
+        exported asset.
+      assets_dirs: List of paths to directories containing assets to import.
+      for_upm: Whether to resolve Unity Package Manager packages.
+
+    Returns:
+      OrderedDict of (build, package, contents) tuples indexed by the
+      filename of each package where build is the BuildConfiguration that
+      exports the package, package is the PackageConfiguration and contents
+      is returned by PackageConfiguration.get_contents().
+
+    Raises:
+      ProjectConfigurationError: If an error occurs while resolving the
+        project.
+      MissingGuidsError: If any asset GUIDs are missing.
+    """
+    selected_sections = self.selected_sections
+    contents_by_package_filename = collections.OrderedDict()
+    missing_guid_paths = []
+    try:
+      for build, build_sections, package_name_map in (
+          self.get_build_package_name_maps(for_upm)):
+        self.selected_sections = build_sections
+        packages_by_name = self.packages_by_name
+        for package_name, package_filename in package_name_map.items():
+          package = packages_by_name[package_name]
+          try:
+            contents_by_package_filename[package_filename] = (
+                build, package,
+                package.get_contents(guid_database, assets_dirs,
+                                     for_upm=for_upm))
+          except MissingGuidsError as missing_guids_error:
+            missing_guid_paths.extend(missing_guids_error.missing_guid_paths)
+          except DuplicateGuidsError as error:
+            raise ProjectConfigurationError(
+                "Duplicate GUIDs detecting while resolving package %s for %s "
+                "(%s)" % (package.name, package_filename, str(error)))
+      if missing_guid_paths:
+        raise MissingGuidsError(missing_guid_paths)
+    finally:
+      self.selected_sections = selected_sections
+    return contents_by_package_filename
+
+  def _write_packages_in_parallel(self, build_sections_and_package_name_maps,
+                                  selected_sections, guid_database,
+                                  assets_dirs, output_dir, timestamp, for_upm,
+                                  jobs):
+    """Export packages of all build configs using a pool of worker processes.
+
+    Each (build config, package) pair is exported by a worker process that
+    owns a copy of this project and the GUID database.  GUIDs read by each
+    worker are merged back into guid_database so that GUIDs duplicated across
+    packages are still detected.
+
+    Args:
+      build_sections_and_package_name_maps: List of (build, build_sections,
+        package_name_map) tuples generated by write().
+      selected_sections: Sections used to initialize the project in each
+        worker.
+      guid_database: GuidDatabase instance which contains GUIDs for each
+        exported asset.
+      assets_dirs: List of paths to directories containing assets to import.
+      output_dir: Directory where to write the exported packages.
+      timestamp: Timestamp to apply to all packaged assets in each archive.
+      for_upm: Whether write for Unity Package Manager package.
+      jobs: Number of worker processes.
+
+    Returns:
+      Dictionary of BuildConfiguration instances indexed by the exported
+      package filename generated by the build config.
+
+    Raises:
+      ProjectConfigurationError: If an error occurs while exporting the project.
+      MissingGuidsError: If any asset GUIDs are missing.
+    """
+    build_by_package_filename = {}
+    missing_guid_paths = []
+    duplicate_guids_errors = []
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs, initializer=_initialize_export_worker,
+        initargs=(FLAGS.flag_values_dict(), self._json, selected_sections,
+                  self._version)) as executor:
+      exports = []
+      for build, build_sections, package_name_map in (
+          build_sections_and_package_name_maps):
+        logging.info("Building %s using sections %s", build.name,
+                     str(build_sections))
+        for package_name, package_filename in package_name_map.items():
+          exports.append((build, package_name, package_filename,
+                          executor.submit(_export_package_in_worker,
+                                          build.name, build_sections,
+                                          package_name, package_filename,
+                                          guid_database, assets_dirs,
+                                          output_dir, timestamp, for_upm)))
+
+      # Collect results in submission order so that the output is
+      # deterministic.
+      for build, package_name, package_filename, future in exports:
+        try:
+          filename, guids_by_path, trace_events = future.result()
+          TRACER.add_events(trace_events)
+          build_by_package_filename[filename] = build
+          for path, guid in guids_by_path.items():
+            guid_database.add_guid(path, guid)
+        except MissingGuidsError as missing_guids_error:
+          logging.error("Missing GUIDs while writing %s (%s)",
+                        package_name, missing_guids_error.missing_guid_paths)
+          missing_guid_paths.extend(missing_guids_error.missing_guid_paths)
+        except DuplicateGuidsError as error:
+          duplicate_guids_errors.append(
+              "Duplicate GUIDs detecting while writing package %s to %s "
+              "(%s)" % (package_name, package_filename, str(error)))
+
+    if duplicate_guids_errors:
+      raise ProjectConfigurationError("\n".join(duplicate_guids_errors))
+    if missing_guid_paths:
+      raise MissingGuidsError(missing_guid_paths)
+    # Check for GUIDs that are duplicated across packages exported by
+    # different workers.
+    try:
+      guid_database.check_for_duplicates()
+    except DuplicateGuidsError as error:
+      raise ProjectConfigurationError(
+          "Duplicate GUIDs detecting while writing packages (%s)" % str(error))
+    return build_by_package_filename
+
+
+# ProjectConfiguration used to export packages in a worker process, see
+# _initialize_export_worker().
+_export_worker_project = None
+
+
+def _initialize_export_worker(flag_values, export_configuration_dict,
+                              selected_sections, version):
+  """Initialize a worker process used to export packages.
+
+  Args:
+    flag_values: Dictionary of flag values from the parent process.
+    export_configuration_dict: Dictionary with the project configuration.
+    selected_sections: Set of enabled export section strings.
+    version: Version number of the project.
+  """
+  global _export_worker_project  # pylint: disable=global-statement
+  # Flags are not parsed when the worker is spawned rather than forked.
+  if not FLAGS.is_parsed():
+    FLAGS.mark_as_parsed()
+  for name, value in flag_values.items():
+    if name in FLAGS and FLAGS[name].value != value:
+      FLAGS[name].value = value
+  if FLAGS.trace_file or FLAGS.trace_summary or FLAGS.trace_memory:
+    TRACER.enable(trace_memory=FLAGS.trace_memory)
+  _export_worker_project = ProjectConfiguration(
+      export_configuration_dict, selected_sections, version)
+
+
+def _export_package_in_worker(build_name, build_sections, package_name,
+                              package_filename, guid_database, assets_dirs,
+                              output_dir, timestamp, for_upm):
+  """Export a package from a worker process.
+
+  Args:
+    build_name: Name of the build config.
+    build_sections: Sections enabled by the build config.
+    package_name: Name of the package to export.
+    package_filename: Filename to write the package to in the output_dir.
+    guid_database: GuidDatabase instance which contains GUIDs for each
+      exported asset.
+    assets_dirs: List of paths to directories containing assets to import.
+    output_dir: Directory where to write the exported package.
+    timestamp: Timestamp to apply to all packaged assets in the archive.
+    for_upm: Whether write for Unity Package Manager package.
+
+  Returns:
+    (filename, guids_by_path, trace_events) tuple where filename is the path of
+    the exported package, guids_by_path is a dictionary of GUIDs added to
+    guid_database while exporting the package and trace_events is the list of
+    spans recorded by TRACER while exporting the package.
+  """
+  project = _export_worker_project
+  project.selected_sections = build_sections
+  package = project.packages_by_name[package_name]
+  existing_guids_by_path = guid_database.guids_by_path
+  TRACER.take_events()
+  with TRACER.span("write_package", build=build_name, package=package_name,
+                   filename=package_filename, for_upm=for_upm):
+    if for_upm:
+      filename = package.write_upm(guid_database, assets_dirs, output_dir,
+                                   timestamp, package_filename=package_filename)
+    else:
+      filename = package.write(guid_database, assets_dirs, output_dir,
+                               timestamp, package_filename=package_filename)
+  if FLAGS.bounded_memory:
+    project.release_assets()
+  if project.build_cache:
+    project.build_cache.save()
+  return (filename,
+          dict([(path, guid)
+                for path, guid in guid_database.guids_by_path.items()
+                if existing_guids_by_path.get(path) != guid]),
+          TRACER.take_events())
+
+
+class ExportPlan(object):
+  """Project configuration resolved for a set of sections.
+
+  Resolving a project configuration selects the packages and builds enabled by
+  each build's sections, checks includes for circular references, maps
+  package names to output filenames and generates the importer metadata of
+  each group of assets.  An export plan stores the result so that it can be
+  loaded by subsequent exports of the same configuration.
+
+  Attributes:
+    _key: Hash of the inputs the plan was compiled from.
+    _project: ProjectConfiguration instance with resolved builds, packages
+      and importer metadata.
+    _for_upm_modes: List of for_upm values the packages of the project were
+      resolved for.
+  """
+
+  # Changing this invalidates all export plans.
+  PLAN_VERSION = 1
+
+  def __init__(self, key, project, for_upm_modes):
+    """Initialize the plan.
+
+    Args:
+      key: Hash of the inputs the plan was compiled from, see compute_key().
+      project: ProjectConfiguration instance to export.
+      for_upm_modes: List of for_upm values the packages of the project were
+        resolved for.
+    """
+    self._key = key
+    self._project = project
+    self._for_upm_modes = list(for_upm_modes)
+
+  @property
+  def key(self):
+    """Get the hash of the inputs the plan was compiled from.
+
+    Returns:
+      Hex digest string.
+    """
+    return self._key
+
+  @property
+  def project(self):
+    """Get the project to export.
+
+    Returns:
+      ProjectConfiguration instance.
+    """
+    return self._project
+
+  @property
+  def entries(self):
+    """Get the packages exported by this plan.
+
+    Returns:
+      List of (for_upm, output_filename, package, asset_configs) tuples where
+      for_upm indicates whether the package is exported for Unity Package
+      Manager, package is the PackageConfiguration to export to
+      output_filename and asset_configs is the list of AssetConfiguration
+      instances imported by the package and its includes.
+    """
+    entries = []
+    project = self._project
+    selected_sections = project.selected_sections
+    try:
+      for for_upm in self._for_upm_modes:
+        for _, build_sections, package_name_map in (
+            project.get_build_package_name_maps(for_upm)):
+          project.selected_sections = build_sections
+          for package_name, output_filename in package_name_map.items():
+            package = project.get_package(package_name)
+            asset_configs = []
+            for included_package in [package] + package.includes:
+              asset_configs.extend(included_package.imports)
+            entries.append((for_upm, output_filename, package, asset_configs))
+    finally:
+      project.selected_sections = selected_sections
+    return entries
+
+  @staticmethod
+  def compute_key(config_data, sections, version):
+    """Calculate the hash of the inputs of a plan.
+
+    Args:
+      config_data: Contents of the configuration file.
+      sections: Set of enabled export section strings.
+      version: Version of the project or None.
+
+    Returns:
+      Hex digest string.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(json.dumps(
+        [ExportPlan.PLAN_VERSION, BuildCache.tool_hash(), sorted(sections),
+         version, FLAGS.enforce_semver],
+        separators=(",", ":")).encode("utf8"))
+    hasher.update(b"\n")
+    hasher.update(config_data)
+    return hasher.hexdigest()
+
+  @staticmethod
+  def compile(config_data, sections, version, for_upm_modes=(False, True)):
+    """Resolve a project configuration into an export plan.
+
+    Args:
+      config_data: Contents of the JSON configuration file.
+      sections: Set of enabled export section strings.
+      version: Version of the project or None.
+      for_upm_modes: Whether to resolve packages exported as .unitypackage
+        files (False) and / or Unity Package Manager tarballs (True).
+
+    Returns:
+      ExportPlan instance.
+
+    Raises:
+      ValueError: If the configuration can't be parsed.
+      ProjectConfigurationError: If any project data contains errors.
+    """
+    project = ProjectConfiguration(
+        json.loads(config_data.decode("utf8"),
+                   object_pairs_hook=collections.OrderedDict),
+        sections, version)
+    plan = ExportPlan(ExportPlan.compute_key(config_data, sections, version),
+                      project, for_upm_modes)
+    # Resolve packages and generate the importer metadata of each group of
+    # assets.
+    for _, _, _, asset_configs in plan.entries:
+      for asset_config in asset_configs:
+        _ = asset_config.importer_metadata_template
+    return plan
+
+  @staticmethod
+  def load(plan_filename, key):
+    """Load an export plan from a file.
+
+    Args:
+      plan_filename: File to read.
+      key: Expected hash of the inputs of the plan.
+
+    Returns:
+      ExportPlan instance or None if the file doesn't exist, is corrupt or was
+      compiled from different inputs.
+    """
+    try:
+      with open(plan_filename, "rb") as plan_file:
+        # The key is stored before the plan so that a stale plan is not loaded.
+        if plan_file.readline().rstrip(b"\n") != key.encode("utf8"):
+          return None
+        plan = pickle.load(plan_file)
+    except Exception:  # pylint: disable=broad-except
+      return None
+    return plan if isinstance(plan, ExportPlan) and plan.key == key else None
+
+  def save(self, plan_filename):
+    """Write the plan to a file.
+
+    Args:
+      plan_filename: File to write.
+    """
+    temporary_filename = None
+    try:
+      plan_dir = os.path.dirname(os.path.abspath(plan_filename))
+      os.makedirs(plan_dir, exist_ok=True)
+      file_descriptor, temporary_filename = tempfile.mkstemp(
+          dir=plan_dir, prefix=os.path.basename(plan_filename))
+      with os.fdopen(file_descriptor, "wb") as plan_file:
+        plan_file.write(self._key.encode("utf8") + b"\n")
+        pickle.dump(self, plan_file, protocol=pickle.HIGHEST_PROTOCOL)
+      os.replace(temporary_filename, plan_filename)
+    except (IOError, OSError) as error:
+      logging.warning("Failed to write export plan to %s (%s)",
+                      plan_filename, str(error))
+      if temporary_filename and os.path.exists(temporary_filename):
+        os.unlink(temporary_filename)
+
+
+class ProjectWatcher(object):
+  """Exports the packages of a project affected by changes to source files.
+
+  Source files are polled by comparing the modification time and size of
+  each file in the assets directories.  An index of the packages that
+  reference each asset, and its .meta file, is used to export only the
+  packages affected by a change.  Files that are added or removed may change
+  the assets found for any package so all packages are exported.  Packages
+  that fail to export are exported again when any file changes.
+
+  The project, its cached metadata and the GUID database are reused between
+  exports, so packages are exported serially in this process rather than by
+  worker processes that would each rebuild the project for every change.
+
+  Attributes:
+    _project: ProjectConfiguration to export.
+    _guid_database: GuidDatabase used to export packages.
+    _assets_dirs: List of paths to directories containing assets to import.
+    _output_dir: Directory to write exported packages to.
+    _timestamp: Timestamp to apply to packaged assets.
+    _for_upm_modes: List of booleans which indicate whether to export
+      .unitypackage (False) and / or Unity Package Manager (True) packages.
+    _file_states: Dictionary of (mtime_ns, size) tuples indexed by the
+      absolute path of each file in the assets directories.
+    _outputs_by_source: Dictionary of sets of (for_upm, package_filename)
+      tuples indexed by the absolute path of each source file.
+    _packages_by_output: Dictionary of lists of PackageConfiguration
+      instances that provide the assets of each (for_upm, package_filename)
+      tuple.
+    _indexed: Whether _outputs_by_source and _packages_by_output index the
+      current source files.
+    _failed_outputs: Set of (for_upm, package_filename) tuples that failed to
+      export.
+  """
+
+  def __init__(self, project, guid_database, assets_dirs, output_dir,
+               timestamp, for_upm_modes):
+    """Initialize the watcher.
+
+    Args:
+      project: ProjectConfiguration to export.
+      guid_database: GuidDatabase used to export packages.
+      assets_dirs: List of paths to directories containing assets to import.
+      output_dir: Directory to write exported packages to.
+      timestamp: Timestamp to apply to packaged assets.
+      for_upm_modes: List of booleans which indicate whether to export
+        .unitypackage (False) and / or Unity Package Manager (True) packages.
+    """
+    self._project = project
+    self._guid_database = guid_database
+    self._assets_dirs = list(assets_dirs)
+    self._output_dir = output_dir
+    self._timestamp = timestamp
+    self._for_upm_modes = list(for_upm_modes)
+    self._file_states = {}
+    self._outputs_by_source = {}
+    self._packages_by_output = {}
+    self._indexed = False
+    self._failed_outputs = set()
+
+  @staticmethod
+  def _normalize_path(path):
+    """Normalize a path so that paths of the same file can be compared.
+
+    Args:
+      path: Path to normalize.
+
+    Returns:
+      Absolute normalized path.
+    """
+    return os.path.normpath(os.path.abspath(path))
+
+  def _read_file_states(self):
+    """Read the modification time and size of each file in assets_dirs.
+
+    Returns:
+      Dictionary of (mtime_ns, size) tuples indexed by absolute path.
+    """
+    file_states = {}
+    for assets_dir in self._assets_dirs:
+      for current_dir, _, filenames in os.walk(
+          ProjectWatcher._normalize_path(assets_dir)):
+        for filename in filenames:
+          path = os.path.join(current_dir, filename)
+          try:
+            file_stat = os.stat(path)
+          except OSError:
+            continue
+          file_states[path] = (file_stat.st_mtime_ns, file_stat.st_size)
+    return file_states
+
+  def _index_sources(self):
+    """Index the packages that reference each source file.
+
+    Raises:
+      ProjectConfigurationError: If the project configuration is invalid.
+    """
+    self._indexed = False
+    outputs_by_source = collections.defaultdict(set)
+    packages_by_output = {}
+    project = self._project
+    selected_sections = project.selected_sections
+    try:
+      for for_upm in self._for_upm_modes:
+        for _, build_sections, package_name_map in (
+            project.get_build_package_name_maps(for_upm)):
+          project.selected_sections = build_sections
+          for package_name, package_filename in package_name_map.items():
+            package = project.get_package(package_name)
+            output = (for_upm, package_filename)
+            packages_by_output[output] = [package] + package.includes
+            for asset in package.get_exported_assets(
+                self._assets_dirs, "", for_upm=for_upm, write_files=False):
+              if asset.is_folder:
+                continue
+              path = ProjectWatcher._normalize_path(asset.filename_absolute)
+              outputs_by_source[path].add(output)
+              outputs_by_source[path + ASSET_METADATA_FILE_EXTENSION].add(
+                  output)
+    finally:
+      project.selected_sections = selected_sections
+    self._outputs_by_source = dict(outputs_by_source)
+    self._packages_by_output = packages_by_output
+    self._indexed = True
+    # Forget failures of packages that are no longer exported.
+    self._failed_outputs.intersection_update(packages_by_output)
+
+  def get_outputs(self, path):
+    """Get the packages that reference a source file.
+
+    Args:
+      path: Path of the source file.
+
+    Returns:
+      Set of (for_upm, package_filename) tuples.
+    """
+    return set(self._outputs_by_source.get(
+        ProjectWatcher._normalize_path(path), []))
+
+  def export(self, outputs):
+    """Export packages.
+
+    Outputs are recorded as failed until they're exported so that they're
+    exported again by the next poll if an error occurs.
+
+    Args:
+      outputs: Set of (for_upm, package_filename) tuples to export.
+
+    Returns:
+      Number of exported packages.
+
+    Raises:
+      ProjectConfigurationError: If an error occurs while exporting the project.
+      MissingGuidsError: If any asset GUIDs are missing.
+    """
+    self._failed_outputs.update(outputs)
+    exported = 0
+    for for_upm in self._for_upm_modes:
+      package_filenames = set([package_filename
+                               for output_for_upm, package_filename in outputs
+                               if output_for_upm == for_upm])
+      if not package_filenames:
+        continue
+      exported += len(self._project.write(
+          self._guid_database, self._assets_dirs, self._output_dir,
+          self._timestamp, for_upm=for_upm,
+          package_filenames=package_filenames))
+      self._failed_outputs.difference_update(
+          [(for_upm, package_filename)
+           for package_filename in package_filenames])
+    return exported
+
+  def start(self):
+    """Read the state of the source files and export all packages.
+
+    Returns:
+      Number of exported packages.
+
+    Raises:
+      ProjectConfigurationError: If an error occurs while exporting the project.
+      MissingGuidsError: If any asset GUIDs are missing.
+    """
+    # Read the state of files before exporting so that changes made while
+    # exporting are detected by the next poll.
+    self._file_states = self._read_file_states()
+    self._index_sources()
+    return self.export(set(self._packages_by_output))
+
+  def poll(self):
+    """Export the packages affected by files changed since the last poll.
+
+    Returns:
+      (changed_paths, outputs, latency) tuple where changed_paths is the
+      sorted list of files added, removed or modified since the last poll,
+      outputs is the set of exported (for_upm, package_filename) tuples and
+      latency is the time in seconds from the modification of the earliest
+      changed file to the completion of the export.  If no files changed
+      None is returned.
+
+    Raises:
+      ProjectConfigurationError: If an error occurs while exporting the project.
+      MissingGuidsError: If any asset GUIDs are missing.
+    """
+    previous_file_states = self._file_states
+    file_states = self._read_file_states()
+    if file_states == previous_file_states:
+      return None
+    self._file_states = file_states
+    added_or_removed_paths = set(file_states).symmetric_difference(
+        previous_file_states)
+    modified_paths = set([
+        path for path, file_state in file_states.items()
+        if previous_file_states.get(path, file_state) != file_state])
+    changed_paths = sorted(added_or_removed_paths.union(modified_paths))
+    change_time = min([file_states[path][0] / 1000000000.0
+                       for path in modified_paths.union(
+                           added_or_removed_paths.intersection(file_states))]
+                      or [time.time()])
+
+    # Files on disk changed so discard the cached state of the filesystem.
+    self._project.file_index.clear()
+    if added_or_removed_paths or not self._indexed:
+      # Added or removed files can change the assets found for any package.
+      self._project.release_assets()
+      self._index_sources()
+      outputs = set(self._packages_by_output)
+    else:
+      outputs = set()
+      for path in modified_paths:
+        outputs.update(self._outputs_by_source.get(path, []))
+      # Find the assets of the affected packages again in case their
+      # metadata changed.
+      for output in outputs:
+        for package in self._packages_by_output[output]:
+          package.release_assets()
+      if outputs:
+        self._index_sources()
+    outputs.update(self._failed_outputs)
+    if outputs:
+      with TRACER.span("watch_export", changed_files=len(changed_paths),
+                       packages=len(outputs)):
+        self.export(outputs)
+    return (changed_paths, outputs, max(time.time() - change_time, 0.0))
+
+  def run(self, interval, max_polls=None):
+    """Export all packages then export packages affected by changes.
+
+    Errors while exporting are logged so that packages are exported again
+    when the files are fixed.
+
+    Args:
+      interval: Time in seconds between polls of the source files.
+      max_polls: Maximum number of polls or None to poll until interrupted.
+    """
+    try:
+      start_time = time.time()
+      exported = self.start()
+      logging.info("Exported %d packages in %.3fs, watching %s for changes",
+                   exported, time.time() - start_time, self._assets_dirs)
+    except (ProjectConfigurationError, MissingGuidsError) as error:
+      logging.error(str(error))
+    polls = 0
+    try:
+      while max_polls is None or polls < max_polls:
+        time.sleep(interval)
+        polls += 1
+        poll_time = time.time()
+        try:
+          result = self.poll()
+        except (ProjectConfigurationError, MissingGuidsError) as error:
+          logging.error(str(error))
+          continue
+        if result is None:
+          continue
+        changed_paths, outputs, latency = result
+        logging.info("Exported %d packages for %d changed files %s in %.3fs "
+                     "(%.3fs after the first change)", len(outputs),
+                     len(changed_paths), changed_paths[:10],
+                     time.time() - poll_time, latency)
+    except KeyboardInterrupt:
+      logging.info("Stopped watching %s", self._assets_dirs)
+
+
+def get_contents_plan(project, guid_database, assets_dirs, for_upm_modes):
+  """Resolve the contents of the packages exported by a project.
+
+  Args:
+    project: ProjectConfiguration to resolve.
+    guid_database: GuidDatabase instance which contains GUIDs for each
+      exported asset.
+    assets_dirs: List of paths to directories containing assets to import.
+    for_upm_modes: List of booleans which indicate whether to resolve
+      .unitypackage (False) and / or Unity Package Manager (True) packages.
+
+  Returns:
+    OrderedDict that can be serialized as JSON indexed by the filename of
+    each package in the output directory.  Each item is a dictionary with
+    the build, package name, format ("unitypackage" or "upm") and list of
+    assets where each asset is a dictionary with its path, GUID and metadata
+    fingerprint.
+
+  Raises:
+    ProjectConfigurationError: If an error occurs while resolving the project.
+    MissingGuidsError: If any asset GUIDs are missing.
+  """
+  plan = collections.OrderedDict()
+  for for_upm in for_upm_modes:
+    for package_filename, (build, package, contents) in project.get_contents(
+        guid_database, assets_dirs, for_upm=for_upm).items():
+      plan[package_filename] = collections.OrderedDict([
+          ("build", build.name),
+          ("package", package.name),
+          ("format", "upm" if for_upm else "unitypackage"),
+          ("assets", [collections.OrderedDict([
+              ("path", posix_path(filename)),
+              ("guid", guid),
+              ("metadata_fingerprint", metadata_fingerprint)])
+                      for filename, guid, metadata_fingerprint in contents])])
+  return plan
+
 
 def read_json_file_into_ordered_dict(json_filename):
   """Load JSON into an OrderedDict.
@@ -3440,9 +7377,14 @@ def main(unused_argv):
   assets_dirs = list(FLAGS.assets_dir or [])
   temporary_assets_dirs = []
   output_dir = FLAGS.output_dir
+  if FLAGS.trace_file or FLAGS.trace_summary or FLAGS.trace_memory:
+    TRACER.enable(trace_memory=FLAGS.trace_memory)
 
   try:
-    if FLAGS.output_zip:
+    if FLAGS.plan:
+      # Nothing is written to the output directory when planning.
+      pass
+    elif FLAGS.output_zip:
       output_dir = tempfile.mkdtemp()
     elif not os.path.exists(output_dir):
       try:
@@ -3478,27 +7420,52 @@ def main(unused_argv):
         logging.error("Failed while copying input files (%s)", str(error))
         return 1
 
-    duplicate_guids_checker = DuplicateGuidsChecker()
-    guids_json = {}
-    if FLAGS.guids_file:
+    with TRACER.span("load_guids", filename=FLAGS.guids_file) as span:
+      duplicate_guids_checker = DuplicateGuidsChecker()
+      guids_json = {}
+      if FLAGS.guids_file:
+        try:
+          guids_json = read_json_file_into_ordered_dict(FLAGS.guids_file)
+        except (IOError, ValueError) as error:
+          logging.error("Failed to load GUIDs JSON from %s (%s)",
+                        FLAGS.guids_file, str(error))
+          return 1
+        if TRACER.enabled:
+          span.add_bytes(os.path.getsize(FLAGS.guids_file))
+      guid_database = GuidDatabase(duplicate_guids_checker, guids_json,
+                                   FLAGS.plugins_version)
       try:
-        guids_json = read_json_file_into_ordered_dict(FLAGS.guids_file)
-      except (IOError, ValueError) as error:
-        logging.error("Failed to load GUIDs JSON from %s (%s)",
-                      FLAGS.guids_file, str(error))
+        duplicate_guids_checker.check_for_duplicates()
+      except DuplicateGuidsError as duplicate_guids_error:
+        logging.error(str(duplicate_guids_error))
         return 1
-    guid_database = GuidDatabase(duplicate_guids_checker, guids_json,
-                                 FLAGS.plugins_version)
-    try:
-      duplicate_guids_checker.check_for_duplicates()
-    except DuplicateGuidsError as duplicate_guids_error:
-      logging.error(str(duplicate_guids_error))
-      return 1
 
     try:
-      project = ProjectConfiguration(
-          read_json_file_into_ordered_dict(FLAGS.config_file), enabled_sections,
-          FLAGS.plugins_version)
+      with TRACER.span("parse_config", filename=FLAGS.config_file) as span:
+        if TRACER.enabled:
+          span.add_bytes(os.path.getsize(FLAGS.config_file))
+        if FLAGS.export_plan_file:
+          with open(FLAGS.config_file, "rb") as config_file:
+            config_data = config_file.read()
+          plan = ExportPlan.load(
+              FLAGS.export_plan_file,
+              ExportPlan.compute_key(config_data, enabled_sections,
+                                     FLAGS.plugins_version))
+          if plan:
+            logging.info("Loaded export plan from %s", FLAGS.export_plan_file)
+          else:
+            for_upm_modes = [for_upm for for_upm, enabled in (
+                (False, FLAGS.output_unitypackage), (True, FLAGS.output_upm))
+                             if enabled]
+            plan = ExportPlan.compile(config_data, enabled_sections,
+                                      FLAGS.plugins_version, for_upm_modes)
+            plan.save(FLAGS.export_plan_file)
+            logging.info("Compiled export plan %s", FLAGS.export_plan_file)
+          project = plan.project
+        else:
+          project = ProjectConfiguration(
+              read_json_file_into_ordered_dict(FLAGS.config_file),
+              enabled_sections, FLAGS.plugins_version)
     except (IOError, ValueError, ProjectConfigurationError) as error:
       logging.error("Error while parsing project configuration from %s (%s)",
                     FLAGS.config_file, str(error))
@@ -3506,6 +7473,48 @@ def main(unused_argv):
 
     assets_dirs.extend(temporary_assets_dirs)
 
+    if FLAGS.watch:
+      if FLAGS.output_zip:
+        logging.error("output_zip can't be used with the watch flag")
+        return 1
+      try:
+        copy_files_to_dir(FLAGS.additional_file or [], output_dir)
+      except IOError as error:
+        logging.error("Failed while copying additional output files (%s)",
+                      str(error))
+        return 1
+      for_upm_modes = [for_upm for for_upm, enabled in (
+          (False, FLAGS.output_unitypackage), (True, FLAGS.output_upm))
+                       if enabled]
+      if FLAGS.jobs != 1:
+        logging.info("Exporting packages serially when watching for changes "
+                     "so that cached metadata is reused, ignoring jobs=%d",
+                     FLAGS.jobs)
+      ProjectWatcher(project, guid_database, assets_dirs, output_dir,
+                     FLAGS.timestamp, for_upm_modes).run(FLAGS.watch_interval)
+      return 0
+
+    if FLAGS.plan:
+      for_upm_modes = [for_upm for for_upm, enabled in (
+          (False, FLAGS.output_unitypackage), (True, FLAGS.output_upm))
+                       if enabled]
+      try:
+        with TRACER.span("plan"):
+          plan_json = get_contents_plan(project, guid_database, assets_dirs,
+                                        for_upm_modes)
+      except (ProjectConfigurationError, MissingGuidsError) as error:
+        logging.error(str(error))
+        return 1
+      if FLAGS.plan_output:
+        with open(FLAGS.plan_output, "wt", encoding="utf-8") as plan_file:
+          json.dump(plan_json, plan_file, indent=2)
+        logging.info("Wrote plan of %d packages to %s", len(plan_json),
+                     FLAGS.plan_output)
+      else:
+        json.dump(plan_json, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+      return 0
+
     if FLAGS.output_unitypackage:
       try:
         project.write(
@@ -3513,7 +7522,8 @@ def main(unused_argv):
             assets_dirs,
             output_dir,
             FLAGS.timestamp,
-            for_upm=False)
+            for_upm=False,
+            jobs=FLAGS.jobs)
       except ProjectConfigurationError as error:
         logging.error(str(error))
         return 1
@@ -3534,7 +7544,8 @@ def main(unused_argv):
             assets_dirs,
             output_dir,
             FLAGS.timestamp,
-            for_upm=True)
+            for_upm=True,
+            jobs=FLAGS.jobs)
       except ProjectConfigurationError as error:
         logging.error(str(error))
         return 1
@@ -3542,7 +7553,10 @@ def main(unused_argv):
     # Generate the output zip file if one is requested.
     if FLAGS.output_zip:
       try:
-        write_zipfile(FLAGS.output_zip, output_dir)
+        with TRACER.span("write_zipfile", filename=FLAGS.output_zip) as span:
+          write_zipfile(FLAGS.output_zip, output_dir)
+          if TRACER.enabled:
+            span.add_bytes(os.path.getsize(FLAGS.output_zip))
       except IOError as error:
         logging.error("Failed when writing output zip file %s (%s)",
                       FLAGS.output_zip, str(error))
@@ -3553,6 +7567,17 @@ def main(unused_argv):
       shutil.rmtree(temporary_dir)
     if output_dir != FLAGS.output_dir:
       shutil.rmtree(output_dir)
+    if TRACER.enabled:
+      TRACER.disable()
+      if FLAGS.trace_summary or FLAGS.trace_memory:
+        logging.info("Export phases:\n%s", TRACER.format_summary())
+      if FLAGS.trace_file:
+        try:
+          TRACER.write_chrome_trace(FLAGS.trace_file)
+          logging.info("Wrote trace to %s", FLAGS.trace_file)
+        except IOError as error:
+          logging.error("Failed when writing trace file %s (%s)",
+                        FLAGS.trace_file, str(error))
 
   return 0
 
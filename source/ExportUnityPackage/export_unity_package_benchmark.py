@@ -0,0 +1,951 @@
+#!/usr/bin/python
+#
+# Copyright 2026 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+r"""Benchmarks for export_unity_package.py.
+
+Each benchmark measures the wall clock time of alternative implementations of
+an operation performed by export_unity_package.py, for example:
+
+./export_unity_package_benchmark.py --benchmarks=compression \
+  --benchmark_data_size_mb=64 --benchmark_iterations=3
+
+Results are reported as a table of the best time of each implementation.
+
+The "project" benchmark exports a synthetic project generated from the
+benchmark_project_* flags.  To compare the export speed of commits write the
+results of each commit to a JSON file, for example:
+
+./export_unity_package_benchmark.py --benchmarks=project \
+  --benchmark_label=$(git rev-parse --short HEAD) \
+  --benchmark_output_json=/tmp/benchmark_$(git rev-parse --short HEAD).json
+"""
+
+import collections
+import copy
+import glob
+import hashlib
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from absl import app
+from absl import flags
+from absl import logging
+
+import export_unity_package
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_list("benchmarks", None, "Benchmarks to run.  If this isn't "
+                  "specified all benchmarks are run.")
+flags.DEFINE_integer("benchmark_iterations", 3, "Number of times each "
+                     "implementation is run, the best time is reported.")
+flags.DEFINE_integer("benchmark_data_size_mb", 32, "Approximate size of the "
+                     "data generated for each benchmark in megabytes.")
+flags.DEFINE_integer("benchmark_seed", 1, "Seed used to generate data.")
+flags.DEFINE_integer("benchmark_asset_count", 5000, "Number of assets "
+                     "generated for benchmarks that process asset metadata.")
+flags.DEFINE_string("benchmark_output_json", None, "JSON file to write the "
+                    "results of all benchmarks to.")
+flags.DEFINE_string("benchmark_label", None, "Label, e.g a commit hash, "
+                    "written with the results to benchmark_output_json.")
+flags.DEFINE_integer("benchmark_project_packages", 8, "Number of packages in "
+                     "the synthetic project.")
+flags.DEFINE_integer("benchmark_project_assets_per_package", 250, "Number of "
+                     "assets imported by each package of the synthetic "
+                     "project.")
+flags.DEFINE_integer("benchmark_project_include_depth", 2, "Length of the "
+                     "chains of packages that include the previous package.")
+flags.DEFINE_integer("benchmark_project_build_configs", 2, "Number of build "
+                     "configs of the synthetic project.")
+flags.DEFINE_integer("benchmark_project_sections", 2, "Number of sections "
+                     "enabled by build configs.  The last package of each "
+                     "include chain is only exported when one of the "
+                     "sections is enabled.")
+flags.DEFINE_float("benchmark_project_meta_ratio", 0.5, "Fraction of assets "
+                   "with a .meta file.")
+flags.DEFINE_float("benchmark_project_plugin_ratio", 0.2, "Fraction of assets "
+                   "that are plugins imported for a set of platforms.")
+flags.DEFINE_integer("benchmark_project_max_asset_size_kb", 64, "Maximum size "
+                     "of each asset, the size of each asset is random up to "
+                     "this size.")
+
+
+class BenchmarkResult(object):
+  """Result of benchmarking an implementation of an operation.
+
+  Attributes:
+    _name: Name of the implementation.
+    _seconds: Best wall clock time of the implementation.
+    _details: OrderedDict of additional values to report.
+  """
+
+  def __init__(self, name, seconds, details=None):
+    """Initialize the result.
+
+    Args:
+      name: Name of the implementation.
+      seconds: Best wall clock time of the implementation.
+      details: OrderedDict of additional values to report.
+    """
+    self._name = name
+    self._seconds = seconds
+    self._details = details or collections.OrderedDict()
+
+  @property
+  def name(self):
+    """Get the name of the implementation.
+
+    Returns:
+      Name of the implementation.
+    """
+    return self._name
+
+  @property
+  def seconds(self):
+    """Get the best wall clock time of the implementation.
+
+    Returns:
+      Time in seconds.
+    """
+    return self._seconds
+
+  @property
+  def details(self):
+    """Get additional values reported for the implementation.
+
+    Returns:
+      OrderedDict of values.
+    """
+    return self._details
+
+
+class FlagOverrides(object):
+  """Temporarily overrides flag values.
+
+  Attributes:
+    _overrides: Dictionary of flag values to set.
+    _original_values: Dictionary of flag values before they were overridden.
+  """
+
+  def __init__(self, **overrides):
+    """Initialize the overrides.
+
+    Args:
+      **overrides: Flag values to set while this object is active.
+    """
+    self._overrides = overrides
+    self._original_values = {}
+
+  def __enter__(self):
+    """Set the flag values."""
+    for name, value in self._overrides.items():
+      self._original_values[name] = getattr(FLAGS, name)
+      setattr(FLAGS, name, value)
+    return self
+
+  def __exit__(self, unused_type, unused_value, unused_traceback):
+    """Restore the flag values."""
+    for name, value in self._original_values.items():
+      setattr(FLAGS, name, value)
+
+
+def time_function(function, iterations):
+  """Call a function multiple times and return the best wall clock time.
+
+  Args:
+    function: Function to call with no arguments.
+    iterations: Number of times to call the function.
+
+  Returns:
+    (seconds, result) tuple where seconds is the best time and result is the
+    value returned by the last call to the function.
+  """
+  best_seconds = None
+  result = None
+  for _ in range(max(iterations, 1)):
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+    if best_seconds is None or seconds < best_seconds:
+      best_seconds = seconds
+  return (best_seconds, result)
+
+
+def measure_memory(function):
+  """Call a function and measure the memory it allocates.
+
+  Args:
+    function: Function to call with no arguments.
+
+  Returns:
+    (peak_bytes, retained_bytes) tuple where peak_bytes is the maximum amount
+    of memory allocated while the function was running and retained_bytes is
+    the amount of memory referenced by the value returned by the function.
+  """
+  tracemalloc.start()
+  try:
+    result = function()
+    retained_bytes, peak_bytes = tracemalloc.get_traced_memory()
+  finally:
+    tracemalloc.stop()
+  del result
+  return (peak_bytes, retained_bytes)
+
+
+def generate_asset_files(directory, total_size, seed):
+  """Generate files with a mix of compressible and incompressible data.
+
+  Args:
+    directory: Directory to write files to.
+    total_size: Approximate total size of the generated files in bytes.
+    seed: Seed of the random number generator.
+
+  Returns:
+    List of generated filenames relative to directory.
+  """
+  generator = random.Random(seed)
+  filenames = []
+  size = 0
+  index = 0
+  while size < total_size:
+    filename = os.path.join("Assets", "Dir%d" % (index % 16),
+                            "File%d.bytes" % index)
+    file_size = min(generator.randint(1024, 4 * 1024 * 1024),
+                    total_size - size)
+    # Half text like data that compresses well, half random binary data.
+    text = "".join(
+        generator.choice(["Assets/", "Plugins/", "Firebase", ".dll\n", "guid: ",
+                          str(generator.random())])
+        for _ in range(file_size // 16)).encode("utf8")
+    binary_size = file_size // 2
+    binary = (generator.getrandbits(binary_size * 8).to_bytes(binary_size,
+                                                              "little")
+              if binary_size else b"")
+    data = (text[:file_size // 2] + binary)[:file_size]
+    full_path = os.path.join(directory, filename)
+    if not os.path.exists(os.path.dirname(full_path)):
+      os.makedirs(os.path.dirname(full_path))
+    with open(full_path, "wb") as output_file:
+      output_file.write(data)
+    filenames.append(filename)
+    size += max(len(data), 1)
+    index += 1
+  return filenames
+
+
+class FileAccessCounter(object):
+  """Counts the files opened for reading and writing by this process.
+
+  Files are counted using an audit hook (see sys.addaudithook()) so files
+  accessed by child processes, e.g the tar command, are not counted.  Audit
+  hooks require Python 3.8 or later, files are not counted when they're not
+  supported.
+
+  Attributes:
+    _counting: Whether opened files are counted.
+    _read_paths: Set of paths opened for reading.
+    _written_paths: Set of paths opened for writing.
+  """
+
+  # Whether audit hooks are supported by this version of Python.
+  SUPPORTED = hasattr(sys, "addaudithook")
+  # Audit hooks can't be removed so a single hook is installed for all
+  # instances.
+  _active_counter = None
+  _hook_installed = False
+
+  def __init__(self):
+    """Initialize the counter."""
+    self._counting = False
+    self._read_paths = set()
+    self._written_paths = set()
+
+  @staticmethod
+  def _audit(event, args):
+    """Record an open event with the active counter.
+
+    Args:
+      event: Name of the audited event.
+      args: Tuple of the event's arguments.
+    """
+    counter = FileAccessCounter._active_counter
+    if counter and event == "open" and isinstance(args[0], (str, bytes)):
+      path, _, open_flags = args
+      if (open_flags or 0) & (os.O_WRONLY | os.O_RDWR):
+        counter._written_paths.add(path)  # pylint: disable=protected-access
+      else:
+        counter._read_paths.add(path)  # pylint: disable=protected-access
+
+  @property
+  def files_read(self):
+    """Get the number of files opened for reading.
+
+    Returns:
+      Number of files.
+    """
+    return len(self._read_paths)
+
+  @property
+  def files_written(self):
+    """Get the number of files opened for writing.
+
+    Returns:
+      Number of files.
+    """
+    return len(self._written_paths)
+
+  def __enter__(self):
+    """Start counting opened files."""
+    if not FileAccessCounter.SUPPORTED:
+      return self
+    if not FileAccessCounter._hook_installed:
+      sys.addaudithook(FileAccessCounter._audit)
+      FileAccessCounter._hook_installed = True
+    FileAccessCounter._active_counter = self
+    return self
+
+  def __exit__(self, unused_type, unused_value, unused_traceback):
+    """Stop counting opened files."""
+    FileAccessCounter._active_counter = None
+
+
+def reset_peak_rss():
+  """Reset the peak resident set size of this process, if supported.
+
+  Returns:
+    True if the peak was reset, False otherwise.
+  """
+  try:
+    with open("/proc/self/clear_refs", "wt") as clear_refs:
+      clear_refs.write("5")
+    return True
+  except (IOError, OSError):
+    return False
+
+
+def get_directory_size(directory):
+  """Get the number and total size of the files in a directory.
+
+  Args:
+    directory: Directory to search.
+
+  Returns:
+    (files, size) tuple where files is the number of files and size is the
+    total size of the files in bytes.
+  """
+  files = 0
+  size = 0
+  for dirpath, _, filenames in os.walk(directory):
+    for filename in filenames:
+      files += 1
+      size += os.path.getsize(os.path.join(dirpath, filename))
+  return (files, size)
+
+
+def generate_project(directory, seed):
+  """Generate the assets and configuration of a synthetic project.
+
+  The shape of the project is controlled by the benchmark_project_* flags.
+  Each package imports the assets in its own directory, plugins are split
+  between managed DLLs and desktop shared libraries.
+
+  Args:
+    directory: Directory to write assets to.
+    seed: Seed of the random number generator.
+
+  Returns:
+    Project configuration dictionary.
+  """
+  generator = random.Random(seed)
+  max_asset_size = FLAGS.benchmark_project_max_asset_size_kb * 1024
+  sections = ["section%d" % index
+              for index in range(FLAGS.benchmark_project_sections)]
+  include_depth = FLAGS.benchmark_project_include_depth
+  packages = []
+  for package_index in range(FLAGS.benchmark_project_packages):
+    package_name = "Package%d" % package_index
+    data_paths = []
+    plugin_paths = []
+    for asset_index in range(FLAGS.benchmark_project_assets_per_package):
+      if generator.random() < FLAGS.benchmark_project_plugin_ratio:
+        if asset_index % 2:
+          filename = os.path.join(package_name, "Plugins",
+                                  "Library%d.dll" % asset_index)
+        else:
+          filename = os.path.join("Plugins", "x86_64", package_name,
+                                  "libLibrary%d.so" % asset_index)
+        plugin_paths.append(filename)
+      else:
+        filename = os.path.join(package_name, "Data%d" % (asset_index % 8),
+                                "Asset%d.bytes" % asset_index)
+        data_paths.append(filename)
+      path = os.path.join(directory, filename)
+      if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+      # Half random data, half data that compresses well.
+      size = generator.randint(0, max_asset_size)
+      random_size = size // 2
+      with open(path, "wb") as asset_file:
+        asset_file.write(
+            generator.getrandbits(random_size * 8).to_bytes(random_size,
+                                                            "little") +
+            (filename.encode("utf8") * size)[:size - random_size])
+      if generator.random() < FLAGS.benchmark_project_meta_ratio:
+        with open(path + ".meta", "wt") as metadata_file:
+          metadata_file.write(
+              "fileFormatVersion: 2\n"
+              "guid: %s\n"
+              "labels:\n"
+              "- benchmark\n"
+              "DefaultImporter:\n"
+              "  userData:\n" % hashlib.md5(
+                  export_unity_package.posix_path(filename).encode(
+                      "utf8")).hexdigest())
+
+    package = collections.OrderedDict([
+        ("name", package_name + ".unitypackage"),
+        ("manifest_path", os.path.join(package_name, "Editor")),
+        ("imports", [collections.OrderedDict([("paths", data_paths)])])])
+    if plugin_paths:
+      package["imports"].append(collections.OrderedDict([
+          ("importer", "PluginImporter"),
+          ("platforms", ["Editor", "Standalone", "Android", "iOS"]),
+          ("cpu", "AnyCPU"),
+          ("paths", plugin_paths)]))
+    if package_index % (include_depth + 1):
+      package["includes"] = ["Package%d.unitypackage" % (package_index - 1)]
+    # The last package of each chain isn't included by another package so it
+    # can be excluded by sections.
+    if sections and package_index % (include_depth + 1) == include_depth:
+      package["sections"] = [
+          sections[package_index // (include_depth + 1) % len(sections)]]
+    package["export_upm"] = 1
+    package["common_manifest"] = collections.OrderedDict([
+        ("name", "com.benchmark.package%d" % package_index)])
+    packages.append(package)
+
+  builds = []
+  for build_index in range(FLAGS.benchmark_project_build_configs):
+    build = collections.OrderedDict([("name", "Build%d" % build_index)])
+    if sections:
+      build["enabled_sections"] = [sections[build_index % len(sections)]]
+    if build_index:
+      build["package_name_replacements"] = [collections.OrderedDict([
+          ("match", r"^(.*)(\.unitypackage|\.tgz)$"),
+          ("replacement", r"\1Build%d\2" % build_index)])]
+    builds.append(build)
+  return collections.OrderedDict([("packages", packages), ("builds", builds)])
+
+
+def benchmark_compression(work_dir):
+  """Compare the time taken by each archive compression implementation.
+
+  Args:
+    work_dir: Directory to write generated data and archives to.
+
+  Returns:
+    List of BenchmarkResult instances.
+  """
+  input_dir = os.path.join(work_dir, "input")
+  generate_asset_files(input_dir, FLAGS.benchmark_data_size_mb * 1024 * 1024,
+                       FLAGS.benchmark_seed)
+  output_dir = os.path.join(work_dir, "output")
+  os.makedirs(output_dir)
+
+  implementations = []
+  if platform.system() != "Windows":
+    implementations.append(("use_tar", {"use_tar": True,
+                                        "compression_threads": 1}))
+  implementations.extend([
+      ("tarfile", {"use_tar": False, "compression_threads": 1}),
+      ("tarfile_parallel_gzip", {"use_tar": False, "compression_threads": 0})])
+  if platform.system() != "Windows":
+    implementations.append(("use_tar_parallel_gzip",
+                            {"use_tar": True, "compression_threads": 0}))
+
+  results = []
+  for name, overrides in implementations:
+    archive_filename = os.path.join(output_dir, name + ".unitypackage")
+    with FlagOverrides(**overrides):
+      seconds, _ = time_function(
+          lambda: export_unity_package.PackageConfiguration.create_archive(
+              archive_filename, input_dir, 0),
+          FLAGS.benchmark_iterations)
+    results.append(BenchmarkResult(name, seconds, collections.OrderedDict(
+        [("size", os.path.getsize(archive_filename))])))
+  return results
+
+
+def benchmark_metadata(unused_work_dir):
+  """Compare the time and memory used to generate the metadata of assets.
+
+  Metadata generated by deep copying templates for each asset is compared with
+  metadata that shares read-only nodes between assets.
+
+  Args:
+    unused_work_dir: Not used.
+
+  Returns:
+    List of BenchmarkResult instances.
+  """
+  package = export_unity_package.PackageConfiguration(
+      export_unity_package.ProjectConfiguration({}, set(), "1.2.3"),
+      {"name": "Benchmark.unitypackage", "manifest_path": "Benchmark"})
+  asset_configuration = export_unity_package.AssetConfiguration(
+      package, collections.OrderedDict([
+          ("importer", "PluginImporter"),
+          ("platforms", ["Editor", "Standalone"]),
+          ("labels", ["benchmark"]),
+          ("override_metadata", collections.OrderedDict([
+              ("PluginImporter", collections.OrderedDict([
+                  ("platformData", collections.OrderedDict([
+                      ("iOS", collections.OrderedDict([
+                          ("enabled", 1)]))]))]))]))]))
+  filenames = [
+      os.path.join("Plugins", "x86_64" if index % 4 == 0 else "Managed",
+                   "Library%d%s" % (index, ".so" if index % 4 == 0 else ".dll"))
+      for index in range(FLAGS.benchmark_asset_count)]
+
+  def generate_metadata(metadata, filename):
+    """Generate the metadata of an asset like Asset.importer_metadata.
+
+    Args:
+      metadata: Metadata of the asset.  This is modified in-place.
+      filename: Filename of the asset.
+
+    Returns:
+      Generated metadata.
+    """
+    metadata = export_unity_package.Asset.add_labels_to_metadata(
+        metadata, set(["gvhp_exportpath-" + filename]))
+    metadata = export_unity_package.Asset.disable_unsupported_platforms(
+        metadata, filename)
+    metadata = export_unity_package.Asset.apply_any_platform_selection(
+        metadata)
+    return export_unity_package.Asset.set_cpu_for_desktop_platforms(metadata)
+
+  def deep_copy_metadata():
+    """Deep copy metadata for each asset.
+
+    Returns:
+      List of (metadata, generated_metadata) tuples for each asset.
+    """
+    importer_metadata = asset_configuration.importer_metadata
+    override_metadata = asset_configuration.override_metadata
+    metadata_list = []
+    for filename in filenames:
+      metadata = copy.deepcopy(importer_metadata)
+      export_unity_package.merge_ordered_dicts(metadata, override_metadata)
+      metadata_list.append((metadata, generate_metadata(
+          copy.deepcopy(metadata), filename)))
+    return metadata_list
+
+  def share_metadata():
+    """Share read-only metadata between assets like find_assets().
+
+    Returns:
+      List of Asset instances.
+    """
+    importer_metadata = export_unity_package.freeze(
+        asset_configuration.importer_metadata)
+    override_metadata = export_unity_package.freeze(
+        asset_configuration.override_metadata)
+    assets = []
+    for filename in filenames:
+      metadata = export_unity_package.thaw(importer_metadata)
+      export_unity_package.merge_ordered_dicts(metadata, override_metadata)
+      asset = export_unity_package.Asset(filename, filename, metadata)
+      asset.importer_metadata  # pylint: disable=pointless-statement
+      assets.append(asset)
+    return assets
+
+  results = []
+  for name, function in (("deepcopy", deep_copy_metadata),
+                         ("copy_on_write", share_metadata)):
+    seconds, _ = time_function(function, FLAGS.benchmark_iterations)
+    peak_bytes, retained_bytes = measure_memory(function)
+    results.append(BenchmarkResult(name, seconds, collections.OrderedDict(
+        [("peak_mb", "%.1f" % (peak_bytes / (1024.0 * 1024.0))),
+         ("retained_mb", "%.1f" % (retained_bytes / (1024.0 * 1024.0)))])))
+  return results
+
+
+def merge_ordered_dicts_nested_loop(merge_into, merge_from):
+  """Merge ordered dicts by searching platformData lists for each entry.
+
+  This is the implementation of export_unity_package.merge_ordered_dicts()
+  before platformData lists were indexed, it's used as a baseline.
+
+  Args:
+    merge_into: OrderedDict instance to merge values into.
+    merge_from: OrderedDict instance to merge values from.
+
+  Returns:
+    Value of merge_into.
+  """
+
+  def list_contains_dictionaries_with_keys(list_to_query, expected_keys):
+    """Check a list for dictionaries with exactly the specified keys.
+
+    Args:
+      list_to_query: List to query.
+      expected_keys: Keys to search for in each dictionary in the list.
+
+    Returns:
+      True if the list contains dictionaries with exactly the specified
+      keys, False otherwise.
+    """
+    list_matches = False
+    if issubclass(list_to_query.__class__, list):
+      list_matches = list_to_query and True
+      for item in list_to_query:
+        if not (issubclass(item.__class__, dict) and
+                sorted(item.keys()) == expected_keys):
+          list_matches = False
+          break
+    return list_matches
+
+  thaw = export_unity_package.thaw
+  expected_keys = export_unity_package.UNITY_5_6_PLATFORM_DATA_KEYS
+  for merge_from_key, merge_from_value in merge_from.items():
+    merge_into_value = merge_into.get(merge_from_key)
+    if merge_into_value is not None:
+      if (isinstance(merge_into_value, dict) and
+          isinstance(merge_from_value, dict)):
+        merge_into_value = thaw(merge_into_value)
+        merge_into[merge_from_key] = merge_into_value
+        merge_ordered_dicts_nested_loop(merge_into_value, merge_from_value)
+        continue
+      if (list_contains_dictionaries_with_keys(merge_into_value,
+                                               expected_keys) and
+          list_contains_dictionaries_with_keys(merge_from_value,
+                                               expected_keys)):
+        merge_into_value = thaw(merge_into_value)
+        merge_into[merge_from_key] = merge_into_value
+        for merge_from_list_item in merge_from_value:
+          merged = None
+          key = str(merge_from_list_item["first"])
+          for index, merge_into_list_item in enumerate(merge_into_value):
+            if str(merge_into_list_item["first"]) == key:
+              merge_into_list_item = thaw(merge_into_list_item)
+              merge_into_value[index] = merge_into_list_item
+              merge_ordered_dicts_nested_loop(merge_into_list_item,
+                                              merge_from_list_item)
+              merged = merge_into_list_item
+              break
+          if not merged:
+            merge_into_value.append(merge_from_list_item)
+        continue
+    merge_into[merge_from_key] = merge_from_value
+  return merge_into
+
+
+def benchmark_merge(unused_work_dir):
+  """Compare the time taken to merge Unity 5.6+ plugin metadata.
+
+  Metadata of plugins in the test data is expanded to target every platform
+  then merged with an override and the layers combined by
+  Asset.serialize_metadata() for each asset.
+
+  Args:
+    unused_work_dir: Not used.
+
+  Returns:
+    List of BenchmarkResult instances.
+  """
+  serializer = export_unity_package.YamlSerializer()
+  metadata_list = []
+  for metadata_filename in sorted(glob.glob(os.path.join(
+      os.path.dirname(os.path.abspath(__file__)), "test_data", "**",
+      "*.meta"), recursive=True)):
+    with open(metadata_filename, "rt", encoding="utf8") as metadata_file:
+      metadata = serializer.load(metadata_file.read())
+    platform_data = metadata.get("PluginImporter", {}).get("platformData")
+    if not isinstance(platform_data, list):
+      continue
+    # Enable the Any platform to add entries for every platform.
+    for entry in platform_data:
+      first, second = export_unity_package.Asset.platform_data_get_entry(entry)
+      if "Any" in first:
+        second["enabled"] = 1
+    metadata_list.append(export_unity_package.freeze(
+        export_unity_package.Asset.apply_any_platform_selection(metadata)))
+  override_metadata = export_unity_package.freeze(collections.OrderedDict([
+      ("PluginImporter", collections.OrderedDict([
+          ("platformData", [
+              collections.OrderedDict([
+                  ("first", collections.OrderedDict(
+                      [(export_unity_package.PLATFORM_TARGET_BY_PLATFORM.get(
+                          platform_name), platform_name)])),
+                  ("second", collections.OrderedDict([("enabled", 0)]))])
+              for platform_name in reversed(list(
+                  export_unity_package.PLATFORM_TARGET_BY_PLATFORM))])]))]))
+  template = export_unity_package.DEFAULT_METADATA_TEMPLATE
+
+  def merge_metadata(merge_function):
+    """Merge the metadata of each asset.
+
+    Args:
+      merge_function: Function used to merge metadata.
+
+    Returns:
+      Number of platformData entries in the merged metadata.
+    """
+    platform_count = 0
+    for index in range(FLAGS.benchmark_asset_count):
+      metadata = metadata_list[index % len(metadata_list)]
+      asset_metadata = export_unity_package.thaw(metadata)
+      merge_function(asset_metadata, override_metadata)
+      output_metadata = collections.OrderedDict()
+      for layer in (template, asset_metadata, collections.OrderedDict(
+          [("guid", "%032x" % index), ("timeCreated", 0)])):
+        merge_function(output_metadata, layer)
+      platform_count += len(output_metadata["PluginImporter"]["platformData"])
+    return platform_count
+
+  results = []
+  for name, merge_function in (
+      ("nested_loop", merge_ordered_dicts_nested_loop),
+      ("indexed", export_unity_package.merge_ordered_dicts)):
+    seconds, platform_count = time_function(
+        lambda function=merge_function: merge_metadata(function),
+        FLAGS.benchmark_iterations)
+    results.append(BenchmarkResult(name, seconds, collections.OrderedDict(
+        [("platforms", platform_count)])))
+  return results
+
+
+def benchmark_copy(work_dir):
+  """Compare the time taken to stage assets using each copy strategy.
+
+  The "auto" result reports the strategies selected for the work directory's
+  filesystem.
+
+  Args:
+    work_dir: Directory to write generated data and copies to.
+
+  Returns:
+    List of BenchmarkResult instances.
+  """
+  input_dir = os.path.join(work_dir, "input")
+  filenames = generate_asset_files(
+      input_dir, FLAGS.benchmark_data_size_mb * 1024 * 1024,
+      FLAGS.benchmark_seed)
+
+  results = []
+  for strategy in ("copy", "reflink", "copy_file_range", "sendfile",
+                   "hardlink", "auto"):
+    copier = export_unity_package.FileCopier()
+    output_dir = os.path.join(work_dir, strategy)
+
+    def copy_files():
+      """Copy all generated files to the output directory."""
+      if os.path.exists(output_dir):
+        shutil.rmtree(output_dir)
+      for filename in filenames:
+        target_path = os.path.join(output_dir, filename)
+        target_dir = os.path.dirname(target_path)
+        if not os.path.exists(target_dir):
+          os.makedirs(target_dir)
+        copier.copy_file(os.path.join(input_dir, filename), target_path,
+                         strategy=strategy)
+
+    seconds, _ = time_function(copy_files, FLAGS.benchmark_iterations)
+    results.append(BenchmarkResult(strategy, seconds, collections.OrderedDict(
+        [("used", ",".join(sorted(copier.copies_by_strategy)))])))
+    shutil.rmtree(output_dir)
+  return results
+
+
+def benchmark_project(work_dir):
+  """Measure the time and resources used to export a synthetic project.
+
+  The project is exported as .unitypackage and Unity Package Manager
+  packages with and without bounded memory.  GUIDs of the project's assets are
+  generated by an export before the measured exports.
+
+  Args:
+    work_dir: Directory to write the generated project and packages to.
+
+  Returns:
+    List of BenchmarkResult instances.
+  """
+  assets_dir = os.path.join(work_dir, "assets")
+  config = generate_project(assets_dir, FLAGS.benchmark_seed)
+  version = "1.0.0"
+  guids_json = {version: {}}
+
+  def export(for_upm, output_dir):
+    """Export all packages of the project.
+
+    Args:
+      for_upm: Whether to export Unity Package Manager packages.
+      output_dir: Directory to write packages to.
+
+    Returns:
+      Number of exported packages.
+    """
+    if os.path.exists(output_dir):
+      shutil.rmtree(output_dir)
+    os.makedirs(output_dir)
+    project = export_unity_package.ProjectConfiguration(config, set(),
+                                                        version)
+    return len(project.write(
+        export_unity_package.GuidDatabase(
+            export_unity_package.DuplicateGuidsChecker(), guids_json,
+            version),
+        [assets_dir], output_dir, 0, for_upm=for_upm))
+
+  results = []
+  for name, for_upm, bounded_memory in (
+      ("unitypackage", False, False), ("upm", True, False),
+      ("unitypackage_bounded_memory", False, True),
+      ("upm_bounded_memory", True, True)):
+    output_dir = os.path.join(work_dir, name)
+    # Add GUIDs for the assets without .meta files and generated assets.
+    for _ in range(2):
+      try:
+        export(for_upm, output_dir)
+        break
+      except export_unity_package.MissingGuidsError as error:
+        for path in error.missing_guid_paths:
+          guids_json[version][path] = hashlib.md5(
+              path.encode("utf8")).hexdigest()
+
+    with FlagOverrides(bounded_memory=bounded_memory):
+      seconds, packages = time_function(lambda: export(for_upm, output_dir),
+                                        FLAGS.benchmark_iterations)
+      peak_rss_reset = reset_peak_rss()
+      with FileAccessCounter() as file_access_counter:
+        export(for_upm, output_dir)
+      peak_rss = export_unity_package.get_peak_rss()
+      # The resident set size includes memory retained by previous exports so
+      # also measure the memory allocated by an export.
+      peak_bytes, _ = measure_memory(lambda: export(for_upm, output_dir))
+    output_files, output_bytes = get_directory_size(output_dir)
+    details = collections.OrderedDict([
+        ("packages", packages),
+        ("output_files", output_files),
+        ("output_bytes", output_bytes),
+        ("allocated_peak_mb", round(peak_bytes / (1024.0 * 1024.0), 1))])
+    if FileAccessCounter.SUPPORTED:
+      details["files_read"] = file_access_counter.files_read
+      details["files_written"] = file_access_counter.files_written
+    if peak_rss is not None:
+      # If the peak couldn't be reset this is the peak of the process.
+      details["peak_rss_mb" if peak_rss_reset else "process_peak_rss_mb"] = (
+          round(peak_rss / (1024.0 * 1024.0), 1))
+    results.append(BenchmarkResult(name, seconds, details))
+  return results
+
+
+BENCHMARKS = collections.OrderedDict([
+    ("compression", benchmark_compression),
+    ("metadata", benchmark_metadata),
+    ("merge", benchmark_merge),
+    ("copy", benchmark_copy),
+    ("project", benchmark_project),
+])
+
+
+def report_results(benchmark_name, results):
+  """Log a table of benchmark results.
+
+  Args:
+    benchmark_name: Name of the benchmark.
+    results: List of BenchmarkResult instances.
+  """
+  baseline_seconds = results[0].seconds if results else None
+  lines = ["%s:" % benchmark_name]
+  for result in results:
+    speedup = (baseline_seconds / result.seconds
+               if result.seconds else float("inf"))
+    details = " ".join(["%s=%s" % (key, value)
+                        for key, value in result.details.items()])
+    lines.append("  %-28s %10.3fs %7.2fx %s" % (result.name, result.seconds,
+                                                speedup, details))
+  logging.info("\n".join(lines))
+
+
+def write_results_json(filename, results_by_benchmark):
+  """Write benchmark results and the environment they were measured in.
+
+  Args:
+    filename: JSON file to write.
+    results_by_benchmark: OrderedDict of lists of BenchmarkResult instances
+      indexed by benchmark name.
+  """
+  benchmark_flags = collections.OrderedDict([
+      (name, value) for name, value in sorted(FLAGS.flag_values_dict().items())
+      if name.startswith("benchmark_") and name != "benchmark_output_json"])
+  with open(filename, "wt", encoding="utf8") as json_file:
+    json.dump(collections.OrderedDict([
+        ("label", FLAGS.benchmark_label),
+        ("timestamp", int(time.time())),
+        ("environment", collections.OrderedDict([
+            ("platform", platform.platform()),
+            ("python", platform.python_version()),
+            ("cpus", os.cpu_count())])),
+        ("flags", benchmark_flags),
+        ("benchmarks", collections.OrderedDict([
+            (benchmark_name, [
+                collections.OrderedDict(
+                    [("name", result.name), ("seconds", result.seconds)] +
+                    list(result.details.items()))
+                for result in results])
+            for benchmark_name, results in results_by_benchmark.items()]))]),
+              json_file, indent=2)
+
+
+def main(unused_argv):
+  """Run benchmarks.
+
+  Args:
+    unused_argv: Not used.
+
+  Returns:
+    0 if successful, 1 otherwise.
+  """
+  benchmark_names = FLAGS.benchmarks or list(BENCHMARKS)
+  unknown_benchmarks = [name for name in benchmark_names
+                        if name not in BENCHMARKS]
+  if unknown_benchmarks:
+    logging.error("Unknown benchmarks %s, available benchmarks %s",
+                  unknown_benchmarks, list(BENCHMARKS))
+    return 1
+
+  results_by_benchmark = collections.OrderedDict()
+  for benchmark_name in benchmark_names:
+    work_dir = tempfile.mkdtemp()
+    try:
+      results = BENCHMARKS[benchmark_name](work_dir)
+      report_results(benchmark_name, results)
+      results_by_benchmark[benchmark_name] = results
+    finally:
+      shutil.rmtree(work_dir)
+  if FLAGS.benchmark_output_json:
+    write_results_json(FLAGS.benchmark_output_json, results_by_benchmark)
+  return 0
+
+
+if __name__ == "__main__":
+  app.run(main)
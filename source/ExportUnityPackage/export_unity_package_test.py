@@ -17,9 +17,14 @@
 
 import collections
 import copy
+import errno
 import filecmp
+import glob
+import gzip
+import io
 import json
 import os
+import pickle
 import platform
 import re
 import shutil
@@ -27,6 +32,7 @@ import stat
 import sys
 import tarfile
 import time
+import tracemalloc
 from absl import flags
 from absl.testing import absltest
 
@@ -363,10 +369,284 @@ class YamlSerializerTest(absltest.TestCase):
                      "- 3\n",
                      yaml_string)
 
+  def test_yaml_backends_generate_identical_metadata(self):
+    """Ensure libyaml and pure Python backends generate identical metadata."""
+    pure_python_serializer = export_unity_package.YamlSerializer(
+        use_libyaml=False)
+    libyaml_serializer = export_unity_package.YamlSerializer()
+    self.assertFalse(pure_python_serializer.uses_libyaml)
+    if not libyaml_serializer.uses_libyaml:
+      self.skipTest("libyaml is not available")
+
+    metadata_filename = os.path.join(
+        TEST_DATA_PATH, "Assets", "PlayServicesResolver", "Editor",
+        "Google.VersionHandler.dll.meta")
+    with open(metadata_filename, "rt", encoding="utf8") as metadata_file:
+      metadata_yaml = metadata_file.read()
+    expected_metadata = (
+        "fileFormatVersion: 2\n"
+        "guid: 06f6f385a4ad409884857500a3c04441\n"
+        "labels:\n"
+        "- gvh\n"
+        "- gvh_teditor\n"
+        "- gvh_v1.2.86.0\n"
+        "- gvhp_exportpath-PlayServicesResolver/Editor/"
+        "Google.VersionHandler.dll\n"
+        "timeCreated: 0\n"
+        "PluginImporter:\n"
+        "  externalObjects: {}\n"
+        "  serializedVersion: 2\n"
+        "  iconMap: {}\n"
+        "  executionOrder: {}\n"
+        "  isPreloaded: 0\n"
+        "  isOverridable: 0\n"
+        "  platformData:\n"
+        "  - first:\n"
+        "      Any:\n"
+        "    second:\n"
+        "      enabled: 0\n"
+        "      settings: {}\n"
+        "  - first:\n"
+        "      Editor: Editor\n"
+        "    second:\n"
+        "      enabled: 1\n"
+        "      settings:\n"
+        "        DefaultValueInitialized: true\n"
+        "  - first:\n"
+        "      Windows Store Apps: WindowsStoreApps\n"
+        "    second:\n"
+        "      enabled: 0\n"
+        "      settings:\n"
+        "        CPU: AnyCPU\n"
+        "  userData:\n"
+        "  assetBundleName:\n"
+        "  assetBundleVariant:\n")
+    # Printable ASCII is emitted by libyaml, other strings are emitted by the
+    # pure Python implementation.
+    unusual_metadata = [
+        collections.OrderedDict(
+            [("labels", ["gvhp_exportpath-" + "Long/Path/" * 20 + "File.dll"]),
+             ("quoted", ["yes", "0123", "a: b", "*alias", "",
+                         "a: " + "long string " * 10]),
+             ("number", 1.5)]),
+        collections.OrderedDict(
+            [("userData", u"Unicode \u2713 " + "long string " * 10),
+             ("multiline", "line\nbreak\t" + "long string " * 10)])]
+
+    serializer = export_unity_package.YAML_SERIALIZER
+    try:
+      generated_metadata = []
+      for backend in (pure_python_serializer, libyaml_serializer):
+        export_unity_package.YAML_SERIALIZER = backend
+        asset = export_unity_package.Asset(
+            "PlayServicesResolver/Editor/Google.VersionHandler.dll", None,
+            backend.load(metadata_yaml))
+        generated_metadata.append(
+            [asset.generate_metadata("06f6f385a4ad409884857500a3c04441", 0)] +
+            [backend.dump(metadata) for metadata in unusual_metadata])
+    finally:
+      export_unity_package.YAML_SERIALIZER = serializer
+    self.assertEqual(expected_metadata, generated_metadata[0][0])
+    self.assertEqual(generated_metadata[0], generated_metadata[1])
+    self.assertEqual(unusual_metadata,
+                     [libyaml_serializer.load(metadata)
+                      for metadata in generated_metadata[1][1:]])
+
+
+class DumpSimpleYamlTest(absltest.TestCase):
+  """Test generating YAML without YamlSerializer."""
+
+  def setUp(self):
+    """Create the serializer used to generate expected output."""
+    super(DumpSimpleYamlTest, self).setUp()
+    self.serializer = export_unity_package.YamlSerializer(use_libyaml=False)
+
+  def test_dump_templates(self):
+    """Dump metadata generated from templates and test data."""
+    metadata_list = []
+    for template in (
+        export_unity_package.DEFAULT_IMPORTER_METADATA_TEMPLATE,
+        export_unity_package.PLUGIN_IMPORTER_METADATA_TEMPLATE,
+        export_unity_package.DEFAULT_FOLDER_METADATA_TEMPLATE):
+      metadata_list.append(template)
+    for metadata_filename in glob.glob(os.path.join(TEST_DATA_PATH, "**",
+                                                    "*.meta"), recursive=True):
+      with open(metadata_filename, "rt", encoding="utf8") as metadata_file:
+        metadata_list.append(self.serializer.load(metadata_file.read()))
+    for metadata in metadata_list:
+      tree = collections.OrderedDict()
+      for node in (export_unity_package.DEFAULT_METADATA_TEMPLATE, metadata,
+                   collections.OrderedDict(
+                       [("guid", "06f6f385a4ad409884857500a3c04441"),
+                        ("labels", ["gvh", "gvhp_exportpath-A/B.dll"]),
+                        ("timeCreated", 1480838400)])):
+        export_unity_package.merge_ordered_dicts(tree, copy.deepcopy(node))
+      simple_yaml = export_unity_package.dump_simple_yaml(tree)
+      self.assertIsNotNone(simple_yaml)
+      self.assertEqual(self.serializer.dump(tree), simple_yaml)
+
+  def test_dump_nested(self):
+    """Dump nested dictionaries and lists."""
+    tree = collections.OrderedDict(
+        [("a", [collections.OrderedDict(
+            [("x", [1, -2]),
+             ("y", collections.OrderedDict([("z", None)]))])]),
+         ("b", []),
+         ("c", collections.OrderedDict()),
+         ("d", False),
+         ("Windows Store Apps", "Windows Store Apps")])
+    self.assertEqual(self.serializer.dump(tree),
+                     export_unity_package.dump_simple_yaml(tree))
+
+  def test_dump_document_markers(self):
+    """Dump strings that start like YAML document markers."""
+    for value in ("...", "....", "...x", "... a", "---", "----", "---x", "..",
+                  ".", "./a", "..x", "a...", "a---"):
+      for tree in (collections.OrderedDict([("key", value)]),
+                   collections.OrderedDict([(value, 1)])):
+        simple_yaml = export_unity_package.dump_simple_yaml(tree)
+        if simple_yaml is not None:
+          self.assertEqual(self.serializer.dump(tree), simple_yaml,
+                           msg=repr(value))
+    self.assertIsNone(export_unity_package.dump_simple_yaml(
+        collections.OrderedDict([("key", "....")])))
+    self.assertIsNone(export_unity_package.dump_simple_yaml(
+        collections.OrderedDict([("key", "...x")])))
+
+  def test_dump_unsupported(self):
+    """Ensure trees that require quoting or folding are not dumped."""
+    for value in (1.5, "yes", "0123", "", "a: b", " a", "a ", "-a", "\u2713",
+                  "line\nbreak", "word " * 20, [None], [[1]],
+                  [collections.OrderedDict()]):
+      self.assertIsNone(export_unity_package.dump_simple_yaml(
+          collections.OrderedDict([("key", value)])), msg=repr(value))
+    self.assertIsNone(export_unity_package.dump_simple_yaml(
+        collections.OrderedDict([("k" * 128, 1)])))
+    self.assertIsNone(export_unity_package.dump_simple_yaml([1]))
+
+
+class ReadOnlyTest(absltest.TestCase):
+  """Test read-only containers."""
+
+  def setUp(self):
+    """Create a tree of read-only containers."""
+    super(ReadOnlyTest, self).setUp()
+    self.tree = collections.OrderedDict(
+        [("b", [1, collections.OrderedDict([("c", 2)])]),
+         ("a", "hello")])
+    self.frozen = export_unity_package.freeze(self.tree)
+
+  def test_freeze(self):
+    """Freeze a tree of dictionaries and lists."""
+    self.assertIsInstance(self.frozen, export_unity_package.ReadOnlyOrderedDict)
+    self.assertIsInstance(self.frozen["b"], export_unity_package.ReadOnlyList)
+    self.assertIsInstance(self.frozen["b"][1],
+                          export_unity_package.ReadOnlyOrderedDict)
+    self.assertEqual(self.tree, self.frozen)
+    self.assertEqual(["b", "a"], list(self.frozen))
+    self.assertIs(self.frozen, export_unity_package.freeze(self.frozen))
+
+  def test_modify(self):
+    """Ensure read-only containers can't be modified."""
+    with self.assertRaises(TypeError):
+      self.frozen["a"] = "bye"
+    with self.assertRaises(TypeError):
+      del self.frozen["a"]
+    with self.assertRaises(TypeError):
+      self.frozen.update({"a": "bye"})
+    with self.assertRaises(TypeError):
+      self.frozen.setdefault("d", 1)
+    with self.assertRaises(TypeError):
+      self.frozen["b"].append(3)
+    with self.assertRaises(TypeError):
+      self.frozen["b"][0] = 3
+    with self.assertRaises(TypeError):
+      self.frozen["b"][1]["c"] = 3
+    self.assertEqual(self.tree, self.frozen)
+
+  def test_copy(self):
+    """Ensure copies of read-only containers are mutable."""
+    shallow_copy = copy.copy(self.frozen)
+    shallow_copy["a"] = "bye"
+    self.assertEqual("hello", self.frozen["a"])
+    deep_copy = copy.deepcopy(self.frozen)
+    self.assertIs(collections.OrderedDict, type(deep_copy))
+    deep_copy["b"][1]["c"] = 3
+    deep_copy["b"].append(4)
+    self.assertEqual(self.tree, self.frozen)
+    thawed = export_unity_package.thaw(self.frozen["b"])
+    thawed.append(4)
+    self.assertEqual(2, len(self.frozen["b"]))
+
+  def test_pickle(self):
+    """Pickle read-only containers."""
+    unpickled = pickle.loads(pickle.dumps(self.frozen))
+    self.assertIsInstance(unpickled, export_unity_package.ReadOnlyOrderedDict)
+    self.assertIsInstance(unpickled["b"], export_unity_package.ReadOnlyList)
+    self.assertEqual(self.tree, unpickled)
+
+  def test_dump_yaml(self):
+    """Serialize read-only containers to YAML."""
+    serializer = export_unity_package.YamlSerializer()
+    self.assertEqual(serializer.dump(self.tree),
+                     serializer.dump(self.frozen))
+
+
+class TreeFingerprintTest(absltest.TestCase):
+  """Test hashing trees of dictionaries and lists."""
+
+  def test_fingerprint(self):
+    """Hash equivalent and differing trees."""
+    tree = collections.OrderedDict(
+        [("a", [1, "2", None]),
+         ("b", collections.OrderedDict([("c", True)]))])
+    fingerprint = export_unity_package.tree_fingerprint(tree)
+    self.assertEqual(fingerprint, export_unity_package.tree_fingerprint(
+        copy.deepcopy(tree)))
+    self.assertEqual(fingerprint, export_unity_package.tree_fingerprint(
+        export_unity_package.freeze(tree)))
+    for different_tree in (
+        collections.OrderedDict([("b", tree["b"]), ("a", tree["a"])]),
+        collections.OrderedDict([("a", [1, 2, None]), ("b", tree["b"])]),
+        collections.OrderedDict([("a", [1, "2", ""]), ("b", tree["b"])]),
+        collections.OrderedDict([("a", [1, "2", None]), ("b", {"c": 1})])):
+      self.assertNotEqual(fingerprint,
+                          export_unity_package.tree_fingerprint(
+                              different_tree))
+
 
 class MergeOrderedDictsTest(absltest.TestCase):
   """Test merging ordered dictionaries."""
 
+  def test_merge_read_only(self):
+    """Merge into a dictionary that references read-only nodes."""
+    platform_data = export_unity_package.freeze(
+        [collections.OrderedDict(
+            [("first", collections.OrderedDict([("Editor", "Editor")])),
+             ("second", collections.OrderedDict([("enabled", 0)]))])])
+    nested = export_unity_package.freeze(
+        collections.OrderedDict([("b", 1), ("c", 2)]))
+    merge_into = collections.OrderedDict(
+        [("a", nested), ("platformData", platform_data)])
+    merge_from = collections.OrderedDict(
+        [("a", collections.OrderedDict([("c", 3)])),
+         ("platformData", [
+             collections.OrderedDict(
+                 [("first", collections.OrderedDict([("Editor", "Editor")])),
+                  ("second", collections.OrderedDict([("enabled", 1)]))]),
+             collections.OrderedDict(
+                 [("first", collections.OrderedDict([("Any", None)])),
+                  ("second", collections.OrderedDict([("enabled", 0)]))])])])
+    export_unity_package.merge_ordered_dicts(merge_into, merge_from)
+    self.assertEqual(collections.OrderedDict([("b", 1), ("c", 3)]),
+                     merge_into["a"])
+    self.assertEqual(2, len(merge_into["platformData"]))
+    self.assertEqual(1, merge_into["platformData"][0]["second"]["enabled"])
+    # Read-only nodes should not be modified.
+    self.assertEqual(collections.OrderedDict([("b", 1), ("c", 2)]), nested)
+    self.assertEqual(1, len(platform_data))
+    self.assertEqual(0, platform_data[0]["second"]["enabled"])
+
   def test_merge_with_empty(self):
     """"Merge a dictionary with an empty dictionary."""
     merge_into = collections.OrderedDict()
@@ -501,6 +781,38 @@ class MergeOrderedDictsTest(absltest.TestCase):
                          merge_into, merge_from))
     self.assertEqual(expected, merge_into)
 
+  def test_merge_first_second_duplicates(self):
+    """Merge lists of dictionaries that contain duplicate "first" items."""
+
+    def platform(name, enabled):
+      """Create a platformData entry.
+
+      Args:
+        name: Name of the platform.
+        enabled: Value of the enabled setting.
+
+      Returns:
+        OrderedDict platformData entry.
+      """
+      return collections.OrderedDict(
+          [("first", collections.OrderedDict([("Standalone", name)])),
+           ("second", collections.OrderedDict([("enabled", enabled)]))])
+
+    merge_into = collections.OrderedDict(
+        [("platformData", [platform("Linux", 0), platform("Win", 0),
+                           platform("Linux", 0)])])
+    merge_from = collections.OrderedDict(
+        [("platformData", [platform("Linux", 1), platform("OSX", 0),
+                           platform("OSX", 1)])])
+    export_unity_package.merge_ordered_dicts(merge_into, merge_from)
+    # Only the first matching dictionary is merged and dictionaries appended
+    # to the list are merged with subsequent dictionaries.
+    self.assertEqual(
+        collections.OrderedDict(
+            [("platformData", [platform("Linux", 1), platform("Win", 0),
+                               platform("Linux", 0), platform("OSX", 1)])]),
+        merge_into)
+
 
 class ConfigurationBlockTest(absltest.TestCase):
   """Test parsing common configuration options from JSON."""
@@ -690,6 +1002,68 @@ class ProjectConfigurationTest(absltest.TestCase):
     self.assertCountEqual(set(["debug", "experimental"]),
                           config.selected_sections)
 
+  def test_select_sections_cached(self):
+    """Test selecting previously selected sections."""
+    config = export_unity_package.ProjectConfiguration(
+        {
+            "packages": [
+                {"name": "FirebaseApp.unitypackage"},
+                {"name": "FirebaseAnalytics.unitypackage",
+                 "includes": ["FirebaseApp.unitypackage"]},
+                {"name": "FirebaseAuth.unitypackage",
+                 "includes": ["FirebaseApp.unitypackage"],
+                 "sections": ["experimental"]},
+            ],
+            "builds": [
+                {"name": "production"},
+                {"name": "experimental", "sections": ["experimental"]},
+            ],
+        }, set(), None)
+    checked_packages = []
+    package_configuration_class = export_unity_package.PackageConfiguration
+    check_circular_references_in_includes = (
+        package_configuration_class.check_circular_references_in_includes)
+
+    def check_and_record_package(package, parents,
+                                 checked_package_names=None):
+      """Record packages checked for circular references.
+
+      Args:
+        package: Package being checked.
+        parents: List of parents packages including this package.
+        checked_package_names: Set of names of packages already checked.
+      """
+      checked_packages.append(package.name)
+      check_circular_references_in_includes(package, parents,
+                                            checked_package_names)
+
+    setattr(package_configuration_class,
+            "check_circular_references_in_includes", check_and_record_package)
+    try:
+      config.selected_sections = set(["experimental"])
+      # The includes of each package are only searched once, FirebaseApp is
+      # skipped when it's checked again as an include.
+      self.assertEqual(["FirebaseApp.unitypackage",
+                        "FirebaseAnalytics.unitypackage",
+                        "FirebaseApp.unitypackage",
+                        "FirebaseAuth.unitypackage",
+                        "FirebaseApp.unitypackage"], checked_packages)
+      del checked_packages[:]
+      config.selected_sections = set()
+      config.selected_sections = set(["experimental"])
+      self.assertEqual([], checked_packages)
+    finally:
+      setattr(package_configuration_class,
+              "check_circular_references_in_includes",
+              check_circular_references_in_includes)
+    self.assertCountEqual(["FirebaseApp.unitypackage",
+                           "FirebaseAnalytics.unitypackage",
+                           "FirebaseAuth.unitypackage"],
+                          config.packages_by_name.keys())
+    self.assertCountEqual(["experimental", "production"],
+                          [b.name for b in config.builds])
+    self.assertEqual(set(["experimental"]), config.selected_sections)
+
   def test_duplicate_packages(self):
     """Test parsing a project with duplicate packages."""
     config_json = {
@@ -1436,6 +1810,37 @@ class AssetTest(absltest.TestCase):
     self.assertEqual(collections.OrderedDict(),
                      asset.importer_metadata_original)
 
+  def test_init_windows_paths(self):
+    """Initialize an Asset instance with Windows paths."""
+    asset = export_unity_package.Asset(
+        "Plugins\\x86\\libFooBar.so", "C:\\assets\\Plugins\\x86\\libFooBar.so",
+        collections.OrderedDict())
+    self.assertEqual("Plugins/x86/libFooBar.so", asset.filename)
+    self.assertEqual("C:/assets/Plugins/x86/libFooBar.so",
+                     asset.filename_absolute)
+    self.assertEqual("Plugins/x86/libFooBar.so", asset.filename_guid_lookup)
+    self.assertIn("gvh_linuxlibname-FooBar", asset.importer_metadata["labels"])
+
+  def test_hash_and_sort(self):
+    """Hash, compare and sort assets."""
+    metadata = collections.OrderedDict([("a", 1)])
+    bar = export_unity_package.Asset("bar", "/tmp/bar", metadata)
+    foo = export_unity_package.Asset("foo", "/tmp/foo", metadata)
+    other_foo = export_unity_package.Asset("foo", "/tmp/foo",
+                                           copy.deepcopy(metadata))
+    different_foo = export_unity_package.Asset(
+        "foo", "/tmp/foo", collections.OrderedDict([("a", 2)]))
+    self.assertFalse(hasattr(foo, "__dict__"))
+    self.assertEqual(foo, other_foo)
+    self.assertEqual(hash(foo), hash(other_foo))
+    self.assertNotEqual(foo, different_foo)
+    self.assertEqual(2, len(set([bar, foo, other_foo])))
+    self.assertEqual([bar, foo], sorted([foo, bar]))
+    self.assertEqual([bar, foo],
+                     export_unity_package.Asset.sorted_by_filename(
+                         iter([foo, bar])))
+    self.assertEqual(foo, pickle.loads(pickle.dumps(foo)))
+
   def test_repr(self):
     """Convert an asset to a string."""
     self.assertRegexMatch(
@@ -1476,6 +1881,20 @@ class AssetTest(absltest.TestCase):
     self.assertEqual(metadata_linuxlibname, asset.importer_metadata_original)
     self.assertEqual(expected_metadata, asset.importer_metadata)
 
+  def test_importer_metadata_cached(self):
+    """Ensure importer metadata is generated once and is read-only."""
+    asset = export_unity_package.Asset("Plugins/noarch/libFooBar.so", None,
+                                       self.default_metadata)
+    importer_metadata = asset.importer_metadata
+    self.assertIs(importer_metadata, asset.importer_metadata)
+    with self.assertRaises(TypeError):
+      importer_metadata["labels"] = []
+    with self.assertRaises(TypeError):
+      importer_metadata["labels"].append("foo")
+    metadata_copy = copy.deepcopy(importer_metadata)
+    metadata_copy["labels"].append("foo")
+    self.assertNotIn("foo", asset.importer_metadata["labels"])
+
   def test_add_labels_to_metadata(self):
     """Add labels to importer metadata."""
     metadata = export_unity_package.Asset.add_labels_to_metadata(
@@ -1892,6 +2311,46 @@ class AssetTest(absltest.TestCase):
       self.assertEqual("Assets/foo/bar/Google.VersionHandler.dll",
                        pathname.read())
 
+  def test_archive_entries(self):
+    """Test Asset.archive_entries()."""
+    asset_path = os.path.join(
+        self.assets_dir,
+        "PlayServicesResolver/Editor/Google.VersionHandler.dll")
+    asset = export_unity_package.Asset("foo/bar/Google.VersionHandler.dll",
+                                       asset_path, self.default_metadata)
+
+    entries = asset.archive_entries("06f6f385a4ad409884857500a3c04441",
+                                    timestamp=123456789)
+
+    self.assertEqual(
+        [("06f6f385a4ad409884857500a3c04441", True, None, 0o755),
+         ("06f6f385a4ad409884857500a3c04441/asset", False, asset_path, 0o775),
+         ("06f6f385a4ad409884857500a3c04441/asset.meta", False, None, 0o644),
+         ("06f6f385a4ad409884857500a3c04441/pathname", False, None, 0o644)],
+        [(entry.arcname, entry.is_directory, entry.source_filename, entry.mode)
+         for entry in entries])
+    self.assertEqual(
+        "fileFormatVersion: 2\n"
+        "guid: 06f6f385a4ad409884857500a3c04441\n"
+        "labels:\n"
+        "- gvh\n"
+        "- gvh_version-1.2.3\n"
+        "- gvhp_exportpath-foo/bar/Google.VersionHandler.dll\n"
+        "timeCreated: 123456789\n"
+        "DefaultImporter:\n"
+        "  userData:\n"
+        "  assetBundleName:\n"
+        "  assetBundleVariant:\n", entries[2].data.decode("utf-8"))
+    self.assertEqual(b"Assets/foo/bar/Google.VersionHandler.dll",
+                     entries[3].data)
+
+  def test_archive_entries_folder(self):
+    """Test Asset.archive_entries() for folder asset."""
+    asset = export_unity_package.Asset(
+        "foo/bar", "foo/bar", self.default_metadata, is_folder=True)
+    self.assertEqual(
+        [], asset.archive_entries("5187848eea9240faaec2deb7d66107db"))
+
   def test_write_folder(self):
     """Test Asset.write() for folder asset."""
 
@@ -2317,6 +2776,36 @@ class AssetPackageAndProjectFileOperationsTest(absltest.TestCase):
          ("Firebase/Plugins/Firebase.Auth.dll", self.expected_metadata_auth)],
         [(asset.filename, asset.importer_metadata) for asset in found_assets])
 
+  def test_find_assets_share_metadata(self):
+    """Ensure assets share metadata that isn't modified."""
+    config = export_unity_package.AssetConfiguration(
+        self.package, {"paths": ["Firebase/Plugins/Firebase.A*t*.dll"],
+                       "importer": "PluginImporter",
+                       "platforms": ["Editor"],
+                       "override_metadata": {"PluginImporter": {
+                           "platformData": {"iOS": {"enabled": 1}}}}})
+    plugin_template = copy.deepcopy(
+        export_unity_package.PLUGIN_IMPORTER_METADATA_TEMPLATE)
+    analytics, auth = config.find_assets([self.assets_dir])
+    analytics_platform_data = analytics.importer_metadata_original[
+        "PluginImporter"]["platformData"]
+    auth_platform_data = auth.importer_metadata_original[
+        "PluginImporter"]["platformData"]
+    self.assertEqual(1, auth_platform_data["Editor"]["enabled"])
+    self.assertEqual(1, auth_platform_data["iOS"]["enabled"])
+    self.assertIs(analytics_platform_data["Editor"],
+                  auth_platform_data["Editor"])
+    self.assertIs(
+        export_unity_package.PLUGIN_IMPORTER_METADATA_TEMPLATE[
+            "PluginImporter"]["platformData"]["tvOS"],
+        auth_platform_data["tvOS"])
+    self.assertNotEqual(analytics.importer_metadata["labels"],
+                        auth.importer_metadata["labels"])
+    self.assertIs(auth.importer_metadata_original["PluginImporter"],
+                  auth.importer_metadata["PluginImporter"])
+    self.assertEqual(plugin_template,
+                     export_unity_package.PLUGIN_IMPORTER_METADATA_TEMPLATE)
+
   def test_find_assets_with_metadata(self):
     """Walk a set of paths using a wildcard with metadata."""
     config = export_unity_package.AssetConfiguration(
@@ -2401,6 +2890,52 @@ class AssetPackageAndProjectFileOperationsTest(absltest.TestCase):
         [(asset.filename, asset.importer_metadata) for asset in found_assets_upm
         ])
 
+  def test_find_assets_for_both_formats_reads_metadata_once(self):
+    """Find assets for .unitypackage and UPM packages with a single search."""
+    yaml_load = export_unity_package.YAML_SERIALIZER.load
+    loaded_yaml = []
+
+    def fake_yaml_load(yaml_string):
+      """Record and parse each YAML document."""
+      loaded_yaml.append(yaml_string)
+      return yaml_load(yaml_string)
+
+    config = export_unity_package.AssetConfiguration(
+        self.package,
+        collections.OrderedDict([
+            ("paths", ["PlayServicesResolver/Editor/Google.VersionHandler.*",
+                       "Firebase/Plugins/Firebase.App.dll"])]))
+    upm_override_config = export_unity_package.AssetConfiguration(
+        self.package,
+        collections.OrderedDict([
+            ("paths", ["PlayServicesResolver/Editor/Google.VersionHandler.*"]),
+            ("override_metadata_upm", collections.OrderedDict([
+                ("labels", ["upm"])]))]))
+    try:
+      export_unity_package.YAML_SERIALIZER.load = fake_yaml_load
+      found_assets = config.find_assets([self.assets_dir])
+      found_assets_upm = config.find_assets([self.assets_dir], for_upm=True)
+      override_assets = upm_override_config.find_assets([self.assets_dir])
+      override_assets_upm = upm_override_config.find_assets([self.assets_dir],
+                                                            for_upm=True)
+    finally:
+      export_unity_package.YAML_SERIALIZER.load = yaml_load
+
+    # Each .meta file is parsed once by each asset group.
+    self.assertEqual(2, len(loaded_yaml))
+    # Without UPM overrides the same assets are shared by both formats.
+    self.assertEqual(2, len(found_assets))
+    for asset, asset_upm in zip(found_assets, found_assets_upm):
+      self.assertIs(asset, asset_upm)
+    # UPM overrides are merged over the metadata of the shared assets.
+    self.assertEqual(1, len(override_assets_upm))
+    self.assertEqual(["upm"],
+                     override_assets_upm[0].importer_metadata_original[
+                         "labels"])
+    self.assertIs(
+        override_assets[0].importer_metadata_original["PluginImporter"],
+        override_assets_upm[0].importer_metadata_original["PluginImporter"])
+
   def test_find_assets_with_exclusions(self):
     """Find assets for a package with a subset of files excluded."""
     config_json = {
@@ -2518,6 +3053,46 @@ class AssetPackageAndProjectFileOperationsTest(absltest.TestCase):
          r"settings in .*PlayServicesResolver\.unitypackage', "
          r".*PlayServicesResolverConflicting\.unitypackage'"])
 
+  def test_find_assets_via_includes_with_equal_metadata(self):
+    """Find assets with metadata that is equal but differently typed."""
+    config_json = {
+        "packages": [
+            {"name": "FirebaseApp.unitypackage",
+             "imports": [
+                 {"paths": ["Firebase/Plugins/Firebase.App.dll"],
+                  "override_metadata": {"DefaultImporter": {"userData": 1}}}
+             ]},
+            {"name": "FirebaseAppBoolean.unitypackage",
+             "imports": [
+                 {"paths": ["Firebase/Plugins/Firebase.App.dll"],
+                  "override_metadata": {"DefaultImporter": {"userData": True}}}
+             ]},
+            {"name": "FirebaseAnalytics.unitypackage",
+             "imports": [
+                 {"paths": ["Firebase/Plugins/Firebase.Analytics.dll"]}
+             ],
+             "includes": [
+                 "FirebaseApp.unitypackage",
+                 "FirebaseAppBoolean.unitypackage"
+             ]
+            }
+        ]
+    }
+
+    config = export_unity_package.ProjectConfiguration(config_json, set(), None)
+    packages_by_name = config.packages_by_name
+    app_asset = packages_by_name["FirebaseApp.unitypackage"].find_assets(
+        [self.assets_dir])[0]
+    app_boolean_asset = packages_by_name[
+        "FirebaseAppBoolean.unitypackage"].find_assets([self.assets_dir])[0]
+    self.assertNotEqual(app_asset.metadata_fingerprint,
+                        app_boolean_asset.metadata_fingerprint)
+    found_assets = packages_by_name[
+        "FirebaseAnalytics.unitypackage"].find_assets([self.assets_dir])
+    self.assertEqual(["Firebase/Plugins/Firebase.Analytics.dll",
+                      "Firebase/Plugins/Firebase.App.dll"],
+                     [asset.filename for asset in found_assets])
+
   def test_find_assets_for_upm(self):
     """Find assets for UPM package.
 
@@ -2686,6 +3261,251 @@ class AssetPackageAndProjectFileOperationsTest(absltest.TestCase):
       shutil.rmtree(test_case_dir)
       export_unity_package.FLAGS.use_tar = use_tar
 
+  def test_package_write_archive(self):
+    """Create a unitypackage archive from archive entries."""
+    source_filename = os.path.join(self.assets_dir,
+                                   "Firebase/Plugins/Firebase.App.dll")
+    entries = [
+        export_unity_package.ArchiveEntry("d/e.txt", data="world"),
+        export_unity_package.ArchiveEntry("a", is_directory=True),
+        export_unity_package.ArchiveEntry(
+            "a/b.dll", source_filename=source_filename, mode=0o775),
+        export_unity_package.ArchiveEntry("d", is_directory=True),
+    ]
+    archive_filename = os.path.join(self.staging_dir, "archive.unitypackage")
+    export_unity_package.PackageConfiguration.write_archive(archive_filename,
+                                                            entries, 0)
+
+    with tarfile.open(archive_filename, "r:gz") as archive_file:
+      self.assertEqual(
+          [("a", 0o755, True), ("a/b.dll", 0o775, False),
+           ("d", 0o755, True), ("d/e.txt", 0o644, False)],
+          [(member.name, member.mode, member.isdir())
+           for member in archive_file.getmembers()])
+      for member in archive_file.getmembers():
+        self.assertEqual(0, member.mtime)
+        self.assertEqual(FLAGS.owner, member.uname)
+        self.assertEqual(FLAGS.group, member.gname)
+      self.assertEqual(b"world", archive_file.extractfile("d/e.txt").read())
+      with open(source_filename, "rb") as source_file:
+        self.assertEqual(source_file.read(),
+                         archive_file.extractfile("a/b.dll").read())
+
+    # Archives written from the same entries should be identical.
+    other_archive_filename = os.path.join(self.staging_dir,
+                                          "archive2.unitypackage")
+    os.rename(archive_filename, other_archive_filename)
+    time.sleep(1)
+    export_unity_package.PackageConfiguration.write_archive(archive_filename,
+                                                            entries, 0)
+    self.assertTrue(filecmp.cmp(archive_filename, other_archive_filename,
+                                shallow=False))
+
+  def test_link_or_copy_archive(self):
+    """Copy archives to a different filename renaming them in the header."""
+    entries = [export_unity_package.ArchiveEntry("a.txt", data="hello")]
+    compression_threads = FLAGS.compression_threads
+    try:
+      for threads in (1, 2):
+        FLAGS.compression_threads = threads
+        archive_dir = os.path.join(self.staging_dir, "threads%d" % threads)
+        filenames = [os.path.join(archive_dir, "a.unitypackage"),
+                     os.path.join(archive_dir, "longer_name.unitypackage")]
+        for filename in filenames:
+          export_unity_package.PackageConfiguration.write_archive(filename,
+                                                                  entries, 0)
+        copied_filename = os.path.join(archive_dir, "copy",
+                                       "longer_name.unitypackage")
+        export_unity_package.link_or_copy_archive(filenames[0],
+                                                  copied_filename)
+        self.assertTrue(filecmp.cmp(filenames[1], copied_filename,
+                                    shallow=False))
+    finally:
+      FLAGS.compression_threads = compression_threads
+
+    # Files that do not store a filename in a gzip header are linked.
+    source_filename = os.path.join(self.staging_dir, "plain.txt")
+    with open(source_filename, "wt") as source_file:
+      source_file.write("hello")
+    linked_filename = os.path.join(self.staging_dir, "linked.txt")
+    export_unity_package.link_or_copy_archive(source_filename, linked_filename)
+    self.assertTrue(os.path.samefile(source_filename, linked_filename))
+
+  def test_package_create_archive_parallel_compression(self):
+    """Create archives compressed with multiple threads."""
+    archive_dir = os.path.join(self.staging_dir, "archive_dir")
+    os.makedirs(os.path.join(archive_dir, "a"))
+    contents = b"".join([b"line %d\n" % i for i in range(100000)])
+    with open(os.path.join(archive_dir, "a", "b.txt"), "wb") as input_file:
+      input_file.write(contents)
+    entries = [
+        export_unity_package.ArchiveEntry("a", is_directory=True),
+        export_unity_package.ArchiveEntry(
+            "a/b.txt", source_filename=os.path.join(archive_dir, "a", "b.txt"))
+    ]
+    use_tar = FLAGS.use_tar
+    compression_threads = FLAGS.compression_threads
+    compression_level = FLAGS.compression_level
+    try:
+      FLAGS.compression_threads = 4
+      FLAGS.compression_level = 6
+      for use_tar_value in ((False, True) if platform.system() != "Darwin"
+                            else (False,)):
+        FLAGS.use_tar = use_tar_value
+        archive_filenames = []
+        for i in range(2):
+          archive_filename = os.path.join(
+              self.staging_dir, str(i), "archive%s.unitypackage" % use_tar_value)
+          os.makedirs(os.path.dirname(archive_filename), exist_ok=True)
+          export_unity_package.PackageConfiguration.create_archive(
+              archive_filename, archive_dir, 0)
+          archive_filenames.append(archive_filename)
+          with tarfile.open(archive_filename, "r:gz") as archive_file:
+            self.assertEqual(contents,
+                             archive_file.extractfile("a/b.txt").read())
+        self.assertTrue(filecmp.cmp(archive_filenames[0], archive_filenames[1],
+                                    shallow=False))
+
+      archive_filenames = []
+      for i in range(2):
+        FLAGS.compression_threads = i + 2
+        archive_filename = os.path.join(self.staging_dir, str(i),
+                                        "streamed.unitypackage")
+        export_unity_package.PackageConfiguration.write_archive(
+            archive_filename, entries, 0)
+        archive_filenames.append(archive_filename)
+      # The number of threads should not change the archive.
+      self.assertTrue(filecmp.cmp(archive_filenames[0], archive_filenames[1],
+                                  shallow=False))
+      with tarfile.open(archive_filenames[0], "r:gz") as archive_file:
+        self.assertEqual(contents, archive_file.extractfile("a/b.txt").read())
+    finally:
+      FLAGS.use_tar = use_tar
+      FLAGS.compression_threads = compression_threads
+      FLAGS.compression_level = compression_level
+
+  def test_package_create_archive_compression_failure(self):
+    """Stop the tar process if compressing its output fails."""
+    if platform.system() not in ("Linux", "Darwin"):
+      return
+    archive_dir = os.path.join(self.staging_dir, "archive_dir")
+    os.makedirs(os.path.join(archive_dir, "a"))
+    with open(os.path.join(archive_dir, "a", "b.txt"), "wb") as input_file:
+      input_file.write(os.urandom(1024 * 1024))
+    use_tar = FLAGS.use_tar
+    compression_threads = FLAGS.compression_threads
+    popen = export_unity_package.subprocess.Popen
+    write = export_unity_package.ParallelGzipWriter.write
+    processes = []
+
+    def recording_popen(*args, **kwargs):
+      """Record each started process."""
+      process = popen(*args, **kwargs)
+      processes.append(process)
+      return process
+
+    def failing_write(unused_self, unused_data):
+      """Fail to compress data."""
+      raise IOError("Disk full")
+
+    try:
+      FLAGS.use_tar = True
+      FLAGS.compression_threads = 2
+      export_unity_package.subprocess.Popen = recording_popen
+      export_unity_package.ParallelGzipWriter.write = failing_write
+      with self.assertRaises(IOError):
+        export_unity_package.PackageConfiguration.create_archive(
+            os.path.join(self.staging_dir, "archive.unitypackage"),
+            archive_dir, 0)
+    finally:
+      export_unity_package.subprocess.Popen = popen
+      export_unity_package.ParallelGzipWriter.write = write
+      FLAGS.use_tar = use_tar
+      FLAGS.compression_threads = compression_threads
+    self.assertEqual(1, len(processes))
+    self.assertIsNotNone(processes[0].returncode)
+
+  def test_package_create_archives_concurrently(self):
+    """Create many archives from parallel threads."""
+    input_dirs = []
+    for i in range(8):
+      input_dir = os.path.join(self.staging_dir, "input%d" % i)
+      for j in range(i + 1):
+        filename = os.path.join(input_dir, "dir%d" % (j % 3), "file%d.txt" % j)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, "wb") as input_file:
+          input_file.write(b"".join([b"%d %d\n" % (i, k)
+                                     for k in range(j * 1000)]))
+      input_dirs.append(input_dir)
+
+    use_tar = FLAGS.use_tar
+    cwd = os.getcwd()
+    try:
+      for use_tar_value in (False, True):
+        FLAGS.use_tar = use_tar_value
+        # Create the archives serially to compare with archives created
+        # concurrently.
+        expected_filenames = []
+        for i, input_dir in enumerate(input_dirs):
+          archive_filename = os.path.join(
+              self.staging_dir, "serial%s" % use_tar_value,
+              "archive%d.unitypackage" % i)
+          export_unity_package.PackageConfiguration.create_archive(
+              archive_filename, input_dir, 0)
+          expected_filenames.append(archive_filename)
+
+        for iteration in range(3):
+          output_dir = os.path.join(self.staging_dir, "concurrent%s%d" % (
+              use_tar_value, iteration))
+          archives = [(os.path.join(output_dir, "archive%d.unitypackage" % i),
+                       input_dir) for i, input_dir in enumerate(input_dirs)]
+          self.assertEqual(
+              [archive_filename for archive_filename, _ in archives],
+              export_unity_package.PackageConfiguration.create_archives(
+                  archives, 0, threads=8))
+          self.assertEqual(cwd, os.getcwd())
+          for expected_filename, (archive_filename, _) in zip(
+              expected_filenames, archives):
+            self.assertTrue(filecmp.cmp(expected_filename, archive_filename,
+                                        shallow=False))
+
+      with self.assertRaises(ValueError):
+        export_unity_package.PackageConfiguration.create_archives(
+            [(os.path.join(self.staging_dir, "same.unitypackage"), input_dir)
+             for input_dir in input_dirs[:2]], 0)
+    finally:
+      FLAGS.use_tar = use_tar
+
+  def test_package_write_streamed_matches_staged(self):
+    """Write a .unitypackage file with and without staging assets."""
+    project, guids_json = self._create_multi_build_project()
+    package = project.packages_by_name["FirebaseAnalytics.unitypackage"]
+    stream_archives = FLAGS.stream_archives
+    contents_by_stream_archives = {}
+    try:
+      for stream in (False, True):
+        FLAGS.stream_archives = stream
+        output_dir = os.path.join(self.staging_dir, str(stream))
+        unitypackage = package.write(
+            export_unity_package.GuidDatabase(
+                export_unity_package.DuplicateGuidsChecker(), guids_json,
+                "1.0.0"),
+            [self.assets_dir], output_dir, 0)
+        with tarfile.open(unitypackage, "r:gz") as unitypackage_file:
+          contents = []
+          for member in unitypackage_file.getmembers():
+            data = None
+            if member.isfile():
+              data = unitypackage_file.extractfile(member).read()
+            contents.append((os.path.normpath(member.name), member.isdir(),
+                             data))
+          contents_by_stream_archives[stream] = sorted(contents)
+    finally:
+      FLAGS.stream_archives = stream_archives
+    self.assertEqual(16, len(contents_by_stream_archives[True]))
+    self.assertEqual(contents_by_stream_archives[False],
+                     contents_by_stream_archives[True])
+
   def test_package_write(self):
     """Write a .unitypackage file."""
     project = export_unity_package.ProjectConfiguration(
@@ -2941,6 +3761,634 @@ class AssetPackageAndProjectFileOperationsTest(absltest.TestCase):
             "Assets/PlayServicesResolver/Editor/Google.VersionHandler.dll\n",
             manifest.read())
 
+  def _create_multi_build_project(self):
+    """Create a project with multiple packages and build configs.
+
+    Returns:
+      (project, guids_json) tuple where project is a ProjectConfiguration
+      instance and guids_json is a GUIDs JSON dictionary for the project.
+    """
+    project = export_unity_package.ProjectConfiguration(
+        {
+            "packages": [{
+                "name": "FirebaseApp.unitypackage",
+                "manifest_path": "Firebase/Editor",
+                "imports": [{
+                    "paths": ["Firebase/Plugins/Firebase.App.dll"]
+                }]
+            }, {
+                "name": "FirebaseAnalytics.unitypackage",
+                "manifest_path": "Firebase/Editor",
+                "imports": [{
+                    "paths": ["Firebase/Plugins/Firebase.Analytics.dll"]
+                }],
+                "includes": ["FirebaseApp.unitypackage"]
+            }, {
+                "name": "FirebaseAuth.unitypackage",
+                "imports": [{
+                    "paths": ["Firebase/Plugins/Firebase.Auth.dll"]
+                }],
+                "includes": ["FirebaseApp.unitypackage"]
+            }],
+            "builds": [{
+                "name": "public"
+            }, {
+                "name": "experimental",
+                "package_name_replacements": [{
+                    "match": r"^(.*)(\.unitypackage)$",
+                    "replacement": r"\1Experimental\2"
+                }]
+            }]
+        }, set(), "1.0.0")
+    guids_json = {
+        "1.0.0": {
+            "Firebase/Editor/FirebaseApp_version-1.0.0_manifest.txt":
+                "08d62f799cbd4b02a3ff77313706a3c0",
+            "Firebase/Editor/FirebaseAnalytics_version-1.0.0_manifest.txt":
+                "4a3f361c622e4b88b6f61a126cc8083d",
+            "Firebase/Plugins/Firebase.App.dll":
+                "7311924048bd457bac6d713576c952da",
+            "Firebase/Plugins/Firebase.Analytics.dll":
+                "816270c2a2a348e59cb9b7b096a24f50",
+            "Firebase/Plugins/Firebase.Auth.dll":
+                "275bd6b96a28470986154b9a995e191c"
+        }
+    }
+    return project, guids_json
+
+  def test_project_write_in_parallel(self):
+    """Export a project with worker processes and compare with serial."""
+    project, guids_json = self._create_multi_build_project()
+    output_filenames_by_jobs = {}
+    for jobs in (1, 2):
+      output_dir = os.path.join(self.staging_dir, "jobs%d" % jobs)
+      os.makedirs(output_dir)
+      output_filenames_by_jobs[jobs] = sorted(project.write(
+          export_unity_package.GuidDatabase(
+              export_unity_package.DuplicateGuidsChecker(), guids_json,
+              "1.0.0"),
+          [self.assets_dir], output_dir, 0, jobs=jobs))
+
+    self.assertEqual(
+        [os.path.join(self.staging_dir, "jobs1", filename) for filename in (
+            "FirebaseAnalytics.unitypackage",
+            "FirebaseAnalyticsExperimental.unitypackage",
+            "FirebaseApp.unitypackage",
+            "FirebaseAppExperimental.unitypackage",
+            "FirebaseAuth.unitypackage",
+            "FirebaseAuthExperimental.unitypackage")],
+        output_filenames_by_jobs[1])
+    for serial_filename, parallel_filename in zip(
+        output_filenames_by_jobs[1], output_filenames_by_jobs[2]):
+      self.assertEqual(os.path.basename(serial_filename),
+                       os.path.basename(parallel_filename))
+      self.assertTrue(filecmp.cmp(serial_filename, parallel_filename,
+                                  shallow=False))
+
+  def test_project_write_in_parallel_missing_guids(self):
+    """Export a project with worker processes with missing GUIDs."""
+    project, guids_json = self._create_multi_build_project()
+    del guids_json["1.0.0"]["Firebase/Plugins/Firebase.Analytics.dll"]
+    del guids_json["1.0.0"]["Firebase/Plugins/Firebase.Auth.dll"]
+    with self.assertRaises(export_unity_package.MissingGuidsError) as context:
+      project.write(
+          export_unity_package.GuidDatabase(
+              export_unity_package.DuplicateGuidsChecker(), guids_json,
+              "1.0.0"),
+          [self.assets_dir], self.staging_dir, 0, jobs=2)
+    self.assertEqual(["Firebase/Plugins/Firebase.Analytics.dll",
+                      "Firebase/Plugins/Firebase.Auth.dll"],
+                     context.exception.missing_guid_paths)
+
+  def test_project_write_with_trace(self):
+    """Export a project while tracing each phase of the export."""
+    project, guids_json = self._create_multi_build_project()
+    tracer = export_unity_package.TRACER
+    tracer.enable()
+    try:
+      project.write(
+          export_unity_package.GuidDatabase(
+              export_unity_package.DuplicateGuidsChecker(), guids_json,
+              "1.0.0"),
+          [self.assets_dir], self.staging_dir, 0)
+    finally:
+      tracer.disable()
+    summary = tracer.summary()
+    self.assertEqual(6, summary["write_package"][1])
+    self.assertEqual(3, summary["find_assets"][1])
+    self.assertEqual(3, summary["write_archive"][1])
+    self.assertIn("transform_metadata", summary)
+    self.assertGreater(summary["write_archive"][2], 0)
+
+    trace_filename = os.path.join(self.staging_dir, "trace.json")
+    tracer.write_chrome_trace(trace_filename)
+    with open(trace_filename, "rt", encoding="utf-8") as trace_file:
+      trace = json.load(trace_file)
+    package_events = [event for event in trace["traceEvents"]
+                      if event["name"] == "write_package"]
+    self.assertEqual(
+        [("public", "FirebaseApp.unitypackage"),
+         ("experimental", "FirebaseAppExperimental.unitypackage")],
+        [(event["args"]["build"], event["args"]["filename"])
+         for event in package_events
+         if event["args"]["package"] == "FirebaseApp.unitypackage"])
+    for event in package_events:
+      self.assertEqual("X", event["ph"])
+      self.assertGreaterEqual(event["dur"], 0)
+
+  def test_project_write_bounded_memory(self):
+    """Export a project with bounded memory and compare with the default."""
+    output_dirs = []
+    try:
+      for bounded_memory, stream_archives in ((False, True), (True, True),
+                                              (False, False), (True, False)):
+        project, guids_json = self._create_multi_build_project()
+        FLAGS.bounded_memory = bounded_memory
+        FLAGS.stream_archives = stream_archives
+        output_dir = os.path.join(self.staging_dir, "bounded%d_stream%d" % (
+            bounded_memory, stream_archives))
+        os.makedirs(output_dir)
+        output_dirs.append(output_dir)
+        project.write(
+            export_unity_package.GuidDatabase(
+                export_unity_package.DuplicateGuidsChecker(), guids_json,
+                "1.0.0"),
+            [self.assets_dir], output_dir, 0)
+        # pylint: disable=protected-access
+        self.assertEqual(
+            not bounded_memory,
+            any(package._resolved_assets for package in project.packages))
+        # pylint: enable=protected-access
+    finally:
+      FLAGS.bounded_memory = False
+      FLAGS.stream_archives = True
+
+    filenames = sorted(os.listdir(output_dirs[0]))
+    self.assertEqual(6, len(filenames))
+    for output_dir in output_dirs[1:]:
+      self.assertEqual(filenames, sorted(os.listdir(output_dir)))
+    for filename in filenames:
+      self.assertTrue(filecmp.cmp(os.path.join(output_dirs[0], filename),
+                                  os.path.join(output_dirs[1], filename),
+                                  shallow=False))
+      self.assertTrue(filecmp.cmp(os.path.join(output_dirs[2], filename),
+                                  os.path.join(output_dirs[3], filename),
+                                  shallow=False))
+
+  def test_project_get_contents(self):
+    """Resolve the contents of a project and compare with written packages."""
+    project, guids_json = self._create_multi_build_project()
+    plan = export_unity_package.get_contents_plan(
+        project,
+        export_unity_package.GuidDatabase(
+            export_unity_package.DuplicateGuidsChecker(), guids_json,
+            "1.0.0"),
+        [self.assets_dir], [False])
+    self.assertEqual([], os.listdir(self.staging_dir))
+    self.assertEqual(
+        ["FirebaseApp.unitypackage", "FirebaseAnalytics.unitypackage",
+         "FirebaseAuth.unitypackage", "FirebaseAppExperimental.unitypackage",
+         "FirebaseAnalyticsExperimental.unitypackage",
+         "FirebaseAuthExperimental.unitypackage"],
+        list(plan))
+    self.assertEqual("experimental",
+                     plan["FirebaseAppExperimental.unitypackage"]["build"])
+    self.assertEqual("FirebaseApp.unitypackage",
+                     plan["FirebaseAppExperimental.unitypackage"]["package"])
+
+    project.write(
+        export_unity_package.GuidDatabase(
+            export_unity_package.DuplicateGuidsChecker(), guids_json,
+            "1.0.0"),
+        [self.assets_dir], self.staging_dir, 0)
+    for package_filename, package_plan in plan.items():
+      self.assertEqual("unitypackage", package_plan["format"])
+      guids_by_path = {}
+      with tarfile.open(os.path.join(self.staging_dir,
+                                     package_filename)) as archive:
+        for member in archive.getmembers():
+          if member.name.endswith("/pathname"):
+            guids_by_path[archive.extractfile(member).read().decode(
+                "utf8")] = member.name.split("/")[0]
+      self.assertEqual(
+          guids_by_path,
+          dict([("Assets/" + asset["path"], asset["guid"])
+                for asset in package_plan["assets"]]))
+      for asset in package_plan["assets"]:
+        self.assertEqual(64, len(asset["metadata_fingerprint"]))
+
+  def test_project_get_contents_upm(self):
+    """Resolve the contents of UPM packages and compare with written ones."""
+    project = export_unity_package.ProjectConfiguration(
+        {
+            "packages": [{
+                "name": "ios-resolver.unitypackage",
+                "imports": [{
+                    "paths": [
+                        "PlayServicesResolver/Editor/Google.IOSResolver_*.dll",
+                    ]
+                }],
+                "common_manifest": {
+                    "name": "com.google.ios-resolver",
+                },
+                "export_upm": 1,
+            }, {
+                "name": "play-services-resolver.unitypackage",
+                "imports": [{
+                    "paths": [
+                        "PlayServicesResolver/Editor/Google.VersionHandler.dll",
+                    ]
+                }],
+                "manifest_path": "PlayServicesResolver/Editor",
+                "readme": "PlayServicesResolver/Editor/README.md",
+                "includes": ["ios-resolver.unitypackage"],
+                "common_manifest": {
+                    "name": "com.google.play-services-resolver",
+                },
+                "export_upm": 1,
+            }]
+        }, set(), "1.0.0")
+    guids_json = {
+        "1.0.0": {
+            "PlayServicesResolver/Editor/"
+            "play-services-resolver_version-1.0.0_manifest.txt":
+                "353f6aace2cd42adb1343fc6a808f62e",
+            "com.google.ios-resolver/PlayServicesResolver":
+                "282ed9a78d9bd9782e79eeb5e32815c9",
+            "com.google.ios-resolver/PlayServicesResolver/Editor":
+                "2d18edac0cc5f42eacdfa10e276ad05a",
+            "com.google.ios-resolver/package.json":
+                "6843742945dcefa5fe3cd77bceba0489",
+            "com.google.play-services-resolver/PlayServicesResolver":
+                "fa7daf703ad1430dad0cd8b764e5e6d2",
+            "com.google.play-services-resolver/PlayServicesResolver/Editor":
+                "2334cd7684164851a8a53db5bd5923ca",
+            "com.google.play-services-resolver/README.md":
+                "baa27a4c0385454899a759d9852966b7",
+            "com.google.play-services-resolver/package.json":
+                "782a38c5f19e4bb99e927976c8daa9ac",
+        }
+    }
+    plan = export_unity_package.get_contents_plan(
+        project,
+        export_unity_package.GuidDatabase(
+            export_unity_package.DuplicateGuidsChecker(), guids_json,
+            "1.0.0"),
+        [self.assets_dir], [True])
+    self.assertEqual([], os.listdir(self.staging_dir))
+    self.assertEqual(
+        ["com.google.ios-resolver-1.0.0.tgz",
+         "com.google.play-services-resolver-1.0.0.tgz"], sorted(plan))
+    package_plan = plan["com.google.play-services-resolver-1.0.0.tgz"]
+    self.assertEqual("upm", package_plan["format"])
+    self.assertEqual("play-services-resolver.unitypackage",
+                     package_plan["package"])
+    self.assertEqual(
+        ["PlayServicesResolver", "PlayServicesResolver/Editor",
+         "PlayServicesResolver/Editor/Google.VersionHandler.dll",
+         "PlayServicesResolver/Editor/"
+         "play-services-resolver_version-1.0.0_manifest.txt",
+         "README.md", "package.json"],
+        [asset["path"] for asset in package_plan["assets"]])
+
+    project.write(
+        export_unity_package.GuidDatabase(
+            export_unity_package.DuplicateGuidsChecker(), guids_json,
+            "1.0.0"),
+        [self.assets_dir], self.staging_dir, 0, for_upm=True)
+    for package_filename, package_plan in plan.items():
+      guids_by_path = {}
+      with tarfile.open(os.path.join(self.staging_dir,
+                                     package_filename)) as archive:
+        for member in archive.getmembers():
+          if member.name.endswith(".meta"):
+            metadata = export_unity_package.YAML_SERIALIZER.load(
+                archive.extractfile(member).read().decode("utf8"))
+            guids_by_path[member.name[len("package/"):-len(".meta")]] = (
+                metadata["guid"])
+      self.assertEqual(
+          guids_by_path,
+          dict([(asset["path"], asset["guid"])
+                for asset in package_plan["assets"]]))
+
+  def test_project_watcher(self):
+    """Export packages affected by changes to source files."""
+    project, guids_json = self._create_multi_build_project()
+    assets_dir = os.path.join(self.staging_dir, "Assets")
+    shutil.copytree(self.assets_dir, assets_dir)
+    output_dir = os.path.join(self.staging_dir, "output")
+    os.makedirs(output_dir)
+    watcher = export_unity_package.ProjectWatcher(
+        project,
+        export_unity_package.GuidDatabase(
+            export_unity_package.DuplicateGuidsChecker(), guids_json,
+            "1.0.0"),
+        [assets_dir], output_dir, 0, [False])
+    self.assertEqual(6, watcher.start())
+    self.assertIsNone(watcher.poll())
+
+    auth_dll = os.path.join(assets_dir, "Firebase", "Plugins",
+                            "Firebase.Auth.dll")
+    self.assertEqual(
+        set([(False, "FirebaseAuth.unitypackage"),
+             (False, "FirebaseAuthExperimental.unitypackage")]),
+        watcher.get_outputs(auth_dll + ".meta"))
+
+    def touch(path):
+      """Move the modification time of a file forward.
+
+      Args:
+        path: File to modify.
+      """
+      modification_time = os.path.getmtime(path) + 10
+      os.utime(path, (modification_time, modification_time))
+
+    def read_output_mtimes():
+      """Read the modification time of each exported package.
+
+      Returns:
+        Dictionary of modification times indexed by package filename.
+      """
+      return dict([(filename,
+                    os.stat(os.path.join(output_dir, filename)).st_mtime_ns)
+                   for filename in os.listdir(output_dir)])
+
+    # Only packages that include the modified file should be exported.
+    output_mtimes = read_output_mtimes()
+    time.sleep(0.01)
+    touch(auth_dll)
+    changed_paths, outputs, latency = watcher.poll()
+    self.assertEqual([os.path.normpath(os.path.abspath(auth_dll))],
+                     changed_paths)
+    self.assertEqual(
+        set([(False, "FirebaseAuth.unitypackage"),
+             (False, "FirebaseAuthExperimental.unitypackage")]), outputs)
+    self.assertGreaterEqual(latency, 0.0)
+    self.assertEqual(
+        set(["FirebaseAuth.unitypackage",
+             "FirebaseAuthExperimental.unitypackage"]),
+        set([filename for filename, mtime in read_output_mtimes().items()
+             if mtime != output_mtimes[filename]]))
+    self.assertIsNone(watcher.poll())
+
+    # Files included by all packages should export all packages.
+    touch(os.path.join(assets_dir, "Firebase", "Plugins",
+                       "Firebase.App.dll"))
+    _, outputs, _ = watcher.poll()
+    self.assertEqual(6, len(outputs))
+
+    # Files that aren't referenced by any package shouldn't export anything.
+    touch(os.path.join(assets_dir, "PlayServicesResolver", "Editor",
+                       "CHANGELOG.md"))
+    _, outputs, _ = watcher.poll()
+    self.assertEqual(set(), outputs)
+
+    # Adding a file should export all packages.
+    with open(os.path.join(assets_dir, "Firebase", "Plugins", "New.txt"),
+              "wt") as new_file:
+      new_file.write("new")
+    changed_paths, outputs, _ = watcher.poll()
+    self.assertEqual(1, len(changed_paths))
+    self.assertEqual(6, len(outputs))
+
+  def test_project_watcher_after_failure(self):
+    """Export packages that failed to export when files change."""
+    project, guids_json = self._create_multi_build_project()
+    auth_guid = guids_json["1.0.0"].pop("Firebase/Plugins/Firebase.Auth.dll")
+    assets_dir = os.path.join(self.staging_dir, "Assets")
+    shutil.copytree(self.assets_dir, assets_dir)
+    output_dir = os.path.join(self.staging_dir, "output")
+    os.makedirs(output_dir)
+    watcher = export_unity_package.ProjectWatcher(
+        project,
+        export_unity_package.GuidDatabase(
+            export_unity_package.DuplicateGuidsChecker(), guids_json,
+            "1.0.0"),
+        [assets_dir], output_dir, 0, [False])
+    watcher.run(0, max_polls=1)
+    self.assertNotIn("FirebaseAuth.unitypackage", os.listdir(output_dir))
+    auth_outputs = set([(False, "FirebaseAuth.unitypackage"),
+                        (False, "FirebaseAuthExperimental.unitypackage")])
+    auth_dll = os.path.join(assets_dir, "Firebase", "Plugins",
+                            "Firebase.Auth.dll")
+    self.assertEqual(auth_outputs, watcher.get_outputs(auth_dll))
+
+    # Packages that failed to export are exported again by the next change.
+    readme = os.path.join(assets_dir, "PlayServicesResolver", "Editor",
+                          "CHANGELOG.md")
+    modification_time = os.path.getmtime(readme) + 10
+    os.utime(readme, (modification_time, modification_time))
+    with self.assertRaises(export_unity_package.MissingGuidsError):
+      watcher.poll()
+
+    # Fix the missing GUID.
+    with open(auth_dll + ".meta", "wt") as metadata_file:
+      metadata_file.write("fileFormatVersion: 2\nguid: %s\n" % auth_guid)
+    _, outputs, _ = watcher.poll()
+    self.assertEqual(6, len(outputs))
+    self.assertIn("FirebaseAuth.unitypackage", os.listdir(output_dir))
+    self.assertIn("FirebaseAuthExperimental.unitypackage",
+                  os.listdir(output_dir))
+
+    # Nothing is exported once all packages have been exported.
+    modification_time += 10
+    os.utime(readme, (modification_time, modification_time))
+    _, outputs, _ = watcher.poll()
+    self.assertEqual(set(), outputs)
+
+  def test_project_write_with_export_plan(self):
+    """Export a project loaded from a precompiled export plan."""
+    project, guids_json = self._create_multi_build_project()
+    # pylint: disable=protected-access
+    config_data = json.dumps(project._json).encode("utf8")
+    plan_filename = os.path.join(self.staging_dir, "cache", "export.plan")
+    key = export_unity_package.ExportPlan.compute_key(config_data, set(),
+                                                      "1.0.0")
+    self.assertIsNone(export_unity_package.ExportPlan.load(plan_filename, key))
+
+    plan = export_unity_package.ExportPlan.compile(config_data, set(),
+                                                   "1.0.0", [False])
+    self.assertEqual(key, plan.key)
+    plan.save(plan_filename)
+    loaded_plan = export_unity_package.ExportPlan.load(plan_filename, key)
+    self.assertEqual(key, loaded_plan.key)
+    self.assertEqual(
+        [(False, "FirebaseApp.unitypackage", "FirebaseApp.unitypackage",
+          ["Firebase/Plugins/Firebase.App.dll"]),
+         (False, "FirebaseAnalytics.unitypackage",
+          "FirebaseAnalytics.unitypackage",
+          ["Firebase/Plugins/Firebase.Analytics.dll",
+           "Firebase/Plugins/Firebase.App.dll"]),
+         (False, "FirebaseAuth.unitypackage", "FirebaseAuth.unitypackage",
+          ["Firebase/Plugins/Firebase.Auth.dll",
+           "Firebase/Plugins/Firebase.App.dll"]),
+         (False, "FirebaseAppExperimental.unitypackage",
+          "FirebaseApp.unitypackage", ["Firebase/Plugins/Firebase.App.dll"]),
+         (False, "FirebaseAnalyticsExperimental.unitypackage",
+          "FirebaseAnalytics.unitypackage",
+          ["Firebase/Plugins/Firebase.Analytics.dll",
+           "Firebase/Plugins/Firebase.App.dll"]),
+         (False, "FirebaseAuthExperimental.unitypackage",
+          "FirebaseAuth.unitypackage",
+          ["Firebase/Plugins/Firebase.Auth.dll",
+           "Firebase/Plugins/Firebase.App.dll"])],
+        [(for_upm, output_filename, package.name,
+          [path for asset_config in asset_configs
+           for path in sorted(asset_config.paths)])
+         for for_upm, output_filename, package, asset_configs in (
+             loaded_plan.entries)])
+
+    # The plan is invalidated when the configuration or sections change.
+    self.assertIsNone(export_unity_package.ExportPlan.load(
+        plan_filename, export_unity_package.ExportPlan.compute_key(
+            config_data + b" ", set(), "1.0.0")))
+    self.assertIsNone(export_unity_package.ExportPlan.load(
+        plan_filename, export_unity_package.ExportPlan.compute_key(
+            config_data, set(["experimental"]), "1.0.0")))
+
+    output_filenames = []
+    for name, export_project in (("project", project),
+                                 ("plan", loaded_plan.project)):
+      output_dir = os.path.join(self.staging_dir, name)
+      os.makedirs(output_dir)
+      output_filenames.append(sorted(export_project.write(
+          export_unity_package.GuidDatabase(
+              export_unity_package.DuplicateGuidsChecker(), guids_json,
+              "1.0.0"),
+          [self.assets_dir], output_dir, 0)))
+    self.assertEqual(6, len(output_filenames[1]))
+    for project_filename, plan_output_filename in zip(*output_filenames):
+      self.assertEqual(os.path.basename(project_filename),
+                       os.path.basename(plan_output_filename))
+      self.assertTrue(filecmp.cmp(project_filename, plan_output_filename,
+                                  shallow=False))
+
+  def test_package_find_assets_memoized(self):
+    """Ensure assets of included packages are only searched once."""
+    project, _ = self._create_multi_build_project()
+    find_assets = export_unity_package.AssetConfiguration.find_assets
+    searched_packages = []
+
+    def fake_find_assets(asset_config, assets_dirs, for_upm=False):
+      """Record and search for assets."""
+      # pylint: disable=protected-access
+      searched_packages.append(asset_config._package.name)
+      return find_assets(asset_config, assets_dirs, for_upm=for_upm)
+
+    try:
+      export_unity_package.AssetConfiguration.find_assets = fake_find_assets
+      packages_by_name = project.packages_by_name
+      analytics = packages_by_name["FirebaseAnalytics.unitypackage"]
+      auth = packages_by_name["FirebaseAuth.unitypackage"]
+      analytics_assets = analytics.find_assets([self.assets_dir])
+      auth_assets = auth.find_assets([self.assets_dir])
+      self.assertEqual(
+          ["FirebaseAnalytics.unitypackage", "FirebaseApp.unitypackage",
+           "FirebaseAuth.unitypackage"], searched_packages)
+      # Returned lists should be copies of the cached lists.
+      analytics_assets.append(None)
+      self.assertEqual(analytics_assets[:-1],
+                       analytics.find_assets([self.assets_dir]))
+      self.assertEqual(auth_assets, auth.find_assets([self.assets_dir]))
+      self.assertEqual(3, len(searched_packages))
+
+      # Assets are searched again for a different set of sections.
+      project.selected_sections = set(["experimental"])
+      analytics.find_assets([self.assets_dir])
+      self.assertEqual(5, len(searched_packages))
+    finally:
+      export_unity_package.AssetConfiguration.find_assets = find_assets
+
+  def test_project_write_with_build_cache(self):
+    """Export a project reusing packages from the build cache."""
+    assets_dir = os.path.join(self.staging_dir, "assets")
+    shutil.copytree(self.assets_dir, assets_dir)
+    cache_dir = FLAGS.cache_dir
+    write_archive = export_unity_package.PackageConfiguration.write_archive
+    written_archives = []
+
+    def fake_write_archive(archive_filename, entries, timestamp):
+      """Record and write each archive."""
+      written_archives.append(os.path.basename(archive_filename))
+      write_archive(archive_filename, entries, timestamp)
+
+    try:
+      FLAGS.cache_dir = os.path.join(self.staging_dir, "cache")
+      export_unity_package.PackageConfiguration.write_archive = staticmethod(
+          fake_write_archive)
+      project, guids_json = self._create_multi_build_project()
+      self.assertEqual(FLAGS.cache_dir, project.build_cache.cache_dir)
+
+      def write_project(output_dir, timestamp=0):
+        """Export the project and return the sorted output filenames."""
+        os.makedirs(output_dir)
+        del written_archives[:]
+        return sorted(project.write(
+            export_unity_package.GuidDatabase(
+                export_unity_package.DuplicateGuidsChecker(), guids_json,
+                "1.0.0"), [assets_dir], output_dir, timestamp))
+
+      # Experimental packages have the same content as the public packages so
+      # they're copied from the public packages.
+      built_filenames = write_project(os.path.join(self.staging_dir, "out1"))
+      self.assertCountEqual(["FirebaseAnalytics.unitypackage",
+                             "FirebaseApp.unitypackage",
+                             "FirebaseAuth.unitypackage"], written_archives)
+      self.assertEqual(6, len(built_filenames))
+
+      # Nothing changed so all packages should be copied from the cache.
+      cached_filenames = write_project(os.path.join(self.staging_dir, "out2"))
+      self.assertEqual([], written_archives)
+      for built_filename, cached_filename in zip(built_filenames,
+                                                 cached_filenames):
+        self.assertTrue(filecmp.cmp(built_filename, cached_filename,
+                                    shallow=False))
+
+      # Only packages that contain the modified asset should be rebuilt.
+      with open(os.path.join(assets_dir, "Firebase", "Plugins",
+                             "Firebase.Auth.dll"), "ab") as asset_file:
+        asset_file.write(b"modified")
+      write_project(os.path.join(self.staging_dir, "out3"))
+      self.assertEqual(["FirebaseAuth.unitypackage"], written_archives)
+
+      # Packages that use the time of each file are never cached.
+      write_project(os.path.join(self.staging_dir, "out4"), timestamp=-1)
+      self.assertEqual(3, len(written_archives))
+    finally:
+      FLAGS.cache_dir = cache_dir
+      export_unity_package.PackageConfiguration.write_archive = staticmethod(
+          write_archive)
+
+  def test_build_cache_hash_file(self):
+    """Store file hashes in the build cache."""
+    cache_dir = os.path.join(self.staging_dir, "cache")
+    filename = os.path.join(self.staging_dir, "file.txt")
+    with open(filename, "wt") as output_file:
+      output_file.write("hello")
+    expected_hash = (
+        "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824")
+
+    build_cache = export_unity_package.BuildCache(cache_dir)
+    # Recently modified files are hashed but not stored.
+    self.assertEqual(expected_hash, build_cache.hash_file(filename))
+    build_cache.save()
+    self.assertFalse(os.path.exists(cache_dir))
+
+    os.utime(filename, (0, 0))
+    self.assertEqual(expected_hash, build_cache.hash_file(filename))
+    build_cache.save()
+    build_cache = export_unity_package.BuildCache(cache_dir)
+    with open(filename, "wt") as output_file:
+      output_file.write("world")
+    os.utime(filename, (0, 0))
+    # The stored hash is used while the size, modification time and inode of
+    # the file are unchanged.
+    self.assertEqual(expected_hash, build_cache.hash_file(filename))
+    os.utime(filename, (1, 1))
+    self.assertEqual(
+        "486ea46224d1bb4fb680f34f7c9ad96a8f24ec88be73ea8e5a6c65260e9cb8a7",
+        build_cache.hash_file(filename))
+
   def test_package_write_upm(self):
     """Write a .tgz file."""
     # This is a slightly complicated case
@@ -3296,6 +4744,221 @@ class TestVersionHandler(absltest.TestCase):
               None)]))
 
 
+class PathMatcherTest(absltest.TestCase):
+  """Test matching paths against sets of regular expressions."""
+
+  def test_literal_prefix(self):
+    """Get the prefix matched by literal expressions."""
+    literal_prefix = export_unity_package.PathMatcher.literal_prefix
+    self.assertEqual("a/b/c", literal_prefix("a/b/c"))
+    self.assertEqual("Firebase/", literal_prefix("Firebase/.*"))
+    self.assertEqual("Firebase.App.dll", literal_prefix(r"Firebase\.App\.dll"))
+    self.assertEqual("", literal_prefix(".*"))
+    self.assertIsNone(literal_prefix(r".*\.dll$"))
+    self.assertIsNone(literal_prefix("a/b/c$"))
+    self.assertIsNone(literal_prefix("a.b"))
+    self.assertIsNone(literal_prefix(r"a\.*"))
+    self.assertIsNone(literal_prefix(r"a\d"))
+
+  def test_match(self):
+    """Match paths like a list of compiled expressions."""
+    patterns = ["Firebase/Editor/", r"Firebase/Plugins/Firebase\.App\.dll",
+                r".*\.Auth\.dll$", "(Linux|Windows)/", r"(x)\1/",
+                "(?i)readme"]
+    paths = ["Firebase/Editor/Foo.dll", "Firebase/EditorFoo.dll",
+             "Firebase/Plugins/Firebase.App.dll",
+             "Firebase/Plugins/Firebase.App.dll.mdb",
+             "Firebase/Plugins/Firebase.Auth.dll",
+             "Firebase/Plugins/Firebase.Auth.dll.mdb", "Linux/libFoo.so",
+             "OSX/libFoo.bundle", "xx/foo", "x/foo", "README.md", "Foo.dll"]
+    matcher = export_unity_package.PathMatcher(patterns)
+    expressions = [re.compile(pattern) for pattern in patterns]
+    self.assertTrue(matcher)
+    for path in paths:
+      self.assertEqual(
+          any(expression.match(path) for expression in expressions),
+          matcher.match(path), msg=path)
+
+  def test_is_combinable(self):
+    """Determine which expressions can be combined."""
+    is_combinable = export_unity_package.PathMatcher.is_combinable
+    self.assertTrue(is_combinable(r".*\.dll$"))
+    self.assertTrue(is_combinable("(?:Linux|Windows)/"))
+    self.assertTrue(is_combinable(r"a(?=b)(?!c)(?<=a)(?<!d)"))
+    self.assertTrue(is_combinable(r"a\(b\)"))
+    self.assertFalse(is_combinable("(Linux|Windows)/"))
+    self.assertFalse(is_combinable("(?P<os>Linux)/"))
+    self.assertFalse(is_combinable("(?i)readme"))
+    self.assertFalse(is_combinable("(?(1)b|c)"))
+    self.assertFalse(is_combinable(r"a\\(b)"))
+
+  def test_match_conditional(self):
+    """Match expressions that reference groups in conditionals."""
+    matcher = export_unity_package.PathMatcher(
+        ["zz(q)", "(a)?(?(1)b|c)x", "(?P<x>y)?(?(x)y|z)"])
+    self.assertTrue(matcher.match("abx"))
+    self.assertTrue(matcher.match("cx"))
+    self.assertTrue(matcher.match("yy"))
+    self.assertTrue(matcher.match("z"))
+    self.assertFalse(matcher.match("ax"))
+
+  def test_match_inline_flags(self):
+    """Inline flags only apply to the expression that contains them."""
+    matcher = export_unity_package.PathMatcher(
+        [r"Foo/.*\.txt", r".*\.dll$", "(?i)docs/.*"])
+    self.assertTrue(matcher.match("Foo/a.txt"))
+    self.assertTrue(matcher.match("DOCS/a.md"))
+    self.assertFalse(matcher.match("FOO/a.txt"))
+    self.assertFalse(matcher.match("a.DLL"))
+
+  def test_empty(self):
+    """Match paths without any expressions."""
+    matcher = export_unity_package.PathMatcher([])
+    self.assertFalse(matcher)
+    self.assertFalse(matcher.match("Foo.dll"))
+
+  def test_invalid_expression(self):
+    """Raise an exception for an invalid expression."""
+    with self.assertRaises(re.error):
+      export_unity_package.PathMatcher(["a/(b"])
+
+
+class FileIndexTest(absltest.TestCase):
+  """Test querying files with FileIndex."""
+
+  def setUp(self):
+    """Create a directory of files to query."""
+    super(FileIndexTest, self).setUp()
+    self.assets_dir = os.path.join(FLAGS.test_tmpdir, "assets")
+    shutil.copytree(os.path.join(TEST_DATA_PATH, "Assets"), self.assets_dir)
+    with open(os.path.join(self.assets_dir, "Firebase", ".hidden"),
+              "wt") as hidden_file:
+      hidden_file.write("hidden")
+    self.file_index = export_unity_package.FileIndex()
+
+  def tearDown(self):
+    """Clean up the temporary directory."""
+    super(FileIndexTest, self).tearDown()
+    delete_temporary_directory_contents()
+
+  def test_glob(self):
+    """Ensure matching patterns returns the same results as glob.glob()."""
+    for pattern in ("Firebase/Plugins/Firebase.App.dll",
+                    "Firebase/Plugins/*.dll",
+                    "Firebase/*",
+                    "Firebase/.*",
+                    "*/*/*.meta",
+                    "*/Editor/Google.[IJ]*_v?.2.87.0.dll",
+                    "PlayServicesResolver/",
+                    "PlayServicesResolver/Editor",
+                    "Missing/*.dll",
+                    "Firebase/Missing.dll"):
+      path = os.path.join(self.assets_dir, pattern)
+      self.assertCountEqual(glob.glob(path), self.file_index.glob(path),
+                            msg=pattern)
+
+  def test_walk_files(self):
+    """Ensure all files under a directory are found."""
+    expected_files = []
+    for current_dir, _, filenames in os.walk(self.assets_dir):
+      expected_files.extend([os.path.join(current_dir, filename)
+                             for filename in filenames])
+    self.assertCountEqual(expected_files,
+                          self.file_index.walk_files(self.assets_dir))
+
+  def test_stat(self):
+    """Query the status of files and directories."""
+    filename = os.path.join(self.assets_dir, "Firebase", "Plugins",
+                            "Firebase.App.dll")
+    self.assertTrue(self.file_index.exists(filename))
+    self.assertFalse(self.file_index.isdir(filename))
+    self.assertTrue(self.file_index.isdir(os.path.dirname(filename)))
+    self.assertTrue(self.file_index.isdir(os.path.sep))
+    self.assertEqual(os.stat(filename).st_size,
+                     self.file_index.stat(filename).st_size)
+    self.assertEqual(os.path.getctime(filename),
+                     self.file_index.getctime(filename))
+    self.assertFalse(self.file_index.exists(filename + ".meta"))
+    self.assertFalse(self.file_index.exists(os.path.join(filename, "a")))
+    self.assertIsNone(self.file_index.stat(filename + ".meta"))
+    with self.assertRaises(OSError):
+      self.file_index.getctime(filename + ".meta")
+
+  def test_clear(self):
+    """Ensure directory listings are cached until the index is cleared."""
+    filename = os.path.join(self.assets_dir, "Firebase", "new.txt")
+    self.assertFalse(self.file_index.exists(filename))
+    with open(filename, "wt") as new_file:
+      new_file.write("new")
+    self.assertFalse(self.file_index.exists(filename))
+    self.file_index.clear()
+    self.assertTrue(self.file_index.exists(filename))
+
+
+class ParallelGzipWriterTest(absltest.TestCase):
+  """Test compressing data with ParallelGzipWriter."""
+
+  def setUp(self):
+    """Generate data to compress."""
+    super(ParallelGzipWriterTest, self).setUp()
+    self.data = b"".join([b"%d:%s\n" % (i, b"x" * (i % 97))
+                          for i in range(20000)])
+
+  def compress(self, chunk_size=4096, **kwargs):
+    """Compress self.data with a ParallelGzipWriter.
+
+    Args:
+      chunk_size: Size of each chunk of data written to the writer.
+      **kwargs: Arguments for the writer.
+
+    Returns:
+      Compressed data.
+    """
+    output = io.BytesIO()
+    with export_unity_package.ParallelGzipWriter(output, **kwargs) as writer:
+      for i in range(0, len(self.data), chunk_size):
+        writer.write(self.data[i:i + chunk_size])
+    return output.getvalue()
+
+  def test_compress(self):
+    """Compress data using multiple blocks and threads."""
+    compressed = self.compress(threads=4, block_size=32 * 1024, mtime=0)
+    self.assertEqual(self.data, gzip.decompress(compressed))
+    self.assertLess(len(compressed), len(self.data))
+
+  def test_compress_empty(self):
+    """Compress an empty stream."""
+    output = io.BytesIO()
+    export_unity_package.ParallelGzipWriter(output, mtime=0).close()
+    self.assertEqual(b"", gzip.decompress(output.getvalue()))
+
+  def test_compress_is_deterministic(self):
+    """Ensure the output does not depend upon threads or write sizes."""
+    expected = self.compress(threads=1, mtime=42, filename="archive.tar.gz")
+    self.assertEqual(expected,
+                     self.compress(chunk_size=1000, threads=8, mtime=42,
+                                   filename="archive.tar.gz"))
+
+  def test_header(self):
+    """Verify the filename and mtime are stored in the header."""
+    output = io.BytesIO()
+    with export_unity_package.ParallelGzipWriter(
+        output, filename="/a/b/archive.tar.gz", mtime=42) as writer:
+      writer.write(b"hello")
+    output.seek(0)
+    with gzip.GzipFile(fileobj=output) as gzip_file:
+      self.assertEqual(b"hello", gzip_file.read())
+      self.assertEqual(42, gzip_file.mtime)
+    self.assertIn(b"archive.tar\x00", output.getvalue()[:32])
+
+  def test_write_after_close(self):
+    """Ensure writing to a closed stream fails."""
+    writer = export_unity_package.ParallelGzipWriter(io.BytesIO(), mtime=0)
+    writer.close()
+    with self.assertRaises(ValueError):
+      writer.write(b"hello")
+
+
 class FileOperationsTest(absltest.TestCase):
   """Test file utility methods."""
 
@@ -3346,6 +5009,98 @@ class FileOperationsTest(absltest.TestCase):
     self.assertEqual(self.expected_mode,
                      os.stat(target_path).st_mode & stat.S_IRWXU)
 
+  def test_file_copier_strategies(self):
+    """Copy a file using each copy strategy."""
+    source_path = os.path.join(self.temp_dir, "source.bin")
+    with open(source_path, "wb") as source_file:
+      source_file.write(os.urandom(256 * 1024))
+    copier = export_unity_package.FileCopier()
+    for strategy in export_unity_package.FileCopier.COPY_STRATEGIES:
+      target_path = os.path.join(self.temp_dir, strategy + ".bin")
+      used_strategy = copier.copy_file(source_path, target_path,
+                                       strategy=strategy)
+      # Strategies that aren't supported fall back to other strategies.
+      self.assertIn(used_strategy,
+                    export_unity_package.FileCopier.COPY_STRATEGIES)
+      self.assertTrue(filecmp.cmp(source_path, target_path, shallow=False))
+    self.assertEqual(
+        len(export_unity_package.FileCopier.COPY_STRATEGIES),
+        sum(copier.copies_by_strategy.values()))
+
+  def test_file_copier_fallback(self):
+    """Fall back to the next strategy when a strategy fails."""
+    source_path = os.path.join(self.temp_dir, "source.txt")
+    with open(source_path, "wt") as source_file:
+      source_file.write("hello")
+    reflink = export_unity_package.FileCopier._reflink
+    copier = export_unity_package.FileCopier()
+
+    reflink_errors = []
+
+    def fake_reflink(unused_source_file, unused_target_file):
+      """Fail to clone a file."""
+      error_number = reflink_errors.pop(0)
+      raise OSError(error_number, os.strerror(error_number))
+
+    try:
+      export_unity_package.FileCopier._reflink = staticmethod(fake_reflink)
+      # Errors that don't indicate a lack of support only fall back for the
+      # file being copied.
+      reflink_errors.extend([errno.EXDEV, errno.ENOSPC])
+      for index in range(2):
+        target_path = os.path.join(self.temp_dir, "other%d.txt" % index)
+        self.assertNotEqual("reflink", copier.copy_file(
+            source_path, target_path, strategy="auto"))
+        self.assertIn("reflink", copier.get_strategies("auto"))
+      self.assertEqual([], reflink_errors)
+
+      reflink_errors.append(errno.EOPNOTSUPP)
+      for index in range(2):
+        target_path = os.path.join(self.temp_dir, "target%d.txt" % index)
+        self.assertNotEqual("reflink", copier.copy_file(
+            source_path, target_path, strategy="auto"))
+        with open(target_path, "rt") as target_file:
+          self.assertEqual("hello", target_file.read())
+      self.assertNotIn("reflink", copier.get_strategies("auto"))
+      self.assertNotIn("reflink", copier.copies_by_strategy)
+    finally:
+      export_unity_package.FileCopier._reflink = staticmethod(reflink)
+
+  def test_copy_and_set_rwx_hardlink(self):
+    """Link files staged for archives and set their mode in the archive."""
+    source_path = os.path.join(self.temp_dir, "source.txt")
+    with open(source_path, "wt") as source_file:
+      source_file.write("hello")
+    os.chmod(source_path, 0o600)
+    copy_strategy = FLAGS.copy_strategy
+    try:
+      FLAGS.copy_strategy = "hardlink"
+      staging_dir = os.path.join(self.temp_dir, "staging")
+      staged_path = os.path.join(staging_dir, "a", "asset")
+      export_unity_package.copy_and_set_rwx(source_path, staged_path,
+                                            for_archive=True)
+      self.assertTrue(os.path.samefile(source_path, staged_path))
+      self.assertEqual(0o600, stat.S_IMODE(os.stat(source_path).st_mode))
+
+      # Files that aren't archived are copied.
+      copied_path = os.path.join(self.temp_dir, "copy.txt")
+      export_unity_package.copy_and_set_rwx(source_path, copied_path)
+      self.assertFalse(os.path.samefile(source_path, copied_path))
+      self.assertEqual(self.expected_mode,
+                       os.stat(copied_path).st_mode & stat.S_IRWXU)
+
+      archive_filename = os.path.join(self.temp_dir, "archive.unitypackage")
+      export_unity_package.PackageConfiguration.create_archive(
+          archive_filename, staging_dir, 0)
+      with tarfile.open(archive_filename, "r:gz") as archive_file:
+        self.assertEqual(
+            export_unity_package.ARCHIVE_ASSET_FILE_MODE,
+            archive_file.getmember("a/asset").mode)
+        self.assertEqual(b"hello",
+                         archive_file.extractfile("a/asset").read())
+    finally:
+      FLAGS.copy_strategy = copy_strategy
+
   def test_copy_files_to_dir(self):
     """Test copying files into a directory using a variety of target paths."""
     original_copy_and_set_rwx = export_unity_package.copy_and_set_rwx
@@ -3411,6 +5166,79 @@ class FileOperationsTest(absltest.TestCase):
             "a/nonexisting/file", [self.assets_dir]),
         None)
 
+
+class TracerTest(absltest.TestCase):
+  """Test recording the phases of an export."""
+
+  def test_disabled(self):
+    """Ensure a disabled tracer records nothing."""
+    tracer = export_unity_package.Tracer()
+    with tracer.span("phase", package="foo") as span:
+      span.add_bytes(10)
+    self.assertIs(export_unity_package.Tracer.NULL_SPAN, span)
+    self.assertEqual({}, tracer.summary())
+
+  def test_summary(self):
+    """Summarize spans by phase."""
+    tracer = export_unity_package.Tracer()
+    tracer.enable()
+    with tracer.span("export"):
+      for size in (10, 20):
+        with tracer.span("archive", package="foo") as span:
+          span.add_bytes(size)
+    tracer.add_events(
+        [("archive", time.perf_counter(), time.perf_counter() + 0.5, 1, 2,
+          {"bytes": 5})])
+    tracer.disable()
+    with tracer.span("ignored"):
+      pass
+
+    summary = tracer.summary()
+    self.assertEqual(["export", "archive"], list(summary))
+    self.assertEqual((3, 35, 0), summary["archive"][1:])
+    self.assertGreaterEqual(summary["archive"][0], 0.5)
+    self.assertEqual((1, 0, 0), summary["export"][1:])
+    self.assertIn("archive", tracer.format_summary())
+    self.assertEqual(4, len(tracer.take_events()))
+    self.assertEqual({}, tracer.summary())
+
+  def test_trace_memory(self):
+    """Record the peak memory allocated by nested spans."""
+    was_tracing = tracemalloc.is_tracing()
+    tracer = export_unity_package.Tracer()
+    tracer.enable(trace_memory=True)
+    try:
+      with tracer.span("outer"):
+        with tracer.span("inner"):
+          data = bytearray(4 * 1024 * 1024)
+          del data
+        with tracer.span("small"):
+          data = bytearray(1024)
+          del data
+    finally:
+      tracer.disable()
+    self.assertEqual(was_tracing, tracemalloc.is_tracing())
+
+    summary = tracer.summary()
+    if hasattr(tracemalloc, "reset_peak"):
+      self.assertGreaterEqual(summary["inner"][3], 4 * 1024 * 1024)
+      self.assertLess(summary["small"][3], 4 * 1024 * 1024)
+      self.assertGreaterEqual(summary["outer"][3], summary["inner"][3])
+    else:
+      # Peaks can't be measured without resetting the traced peak.
+      self.assertEqual([0, 0, 0],
+                       [summary[name][3]
+                        for name in ("outer", "inner", "small")])
+    self.assertIn("peak_mb", tracer.format_summary())
+
+    trace_filename = os.path.join(FLAGS.test_tmpdir, "trace.json")
+    tracer.write_chrome_trace(trace_filename)
+    with open(trace_filename, "rt", encoding="utf-8") as trace_file:
+      trace = json.load(trace_file)
+    self.assertEqual(3, len([event for event in trace["traceEvents"]
+                             if event["ph"] == "C"]))
+
+
 class ReadJsonFileTest(absltest.TestCase):
   """Test reading a JSON file."""
 
@@ -3468,5 +5296,97 @@ class ReadJsonFileTest(absltest.TestCase):
                           [r".*test\.json"])
 
 
+class MainTest(absltest.TestCase):
+  """Test exporting packages from the command line."""
+
+  def setUp(self):
+    """Create a project configuration and GUIDs file."""
+    super(MainTest, self).setUp()
+    self.temp_dir = os.path.join(FLAGS.test_tmpdir, "main_temp")
+    os.makedirs(self.temp_dir)
+    self.config_file = os.path.join(self.temp_dir, "config.json")
+    with open(self.config_file, "wt") as config_file:
+      json.dump({
+          "packages": [{
+              "name": "FirebaseApp.unitypackage",
+              "common_manifest": {
+                  "name": "com.google.firebase.app"
+              },
+              "imports": [{
+                  "paths": ["Firebase/Plugins/Firebase.App.dll"]
+              }]
+          }]
+      }, config_file)
+    self.guids_file = os.path.join(self.temp_dir, "guids.json")
+    with open(self.guids_file, "wt") as guids_file:
+      json.dump({
+          "1.0.0": {
+              "Firebase/Plugins/Firebase.App.dll":
+                  "7311924048bd457bac6d713576c952da"
+          }
+      }, guids_file)
+    self.output_dir = os.path.join(self.temp_dir, "output")
+
+  def tearDown(self):
+    """Clean up the temporary directory."""
+    super(MainTest, self).tearDown()
+    shutil.rmtree(self.temp_dir)
+
+  def run_main(self, **flag_values):
+    """Export the project with flags overridden.
+
+    Args:
+      **flag_values: Values of flags to override.
+
+    Returns:
+      Exit code returned by main().
+    """
+    flag_values.update([("config_file", self.config_file),
+                        ("guids_file", self.guids_file),
+                        ("plugins_version", "1.0.0"),
+                        ("assets_dir", [os.path.join(TEST_DATA_PATH,
+                                                     "Assets")]),
+                        ("output_dir", self.output_dir)])
+    original_values = dict([(name, FLAGS[name].value)
+                            for name in flag_values])
+    try:
+      for name, value in flag_values.items():
+        FLAGS[name].value = value
+      return export_unity_package.main([])
+    finally:
+      for name, value in original_values.items():
+        FLAGS[name].value = value
+
+  def test_plan_output(self):
+    """Write the contents of packages without exporting them."""
+    plan_filename = os.path.join(self.temp_dir, "plan.json")
+    self.assertEqual(0, self.run_main(plan=True, plan_output=plan_filename))
+    self.assertFalse(os.path.exists(self.output_dir))
+    with open(plan_filename, "rt", encoding="utf-8") as plan_file:
+      plan = json.load(plan_file)
+    self.assertEqual(["FirebaseApp.unitypackage"], list(plan))
+    self.assertEqual(
+        [("Firebase/Plugins/Firebase.App.dll",
+          "7311924048bd457bac6d713576c952da")],
+        [(asset["path"], asset["guid"])
+         for asset in plan["FirebaseApp.unitypackage"]["assets"]])
+
+  def test_plan_missing_guids(self):
+    """Fail to plan packages with missing GUIDs."""
+    with open(self.guids_file, "wt") as guids_file:
+      json.dump({"1.0.0": {}}, guids_file)
+    plan_filename = os.path.join(self.temp_dir, "plan.json")
+    self.assertEqual(1, self.run_main(plan=True, plan_output=plan_filename))
+    self.assertFalse(os.path.exists(plan_filename))
+    self.assertFalse(os.path.exists(self.output_dir))
+
+  def test_unwritable_trace_file(self):
+    """Export packages when the trace file can't be written."""
+    self.assertEqual(0, self.run_main(
+        trace_file=os.path.join(self.temp_dir, "missing", "trace.json")))
+    self.assertTrue(os.path.exists(
+        os.path.join(self.output_dir, "FirebaseApp.unitypackage")))
+    self.assertFalse(export_unity_package.TRACER.enabled)
+
 if __name__ == "__main__":
   absltest.main()